@@ -1,6 +1,6 @@
-import json
 from typing import Any, Dict, List, Tuple
 
+from . import json_codec
 from .openai_client import chat_once
 
 SUPERVISOR_SYSTEM = (
@@ -58,9 +58,9 @@ async def review_user_query(text: str, threshold: int = 8) -> Dict[str, Any]:
         }
 
     user_prompt = SUPERVISOR_USER_TEMPLATE.format(query=text)
-    raw = await chat_once(SUPERVISOR_SYSTEM, user_prompt, max_tokens=180, temperature=0.3)
+    raw = await chat_once(SUPERVISOR_SYSTEM, user_prompt, max_tokens=180, temperature=0.3, cache="supervisor")
     try:
-        data = json.loads(raw)
+        data = json_codec.loads(raw)
     except Exception:
         return {
             "score": 0,
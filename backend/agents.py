@@ -1,24 +1,170 @@
-import json
 import os
 import random
 import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
-from zoneinfo import ZoneInfo
 
-from .chat_history import ChatHistoryStore
-from .app.profile_store import load_profile, save_profile
-from .schedule_store import load_schedule
-from .openai_client import chat_once
+from . import json_codec
+from .chat_history import _epoch, chat_store
+from .data_paths import user_path
+from .file_lock import atomic_write_json
+from .app.profile_store import PROFILE_CACHE_USERS, aload_profile, save_profile
+from .schedule_engine import schedule_engine
+from .diet_store import diet_store
+from .glucose_store import glucose_store
+from .io_executor import run_io
+from .llm_scheduler import llm_priority
+from .state_stream import state_stream_manager
+from .user_data import MODULES, USER_DATA_CACHE_USERS, user_data
+from .openai_client import chat_once, chat_stream
 from .coze_client import coze_stream
 
 # 新版主动触发 Agent 位于 trigger_agent.py，保留此处其他 Agent。
 
-chat_store = ChatHistoryStore()
 DEBUG_MODE = os.getenv("PROACTIVE_DEBUG", "true").lower() == "true"
 FORCE_EVENT = os.getenv("PROACTIVE_FORCE_EVENT")  # e.g., "post_meal_reminder" for testing
 LENIENT_MODE = os.getenv("PROACTIVE_LENIENT", "false").lower() == "true"
+# Provider for streamed replies: "coze" (default) or "openai".
+REPLY_BACKEND = os.getenv("REPLY_BACKEND", "coze").lower()
+# Profile sync only sends records newer than the per-user watermark (plus module summaries).
+PROFILE_SYNC_INCREMENTAL = os.getenv("PROFILE_SYNC_INCREMENTAL", "true").lower() == "true"
+PROFILE_SYNC_MAX_RECORDS = int(os.getenv("PROFILE_SYNC_MAX_RECORDS", "200"))
+# Every Nth run is a full resync so facts the incremental merges kept stale get rewritten (0 = never).
+PROFILE_SYNC_FULL_EVERY = int(os.getenv("PROFILE_SYNC_FULL_EVERY", "20"))
+SYNC_STATE_DIR = Path(__file__).resolve().parent / "data" / "state" / "profile_sync"
+# Readings outside this range (mmol/L) are not glucose values ("血糖高了3天").
+GLUCOSE_MIN_MMOL = 1.0
+GLUCOSE_MAX_MMOL = 33.3
+
+
+# Top-level keys every module keeps (the views and the full-sync prompt rely on them).
+MODULE_REQUIRED_KEYS: Dict[str, Tuple[str, ...]] = {
+    "profile_static": ("summary",),
+    "smalltalk": ("summary", "topics"),
+    "health_record": ("summary", "conditions", "medications", "labs"),
+    "diet_2w": ("weeks",),
+    "recent_events": ("summary_keywords", "items"),
+    "habits": ("summary", "routines", "rules"),
+}
+FIELD_VALUE_KEYS = frozenset({"value", "layer", "confidence", "source", "updated_at", "revoked"})
+
+
+def _is_field_value(obj: Any) -> bool:
+    """A profile FieldValue wrapper ({value, layer, confidence, ...}); treated as a leaf."""
+    return isinstance(obj, dict) and "value" in obj and set(obj) <= FIELD_VALUE_KEYS | {"__replace__"}
+
+
+def _strip_markers(obj: Any) -> Any:
+    """Drop ``__replace__`` keys and ``__delete__`` list items (nulls are kept)."""
+    if isinstance(obj, dict):
+        return {k: _strip_markers(v) for k, v in obj.items() if k != "__replace__"}
+    if isinstance(obj, list):
+        return [_strip_markers(item) for item in obj if not (isinstance(item, dict) and "__delete__" in item)]
+    return obj
+
+
+def _check_markers(base: Any, patch: Any, path: str, required: Tuple[str, ...] = ()) -> Tuple[Any, List[str]]:
+    """Remove retraction markers that do not fit the stored shape.
+
+    Returns the cleaned patch and the paths of the markers dropped: markers
+    inside a FieldValue (retract the whole field instead), ``null`` on a
+    required module key, ``__replace__`` of a whole module or of a stored
+    non-object, and ``__delete__`` items aimed at a stored non-list (the
+    whole key is then left out) or carrying extra keys.
+    """
+    rejected: List[str] = []
+    if isinstance(patch, dict):
+        if _is_field_value(base) or _is_field_value(patch):
+            cleaned = {k: v for k, v in patch.items() if k != "__replace__" and v is not None}
+            if len(cleaned) != len(patch) or _strip_markers(cleaned) != cleaned:
+                rejected.append(path)
+            return _strip_markers(cleaned), rejected
+        out: Dict[str, Any] = {}
+        for key, value in patch.items():
+            sub = f"{path}.{key}"
+            if key == "__replace__":
+                if required or (base is not None and not isinstance(base, dict)):
+                    rejected.append(sub)
+                    continue
+                out[key] = value
+            elif value is None:
+                if key in required or not isinstance(base, dict) or key not in base:
+                    rejected.append(sub)
+                    continue
+                out[key] = None
+            else:
+                stored = base.get(key) if isinstance(base, dict) else None
+                cleaned, bad = _check_markers(stored, value, sub)
+                rejected.extend(bad)
+                if bad and isinstance(value, list) and stored is not None and not isinstance(stored, list):
+                    continue  # e.g. __delete__ on a FieldValue: leave the stored field alone
+                out[key] = cleaned
+        return out, rejected
+    if isinstance(patch, list):
+        out_items: List[Any] = []
+        for i, item in enumerate(patch):
+            if isinstance(item, dict) and "__delete__" in item:
+                if not isinstance(base, list) or len(item) != 1:
+                    rejected.append(f"{path}[{i}]")
+                    continue
+                out_items.append(item)
+            else:
+                out_items.append(_strip_markers(item))
+        return out_items, rejected
+    return patch, rejected
+
+
+def _matches(item: Any, pattern: Any) -> bool:
+    """``pattern`` equals ``item``, or is a dict whose fields all equal ``item``'s."""
+    if isinstance(item, dict) and isinstance(pattern, dict):
+        return all(key in item and item[key] == value for key, value in pattern.items())
+    return item == pattern
+
+
+def _merge_json(base: Any, patch: Any) -> Any:
+    """Merge an incremental module update into the stored module.
+
+    Dicts merge key by key, lists get the new items first followed by the
+    old ones not repeated, anything else is replaced. ``base`` is not mutated.
+    The patch can also retract stored facts:
+
+    - a ``null`` value removes the key;
+    - a dict with ``"__replace__": true`` replaces the stored value wholesale;
+    - a list item ``{"__delete__": pattern}`` drops the stored items that
+      equal ``pattern`` (or, for dicts, match all of its fields).
+
+    FieldValue wrappers merge field by field but their ``value`` is always
+    replaced. Run the patch through ``_check_markers`` first.
+    """
+    if isinstance(patch, dict) and patch.get("__replace__") is True:
+        return _merge_json(None, {k: v for k, v in patch.items() if k != "__replace__"})
+    if isinstance(patch, dict) and (_is_field_value(base) or _is_field_value(patch)):
+        merged = dict(base) if isinstance(base, dict) else {}
+        merged.update(_strip_markers(patch))
+        return merged
+    if isinstance(patch, dict):
+        merged = dict(base) if isinstance(base, dict) else {}
+        for key, value in patch.items():
+            if value is None:
+                merged.pop(key, None)
+            else:
+                merged[key] = _merge_json(merged.get(key), value)
+        return merged
+    if isinstance(patch, list):
+        deletes = [item["__delete__"] for item in patch if isinstance(item, dict) and "__delete__" in item]
+        added = [_merge_json(None, item) for item in patch if not (isinstance(item, dict) and "__delete__" in item)]
+        seen = {json_codec.dumps(item) for item in added}
+        kept = [
+            item
+            for item in (base if isinstance(base, list) else [])
+            if json_codec.dumps(item) not in seen and not any(_matches(item, d) for d in deletes)
+        ]
+        return added + kept
+    return patch
 
 
 class ProfileUpdateAgent:
@@ -40,11 +186,71 @@ class ProfileUpdateAgent:
         "4) 输出严谨 JSON，不要夹杂解释。"
     )
 
-    def _write_user_file(self, user_id: str, name: str, data: Dict[str, Any]) -> None:
-        base = Path(__file__).resolve().parent / "data" / "users" / user_id
-        base.mkdir(parents=True, exist_ok=True)
-        path = base / f"{name}.json"
-        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    incremental_prompt_template = (
+        "你是 SugarBuddy 的画像同步器（增量模式）。输入：上次同步之后的新对话 new_messages，"
+        "以及各模块当前的摘要 module_summaries。\n"
+        "请只根据新对话输出一个 JSON，键为需要更新的模块（profile_static/smalltalk/health_record/"
+        "diet_2w/recent_events/habits），只包含新增或变化的字段与列表条目，其余会保持原样：\n"
+        "1) 没有新信息的模块不要输出；\n"
+        "2) 模块 summary 有变化时给出新的一句总结；\n"
+        "3) diet_2w 只输出涉及的日期（weeks[].days[]，每天含 date 和 breakfast/lunch/dinner/notes）；\n"
+        "4) 新对话推翻或更正了旧信息时：字段值写 null 表示删除该字段；"
+        "对象中加 \"__replace__\": true 表示整体替换该对象；"
+        "列表中加一项 {\"__delete__\": 要删除的条目或其部分字段} 表示删除匹配的旧条目"
+        "（如停药：medications: [{\"__delete__\": {\"name\": \"二甲双胍\"}}]）；\n"
+        "5) 输出严谨 JSON，不要夹杂解释。"
+    )
+
+    def _watermark_path(self, user_id: str) -> Path:
+        return user_path(SYNC_STATE_DIR, user_id, ".json")
+
+    def _load_watermark(self, user_id: str) -> Tuple[Optional[str], int]:
+        """``ts`` of the last chat record already folded into the modules, and
+        how many incremental runs happened since the last full one."""
+        try:
+            state = json_codec.loads(self._watermark_path(user_id).read_text(encoding="utf-8"))
+            return state.get("ts"), int(state.get("incremental_runs") or 0)
+        except Exception:
+            return None, 0
+
+    def _save_watermark(self, user_id: str, ts: str, incremental_runs: int) -> None:
+        atomic_write_json(
+            self._watermark_path(user_id),
+            {"ts": ts, "incremental_runs": incremental_runs, "synced_at": datetime.now(timezone.utc).isoformat()},
+        )
+
+    def _module_summaries(self, user_id: str) -> Dict[str, Any]:
+        summaries: Dict[str, Any] = {}
+        for name in MODULES:
+            data = user_data.load(user_id, name)
+            summary = data.get("summary") or data.get("summary_keywords")
+            if summary:
+                summaries[name] = summary
+        return summaries
+
+    def _merge_modules(self, user_id: str, updated: Dict[str, Any]) -> Dict[str, Any]:
+        """Fold an incremental result into the stored modules (blocking I/O)."""
+        merged = dict(updated)
+        for name in MODULES:
+            # diet_2w is merged day by day by diet_store (see _write_user_file).
+            if name == "diet_2w" or not isinstance(updated.get(name), dict):
+                continue
+            stored = user_data.load(user_id, name)
+            patch, rejected = _check_markers(stored, updated[name], name, MODULE_REQUIRED_KEYS.get(name, ()))
+            if rejected:
+                print(f"[ProfileUpdate] dropped invalid retraction markers user={user_id}: {rejected}")
+            merged[name] = _merge_json(stored, patch)
+        return merged
+
+    def _write_user_file(self, user_id: str, name: str, data: Dict[str, Any], incremental: bool = False) -> bool:
+        """Write a module file; returns False when the content did not change."""
+        if name == "diet_2w":
+            # diet_2w.json is rendered from the date-indexed diet log. An
+            # incremental sync only lists the days it changed.
+            if incremental:
+                return diet_store.merge_from_doc(user_id, data)
+            return diet_store.replace_from_doc(user_id, data)
+        return user_data.write(user_id, name, data)
 
     def _trim_lists(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Limit list sizes to avoid front-end explosion."""
@@ -79,72 +285,70 @@ class ProfileUpdateAgent:
                 meals["dinner"] = seg
         return meals
 
-    def _fallback_update_diet(self, user_id: str, latest_user_text: str) -> None:
+    def _fallback_update_diet(self, user_id: str, latest_user_text: str) -> bool:
         meals = self._extract_meals_from_text(latest_user_text)
         if not meals:
-            return
-        base = Path(__file__).resolve().parent / "data" / "users" / user_id
-        base.mkdir(parents=True, exist_ok=True)
-        path = base / "diet_2w.json"
-        try:
-            diet = json.loads(path.read_text(encoding="utf-8"))
-        except Exception:
-            diet = {"schema_version": "1.0", "user_id": user_id, "summary": "", "weeks": []}
+            return False
         # 使用用户时区（schedule 文件）决定日期，默认 +8
         today = self._local_today(user_id)
-        week_start = (today - timedelta(days=today.weekday())).isoformat()
-        weeks = diet.get("weeks") or []
-        target_week = None
-        for w in weeks:
-            if w.get("week_start") == week_start:
-                target_week = w
-                break
-        if not target_week:
-            target_week = {"week_start": week_start, "days": []}
-            weeks.append(target_week)
-            diet["weeks"] = weeks
-        days = target_week.get("days") or []
-        target_day = None
-        for d in days:
-            if d.get("date") == today.isoformat():
-                target_day = d
-                break
-        if not target_day:
-            target_day = {"date": today.isoformat()}
-            days.append(target_day)
-            target_week["days"] = days
-        for meal_key, meal_val in meals.items():
-            target_day[meal_key] = meal_val
-        path.write_text(json.dumps(diet, ensure_ascii=False, indent=2), encoding="utf-8")
-
-    def _fallback_update_glucose(self, user_id: str, latest_user_text: str) -> None:
+        return diet_store.upsert_day(user_id, today.isoformat(), meals)
+
+    def _extract_glucose(self, text: str) -> Optional[float]:
+        """Heuristic: pull a glucose reading (mmol/L) out of free text.
+
+        Needs a unit (mmol/L, mg/dL) or a number right after 血糖 that is not
+        a duration/count, and the value must be in a plausible range.
+        """
+        if not text:
+            return None
+        val: Optional[float] = None
+        m = re.search(r"([0-9]+(?:\.[0-9]+)?)\s*(mmol/?L|mg/?dL)", text, re.IGNORECASE)
+        if m:
+            val = float(m.group(1))
+            if m.group(2).lower().startswith("mg"):
+                val = round(val / 18.0, 1)
+        else:
+            # also catch “血糖为10” / “空腹血糖：7.2” 模式，但不要 “血糖高了3天”
+            m = re.search(
+                r"血糖值?\s*(?:是|为|[:：])?\s*([0-9]+(?:\.[0-9]+)?)(?![0-9]|\.[0-9]|\s*(?:天|日|次|个|年|月|周|小时|分钟|点|岁|%))",
+                text,
+            )
+            if m:
+                val = float(m.group(1))
+        if val is None or not GLUCOSE_MIN_MMOL <= val <= GLUCOSE_MAX_MMOL:
+            return None
+        return val
+
+    def _ingest_glucose(self, user_id: str, record: Dict[str, Any]) -> bool:
+        """Append a reading from a user chat record to the glucose series (idempotent per message)."""
+        val = self._extract_glucose(record.get("content") or "")
+        if val is None:
+            return False
+        return glucose_store.append(user_id, _epoch(record.get("ts")) or time.time(), val)
+
+    def _fallback_update_glucose(self, user_id: str, latest_user_text: str) -> bool:
         """Heuristic: extract血糖值写入 health_record.labs 最近一条。"""
-        if not latest_user_text:
-            return
-        m = re.search(r"([0-9]+(?:\.[0-9]+)?)\s*mmol/?L", latest_user_text, re.IGNORECASE)
-        if not m:
-            # also catch “血糖为10” 模式
-            m = re.search(r"血糖[^0-9]*([0-9]+(?:\.[0-9]+)?)", latest_user_text)
-        if not m:
-            return
-        val = float(m.group(1))
-        base = Path(__file__).resolve().parent / "data" / "users" / user_id
-        base.mkdir(parents=True, exist_ok=True)
-        path = base / "health_record.json"
-        try:
-            hr = json.loads(path.read_text(encoding="utf-8"))
-        except Exception:
-            hr = {"schema_version": "1.0", "user_id": user_id}
-        labs = hr.get("labs") or []
+        val = self._extract_glucose(latest_user_text)
+        if val is None:
+            return False
         today = datetime.now(timezone.utc).date().isoformat()
+        return user_data.update(
+            user_id,
+            "health_record",
+            lambda hr: self._merge_glucose(hr, val, today),
+            default=lambda: {"schema_version": "1.0", "user_id": user_id},
+        )
+
+    def _merge_glucose(self, hr: Dict[str, Any], val: float, today: str) -> Optional[Dict[str, Any]]:
+        labs = hr.get("labs") or []
         # 避免同一天/同值重复写入
         for l in labs:
             if isinstance(l, dict) and str(l.get("name", "")).startswith("血糖") and l.get("date") == today:
                 try:
                     if float(l.get("value", -1)) == val:
-                        return
+                        return None
                 except Exception:
-                    return
+                    return None
         labs.insert(0, {
             "name": "血糖",
             "value": val,
@@ -155,16 +359,10 @@ class ProfileUpdateAgent:
         hr["labs"] = labs[:20]  # 保留最近 20 条
         if "summary" not in hr:
             hr["summary"] = f"最近血糖记录：{val} mmol/L ({today})"
-        path.write_text(json.dumps(hr, ensure_ascii=False, indent=2), encoding="utf-8")
+        return hr
 
     def _local_today(self, user_id: str):
-        try:
-            sched = load_schedule(user_id)
-            tz_name = sched.get("timezone")
-            tz = ZoneInfo(tz_name) if tz_name else ZoneInfo("Asia/Shanghai")
-        except Exception:
-            tz = timezone(timedelta(hours=8))
-        return datetime.now(tz).date()
+        return datetime.now(schedule_engine.tz(user_id)).date()
 
     def _has_today_meal(self, diet: Dict[str, Any], today_str: str) -> bool:
         weeks = diet.get("weeks") or []
@@ -182,84 +380,152 @@ class ProfileUpdateAgent:
                 return True
         return False
 
+    def _fallback_update(self, user_id: str, latest_user_text: str) -> List[str]:
+        changed: List[str] = []
+        if self._fallback_update_diet(user_id, latest_user_text):
+            changed.append("diet_2w")
+        if self._fallback_update_glucose(user_id, latest_user_text):
+            changed.append("health_record")
+        return changed
+
+    def _persist(
+        self, user_id: str, updated: Dict[str, Any], latest_user_text: str, today_str: str, incremental: bool = False
+    ) -> List[str]:
+        """Write LLM-produced modules and run heuristic fallbacks (blocking I/O).
+
+        Returns the modules whose files actually changed.
+        """
+        changed: List[str] = []
+        for name in MODULES:
+            if isinstance(updated.get(name), dict) and self._write_user_file(user_id, name, updated[name], incremental):
+                changed.append(name)
+        # profile_static -> also sync legacy profiles dir for backward compat
+        if "profile_static" in changed:
+            save_profile(user_id, updated["profile_static"])
+
+        # Fallback: if diet未更新或未包含今日数据且最近用户消息包含饮食描述，补写到 diet_2w
+        if latest_user_text:
+            diet_obj = updated.get("diet_2w") if isinstance(updated.get("diet_2w"), dict) else None
+            if (diet_obj is None) or (not self._has_today_meal(diet_obj, today_str)):
+                if self._fallback_update_diet(user_id, latest_user_text) and "diet_2w" not in changed:
+                    changed.append("diet_2w")
+        # Fallback: 如果 labs 未更新或未包含今日血糖且最近用户消息包含血糖值，补写到 health_record.labs
+        if latest_user_text:
+            hr_obj = updated.get("health_record") if isinstance(updated.get("health_record"), dict) else None
+            need_glucose = False
+            if hr_obj is None:
+                need_glucose = True
+            elif not self._has_today_glucose(hr_obj, today_str):
+                need_glucose = True
+            if need_glucose:
+                if self._fallback_update_glucose(user_id, latest_user_text) and "health_record" not in changed:
+                    changed.append("health_record")
+        return changed
+
+    async def _notify(self, user_id: str, changed: List[str]) -> None:
+        """Push only the modules that changed to SSE listeners."""
+        if not changed:
+            return
+        try:
+            # Rebuild the [USER_DATA] snippet now so the next chat request hits the memo.
+            await run_io(passive_context_agent.build, user_id)
+        except Exception as exc:
+            if DEBUG_MODE:
+                print(f"[ProfileUpdate] context warm-up failed: {exc}")
+        try:
+            await state_stream_manager.broadcast_user_data(user_id, changed)
+            if "profile_static" in changed:
+                await state_stream_manager.broadcast_profile(user_id)
+        except Exception as exc:
+            if DEBUG_MODE:
+                print(f"[ProfileUpdate] notify failed: {exc}")
+
     async def run(self, user_id: str) -> Optional[Dict[str, Any]]:
+        # Background work: yields upstream capacity to interactive replies.
+        with llm_priority("profile_sync"):
+            return await self._run(user_id)
+
+    async def _load_history(self, user_id: str, watermark: Optional[str]) -> List[Dict[str, Any]]:
+        """Records after ``watermark``, or the recent history for a full run."""
+        if watermark:
+            return await chat_store.aload_page(user_id, PROFILE_SYNC_MAX_RECORDS, after=watermark, visible_only=False)
+        return await chat_store.aload(user_id, limit=PROFILE_SYNC_MAX_RECORDS)
+
+    async def _build_prompt(self, user_id: str, history: List[Dict[str, Any]], incremental: bool) -> Tuple[str, str]:
+        """System prompt and JSON user prompt for an incremental or full run."""
+        if incremental:
+            payload = {"new_messages": history, "module_summaries": await run_io(self._module_summaries, user_id)}
+            return self.incremental_prompt_template, json_codec.dumps(payload)
+        payload = {"chat_history": history, "profile": await aload_profile(user_id)}
+        return self.prompt_template, json_codec.dumps(payload)
+
+    async def _run(self, user_id: str) -> Optional[Dict[str, Any]]:
         if not self.prompt_template:
             return None
 
-        history = chat_store.load(user_id)
-        profile = load_profile(user_id)
+        watermark, incremental_runs = await run_io(self._load_watermark, user_id) if PROFILE_SYNC_INCREMENTAL else (None, 0)
+        history = await self._load_history(user_id, watermark)
+        if watermark and not history:
+            return None
+        if watermark and 0 < PROFILE_SYNC_FULL_EVERY <= incremental_runs:
+            # Periodic full resync: rebuild every module from the recent history.
+            watermark = None
+            history = await self._load_history(user_id, None)
         latest_user = next((m for m in reversed(history) if m.get("role") == "user" and isinstance(m.get("content"), str)), None)
         latest_user_text = latest_user.get("content", "") if latest_user else ""
-        today_str = self._local_today(user_id).isoformat()
-        payload = {"chat_history": history, "profile": profile}
-        user_prompt = json.dumps(payload, ensure_ascii=False)
+        if latest_user_text:
+            try:
+                await run_io(self._ingest_glucose, user_id, latest_user)
+            except Exception as exc:
+                if DEBUG_MODE:
+                    print(f"[ProfileUpdate] glucose ingest failed: {exc}")
+        today_str = (await run_io(self._local_today, user_id)).isoformat()
+        system_prompt, user_prompt = await self._build_prompt(user_id, history, incremental=bool(watermark))
         try:
             text = await chat_once(
-                system_prompt=self.prompt_template,
+                system_prompt=system_prompt,
                 user_prompt=user_prompt,
                 max_tokens=800,
                 temperature=0.2,
+                cache="profile_update",
             )
         except Exception as exc:
             if DEBUG_MODE:
                 print(f"[ProfileUpdate] call failed: {exc}")
             if latest_user_text:
-                self._fallback_update_diet(user_id, latest_user_text)
-                self._fallback_update_glucose(user_id, latest_user_text)
+                await self._notify(user_id, await run_io(self._fallback_update, user_id, latest_user_text))
             return None
         if not (text or "").strip():
             if latest_user_text:
-                self._fallback_update_diet(user_id, latest_user_text)
-                self._fallback_update_glucose(user_id, latest_user_text)
+                await self._notify(user_id, await run_io(self._fallback_update, user_id, latest_user_text))
             return None
         try:
-            updated = json.loads(text)
+            updated = json_codec.loads(text)
         except Exception:
             if DEBUG_MODE:
                 print(f"[ProfileUpdate] JSON parse error. raw='{(text or '')[:200]}'")
             if latest_user_text:
-                self._fallback_update_diet(user_id, latest_user_text)
-                self._fallback_update_glucose(user_id, latest_user_text)
+                await self._notify(user_id, await run_io(self._fallback_update, user_id, latest_user_text))
             return None
-        updated = self._trim_lists(updated)
+        if not isinstance(updated, dict):
+            return None
+        if watermark:
+            updated = await run_io(self._merge_modules, user_id, updated)
+        # Markers left over (diet_2w, or a full run that emitted them anyway) must not be persisted.
+        updated = self._trim_lists(_strip_markers(updated))
         if DEBUG_MODE:
             try:
                 print(f"[ProfileUpdate] updated keys: {list(updated.keys())}")
             except Exception:
                 pass
 
-        # profile_static -> also sync legacy profiles dir for backward compat
-        if isinstance(updated.get("profile_static"), dict):
-            self._write_user_file(user_id, "profile_static", updated["profile_static"])
-            # legacy profile.json
-            save_profile(user_id, updated.get("profile_static", {}))
-        if isinstance(updated.get("smalltalk"), dict):
-            self._write_user_file(user_id, "smalltalk", updated["smalltalk"])
-        if isinstance(updated.get("health_record"), dict):
-            self._write_user_file(user_id, "health_record", updated["health_record"])
-        if isinstance(updated.get("diet_2w"), dict):
-            self._write_user_file(user_id, "diet_2w", updated["diet_2w"])
-        if isinstance(updated.get("recent_events"), dict):
-            self._write_user_file(user_id, "recent_events", updated["recent_events"])
-        if isinstance(updated.get("habits"), dict):
-            self._write_user_file(user_id, "habits", updated["habits"])
-
-        # Fallback: if diet未更新或未包含今日数据且最近用户消息包含饮食描述，补写到 diet_2w
-        if latest_user_text:
-            diet_obj = updated.get("diet_2w") if isinstance(updated.get("diet_2w"), dict) else None
-            if (diet_obj is None) or (not self._has_today_meal(diet_obj, today_str)):
-                self._fallback_update_diet(user_id, latest_user_text)
-        # Fallback: 如果 labs 未更新或未包含今日血糖且最近用户消息包含血糖值，补写到 health_record.labs
-        if latest_user_text:
-            hr_obj = updated.get("health_record") if isinstance(updated.get("health_record"), dict) else None
-            need_glucose = False
-            if hr_obj is None:
-                need_glucose = True
-            elif not self._has_today_glucose(hr_obj, today_str):
-                need_glucose = True
-            if need_glucose:
-                self._fallback_update_glucose(user_id, latest_user_text)
-
+        changed = await run_io(self._persist, user_id, updated, latest_user_text, today_str, bool(watermark))
+        if PROFILE_SYNC_INCREMENTAL and history and history[-1].get("ts"):
+            # Only advanced after a successful merge; failed runs resend the same records.
+            await run_io(self._save_watermark, user_id, str(history[-1]["ts"]), incremental_runs + 1 if watermark else 0)
+        if DEBUG_MODE:
+            print(f"[ProfileUpdate] changed modules: {changed}")
+        await self._notify(user_id, changed)
         return updated
 
 class ScheduleTriggerAgent:
@@ -300,30 +566,15 @@ class ScheduleTriggerAgent:
     )
 
     def _get_recent_triggers(self, user_id: str, limit: int = 3) -> List[str]:
-        """从历史记录中解析最近触发过的 [TRIGGER:xxx]"""
+        """最近触发过的话题（来自触发账本，去重，最新在前）"""
         try:
-            history = chat_store.load(user_id)
-            triggers = []
-            # 倒序查找最近的 N 个触发词
-            for msg in reversed(history):
-                content = msg.get("content", "")
-                if "[TRIGGER:" in content:
-                    # 简单提取：[TRIGGER: xxx]
-                    start = content.find("[TRIGGER:") + 9
-                    end = content.find("]", start)
-                    if start > 8 and end > start:
-                        t_type = content[start:end].strip()
-                        if t_type not in triggers:
-                            triggers.append(t_type)
-                if len(triggers) >= limit:
-                    break
-            return triggers
+            return chat_store.triggers.recent_types(user_id, limit=limit, unique=True)
         except Exception:
             return []
 
     async def evaluate(self, user_id: str, now_iso: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], str]:
         # 1. 环境与时间准备
-        profile = load_profile(user_id)
+        profile = await aload_profile(user_id)
         now_dt = datetime.fromisoformat(now_iso) if now_iso else datetime.now(timezone.utc)
         # 简单固定 +8 时区，仅用于展示，不要据此偏向夜宵/熬夜话题
         local_dt = now_dt.astimezone(timezone(timedelta(hours=8)))
@@ -331,7 +582,7 @@ class ScheduleTriggerAgent:
 
         # 2. 【核心逻辑】Python端执行去重
         # 先获取最近用过的 3 个
-        recent_triggers = self._get_recent_triggers(user_id, limit=3)
+        recent_triggers = await run_io(self._get_recent_triggers, user_id, limit=3)
         
         # 计算剩下的可用列表
         valid_options = [t for t in self.CANDIDATES if t not in recent_triggers]
@@ -353,7 +604,7 @@ class ScheduleTriggerAgent:
         payload = {
             "current_time": current_time_str,
             "user_summary": user_summary,
-            "valid_options_json": json.dumps(valid_options, ensure_ascii=False)
+            "valid_options_json": json_codec.dumps(valid_options)
         }
 
         # 5. 调用 AI 进行决策和生成
@@ -378,7 +629,7 @@ class ScheduleTriggerAgent:
             else:
 
                 try:
-                    decision = json.loads(decision_raw)
+                    decision = json_codec.loads(decision_raw)
                 except Exception:
                     # 宽松解析单引号 JSON
                     try:
@@ -449,11 +700,12 @@ class EventSelectorAgent:
         try:
             text = await chat_once(
                 system_prompt=self.prompt_template,
-                user_prompt=json.dumps(payload, ensure_ascii=False),
+                user_prompt=json_codec.dumps(payload),
                 max_tokens=200,
                 temperature=0.2,
+                cache="event_selector",
             )
-            decision = json.loads(text)
+            decision = json_codec.loads(text)
         except Exception:
             return proposed  # fail-open
         if not decision.get("trigger"):
@@ -483,44 +735,52 @@ class FlexibleEventAgent:
         payload = {"event_type": event_type, "slots": slots}
         text = await chat_once(
             system_prompt=self.prompt_template,
-            user_prompt=json.dumps(payload, ensure_ascii=False),
+            user_prompt=json_codec.dumps(payload),
             max_tokens=200,
             temperature=0.4,
+            cache="event_composer",
         )
         return (text or "").strip()
 
 
 class PassiveContextAgent:
-    """Load user JSON (profiles, records) and build a compact context snippet."""
+    """Load user JSON (profiles, records) and build a compact context snippet.
+
+    Snippets are memoized per user and keyed by the stat signatures of the
+    six module files, so a rebuild only happens after one of them changes.
+    The memo is an LRU over at most ``max_users`` users.
+    """
 
-    def __init__(self, max_topics: int = 6, max_events: int = 10) -> None:
+    def __init__(self, max_topics: int = 6, max_events: int = 10, max_users: int = USER_DATA_CACHE_USERS) -> None:
         self.max_topics = max_topics
         self.max_events = max_events
-        self.base = Path(__file__).resolve().parent / "data" / "users"
+        self.max_users = max(1, max_users)
+        self._memo: "OrderedDict[str, Tuple[Tuple[Any, ...], str]]" = OrderedDict()
+        self._memo_lock = threading.Lock()
 
     def _load(self, user_id: str, name: str) -> Dict[str, Any]:
         """
-        Load a user data file. Prefer JSON, but doctor Agent may emit markdown
-        or plain text; in that case wrap the text into {"summary": "..."} so the
-        downstream prompt仍能使用。
+        Load a user data file via the shared repository. Markdown/plain-text
+        notes from the doctor Agent come back as {"summary": "..."}.
         """
-        base_path = self.base / user_id / f"{name}.json"
-        candidates = [base_path, base_path.with_suffix(".md"), base_path.with_suffix(".txt")]
-        for path in candidates:
-            if not path.exists():
-                continue
-            try:
-                return json.loads(path.read_text(encoding="utf-8"))
-            except Exception:
-                try:
-                    text = path.read_text(encoding="utf-8").strip()
-                    if text:
-                        return {"summary": text[:2000]}
-                except Exception:
-                    continue
-        return {}
+        return user_data.load(user_id, name)
 
     def build(self, user_id: str) -> str:
+        key = user_data.versions(user_id)
+        with self._memo_lock:
+            hit = self._memo.get(user_id)
+            if hit is not None and hit[0] == key:
+                self._memo.move_to_end(user_id)
+                return hit[1]
+        text = self._render(user_id)
+        with self._memo_lock:
+            self._memo[user_id] = (key, text)
+            self._memo.move_to_end(user_id)
+            while len(self._memo) > self.max_users:
+                self._memo.popitem(last=False)
+        return text
+
+    def _render(self, user_id: str) -> str:
         ps = self._load(user_id, "profile_static")
         hr = self._load(user_id, "health_record")
         diet = self._load(user_id, "diet_2w")
@@ -551,11 +811,33 @@ class PassiveContextAgent:
         return "\n".join([l for l in lines if l.strip()])
 
 
+# Shared instance so the memo is warmed by profile syncs and reused by chat requests.
+passive_context_agent = PassiveContextAgent()
+
+
 class ResponseGeneratorAgent:
     """Generate assistant replies for passive or proactive flows."""
 
     prompt_template = "[TODO: 在此填入老友/医生双模式人设指令]"
 
+    def __init__(self) -> None:
+        # user_id -> (profile version, rendered [PROFILE_JSON] block), LRU like the profile cache.
+        self._profile_blocks: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+
+    def _profile_block(self, user_id: str, profile: Dict[str, Any], version: Optional[int]) -> str:
+        if version is not None:
+            cached = self._profile_blocks.get(user_id)
+            if cached and cached[0] == version:
+                self._profile_blocks.move_to_end(user_id)
+                return cached[1]
+        block = "[PROFILE_JSON]\n" + json_codec.dumps(profile)
+        if version is not None:
+            self._profile_blocks[user_id] = (version, block)
+            self._profile_blocks.move_to_end(user_id)
+            while len(self._profile_blocks) > PROFILE_CACHE_USERS:
+                self._profile_blocks.popitem(last=False)
+        return block
+
     def _serialize(self, messages: List[Dict[str, Any]]) -> str:
         lines: List[str] = []
         for msg in messages:
@@ -574,18 +856,19 @@ class ResponseGeneratorAgent:
         mode: str = "passive",
         stream: bool = True,
         profile: Optional[Dict[str, Any]] = None,
+        profile_version: Optional[int] = None,
         include_user_data: bool = False,
         context_agent: Optional[PassiveContextAgent] = None,
     ):
-        history = chat_store.load(user_id)
+        history = await chat_store.aload(user_id)
         profile_block = None
         if profile:
-            profile_block = "[PROFILE_JSON]\n" + json.dumps(profile, ensure_ascii=False)
+            profile_block = self._profile_block(user_id, profile, profile_version)
         user_data_block = None
         if include_user_data:
             try:
-                agent = context_agent or PassiveContextAgent()
-                user_data_block = agent.build(user_id)
+                agent = context_agent or passive_context_agent
+                user_data_block = await run_io(agent.build, user_id)
             except Exception:
                 user_data_block = None
         merged_extra = None
@@ -595,7 +878,17 @@ class ResponseGeneratorAgent:
 
         messages = chat_store.to_messages(history, system_prompt=self.prompt_template, extra_system=merged_extra)
         prompt_text = self._serialize(messages)
-        if stream:
+        if stream and REPLY_BACKEND == "openai":
+            # Same (event, data) shape as coze_stream so callers need no changes.
+            async for delta in chat_stream(
+                system_prompt=self.prompt_template,
+                user_prompt=prompt_text,
+                max_tokens=400,
+                temperature=0.6,
+            ):
+                yield "Message", delta
+            yield "Done", None
+        elif stream:
             async for event, data in coze_stream(prompt_text):
                 yield event, data
         else:
@@ -1,23 +1,32 @@
-import asyncio
-import json
+import hashlib
 import os
 from pathlib import Path
-from typing import AsyncGenerator, Optional
+from typing import Any, AsyncGenerator, Dict, Optional
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
-from ..agents import ProfileUpdateAgent, ResponseGeneratorAgent, PassiveContextAgent
-from ..chat_history import ChatHistoryStore
+from ..agents import ResponseGeneratorAgent, passive_context_agent
+from ..chat_history import chat_store
+from ..coze_client import close_coze_client, start_coze_client
+from ..file_lock import sweep_locks
+from ..openai_client import close_openai_client
 from .routes_profile import router as profile_router
 from ..routes_schedule import router as schedule_router
+from ..routes_glucose import router as glucose_router
 from ..state_stream import state_stream_manager, state_stream_router
-from .profile_store import load_profile
+from .profile_store import aload_profile_versioned
 from ..proactive_loop import ProactiveLoop
+from .. import json_codec
+from ..io_executor import loop_lag_monitor, run_io, shutdown_io
+from ..llm_cache import llm_cache
+from ..llm_scheduler import llm_scheduler
+from ..profile_sync import profile_sync
+from ..user_data import user_data
 
 load_dotenv()
 
@@ -29,11 +38,10 @@ PROACTIVE_ENABLED = os.getenv("PROACTIVE_ENABLED", "true").lower() == "true"
 PROACTIVE_TICK_SECONDS = int(os.getenv("PROACTIVE_TICK_SECONDS", "30"))
 PROACTIVE_COOLDOWN_SECONDS = int(os.getenv("PROACTIVE_COOLDOWN_SECONDS", "1800"))
 PROACTIVE_JITTER_SECONDS = int(os.getenv("PROACTIVE_JITTER_SECONDS", "0"))
+LOOP_LAG_MONITOR = os.getenv("LOOP_LAG_MONITOR", "false").lower() == "true"
 
-chat_store = ChatHistoryStore()
 response_agent = ResponseGeneratorAgent()
-user_data_agent = PassiveContextAgent()
-profile_agent = ProfileUpdateAgent()
+user_data_agent = passive_context_agent
 proactive_loop: Optional[ProactiveLoop] = None
 
 app = FastAPI(title="Glucose Assistant")
@@ -48,7 +56,22 @@ app.add_middleware(
 
 app.include_router(profile_router, prefix="/api")
 app.include_router(schedule_router, prefix="/api")
+app.include_router(glucose_router, prefix="/api")
 app.include_router(state_stream_router, prefix="/api")
+
+
+# Registered before the /data mount so it wins: user directories are hash-sharded
+# on disk, but the frontend still fetches /data/users/{user_id}/{file}.
+@app.get("/data/users/{user_id}/{name}")
+async def user_data_file(user_id: str, name: str):
+    if user_id in (".", "..") or name.startswith("."):
+        raise HTTPException(status_code=404, detail="Not Found")
+    path = (await run_io(user_data.user_dir, user_id)) / name
+    if not await run_io(path.is_file):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(path)
+
+
 # Serve frontend assets from backend/static
 app.mount("/assets", StaticFiles(directory=FRONTEND_DIR / "assets"), name="assets")
 app.mount("/bundles", StaticFiles(directory=FRONTEND_DIR / "bundles"), name="bundles")
@@ -72,7 +95,13 @@ class ChatRequest(BaseModel):
 
 @app.on_event("startup")
 async def _startup():
+    swept = await run_io(sweep_locks)
+    if swept:
+        print(f"[startup] removed {swept} idle lock files")
+    await start_coze_client()
     await state_stream_manager.start()
+    if LOOP_LAG_MONITOR:
+        await loop_lag_monitor.start()
     global proactive_loop
     if PROACTIVE_ENABLED:
         proactive_loop = ProactiveLoop(
@@ -88,7 +117,15 @@ async def _startup():
 async def _shutdown():
     if proactive_loop:
         await proactive_loop.stop()
+    # Let pending profile syncs finish while the LLM clients are still open.
+    await profile_sync.close()
     await state_stream_manager.stop()
+    await loop_lag_monitor.stop()
+    await close_coze_client()
+    await close_openai_client()
+    # Flush group-committed chat appends before the I/O pool goes away.
+    await run_io(chat_store.close)
+    shutdown_io()
 
 
 @app.get("/")
@@ -102,18 +139,19 @@ async def read_index():
 async def chat(body: ChatRequest, user_id: str = DEFAULT_USER_ID):
     """Non-streaming chat; primarily for debugging."""
     try:
-        chat_store.append(user_id, "user", body.text, visible=True, source="user")
+        await chat_store.aappend(user_id, "user", body.text, visible=True, source="user")
         try:
             await state_stream_manager.broadcast_chat(user_id=user_id, role="user", text=body.text, meta={"mode": "passive"})
         except Exception:
             pass
-        profile = load_profile(user_id)
+        profile_version, profile = await aload_profile_versioned(user_id)
         text_parts = []
         async for event, data in response_agent.generate(
             user_id,
             mode="passive",
             stream=True,
             profile=profile,
+            profile_version=profile_version,
             include_user_data=True,
             context_agent=user_data_agent,
         ):
@@ -125,7 +163,7 @@ async def chat(body: ChatRequest, user_id: str = DEFAULT_USER_ID):
                 break
         reply = "".join(text_parts).strip()
         if reply:
-            chat_store.append(
+            await chat_store.aappend(
                 user_id,
                 "assistant",
                 reply,
@@ -139,10 +177,7 @@ async def chat(body: ChatRequest, user_id: str = DEFAULT_USER_ID):
                 )
             except Exception:
                 pass
-        try:
-            asyncio.create_task(profile_agent.run(user_id))
-        except RuntimeError:
-            pass
+        profile_sync.request(user_id)
         return {"reply": reply}
     except Exception as exc:  # surfaced as gateway error
         raise HTTPException(status_code=502, detail=str(exc)) from exc
@@ -150,8 +185,8 @@ async def chat(body: ChatRequest, user_id: str = DEFAULT_USER_ID):
 
 @app.post("/api/chat/stream")
 async def chat_stream(body: ChatRequest, user_id: str = DEFAULT_USER_ID):
-    chat_store.append(user_id, "user", body.text, visible=True, source="user")
-    profile = load_profile(user_id)
+    await chat_store.aappend(user_id, "user", body.text, visible=True, source="user")
+    profile_version, profile = await aload_profile_versioned(user_id)
 
     async def event_source() -> AsyncGenerator[str, None]:
         assistant_text = ""
@@ -161,6 +196,7 @@ async def chat_stream(body: ChatRequest, user_id: str = DEFAULT_USER_ID):
                 mode="passive",
                 stream=True,
                 profile=profile,
+                profile_version=profile_version,
                 include_user_data=True,
                 context_agent=user_data_agent,
             ):
@@ -171,20 +207,20 @@ async def chat_stream(body: ChatRequest, user_id: str = DEFAULT_USER_ID):
                     delta = str(data)
                     assistant_text += delta
                     payload = {"text": delta}
-                    yield f"event: message\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                    yield f"event: message\ndata: {json_codec.dumps(payload)}\n\n"
                 elif name == "interrupt":
-                    yield f"event: interrupt\ndata: {json.dumps(data, default=str, ensure_ascii=False)}\n\n"
+                    yield f"event: interrupt\ndata: {json_codec.dumps(data, default=str)}\n\n"
                     break
                 elif name == "done":
                     yield "event: done\ndata: [DONE]\n\n"
                     break
                 else:
-                    yield f"event: {event}\ndata: {json.dumps(data, default=str, ensure_ascii=False)}\n\n"
+                    yield f"event: {event}\ndata: {json_codec.dumps(data, default=str)}\n\n"
         except Exception as exc:
-            yield f"event: error\ndata: {json.dumps({'message': str(exc)}, ensure_ascii=False)}\n\n"
+            yield f"event: error\ndata: {json_codec.dumps({'message': str(exc)})}\n\n"
         finally:
             if assistant_text:
-                chat_store.append(
+                await chat_store.aappend(
                     user_id,
                     "assistant",
                     assistant_text,
@@ -198,21 +234,75 @@ async def chat_stream(body: ChatRequest, user_id: str = DEFAULT_USER_ID):
                     )
                 except Exception:
                     pass
-                try:
-                    asyncio.create_task(profile_agent.run(user_id))
-                except RuntimeError:
-                    pass
+                profile_sync.request(user_id)
 
     headers = {"Cache-Control": "no-cache", "Connection": "keep-alive"}
     return StreamingResponse(event_source(), media_type="text/event-stream", headers=headers)
 
 
+def _history_cursor(record: Dict[str, Any]) -> Optional[str]:
+    cursor = record.get("id", record.get("ts"))
+    return str(cursor) if cursor is not None else None
+
+
 @app.get("/api/chat/history")
-async def chat_history(user_id: str = DEFAULT_USER_ID, limit: int = 100):
-    """Return recent visible chat messages for UI hydration."""
+async def chat_history(
+    request: Request,
+    user_id: str = DEFAULT_USER_ID,
+    limit: int = 100,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    include_hidden: bool = False,
+):
+    """Return a page of chat messages for UI hydration.
+
+    ``before``/``after`` take a record id or ts cursor. The ETag follows the
+    log's tail offset, so an unchanged history answers 304.
+    """
     try:
-        records = chat_store.load(user_id, limit=limit)
-        visible = [r for r in records if r.get("visible", True)]
-        return {"messages": visible}
+        tag = await run_io(chat_store.version_tag, user_id)
+        key = f"{user_id}|{tag}|{limit}|{before}|{after}|{include_hidden}"
+        etag = f'W/"{hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match") or ""
+        if etag in [t.strip() for t in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        messages = await chat_store.aload_page(
+            user_id, limit, before=before, after=after, visible_only=not include_hidden
+        )
+        payload = {
+            "messages": messages,
+            "next_before": _history_cursor(messages[0]) if messages else before,
+            "next_after": _history_cursor(messages[-1]) if messages else after,
+        }
+        return JSONResponse(payload, headers=headers)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+
+@app.get("/api/diag/loop_lag")
+async def loop_lag(reset: bool = False):
+    """Event-loop lag stats (enable sampling with LOOP_LAG_MONITOR=true)."""
+    snapshot = loop_lag_monitor.snapshot()
+    snapshot["enabled"] = loop_lag_monitor.task is not None
+    if reset:
+        loop_lag_monitor.reset()
+    return snapshot
+
+
+@app.get("/api/diag/llm_cache")
+async def llm_cache_stats():
+    """Hit/miss counters of the chat_once response cache, per agent."""
+    return llm_cache.stats()
+
+
+@app.get("/api/diag/llm_scheduler")
+async def llm_scheduler_stats():
+    """Per-provider LLM slots: in-flight, queue depth and waits per priority class."""
+    return llm_scheduler.snapshot()
+
+
+@app.get("/api/diag/profile_sync")
+async def profile_sync_stats():
+    """Per-user profile sync state: running, pending, runs and coalesced requests."""
+    return profile_sync.snapshot()
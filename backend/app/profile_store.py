@@ -1,11 +1,25 @@
-import json
+import hashlib
+import os
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from .. import json_codec
+from ..data_paths import user_path
+from ..file_lock import atomic_write_json, locked
+from ..io_executor import run_io
 
 APP_DIR = Path(__file__).resolve().parent
 DATA_DIR = APP_DIR.parent.parent / "data"
 PROFILE_DIR = DATA_DIR / "profiles"
+PROFILE_CACHE_USERS = int(os.getenv("PROFILE_CACHE_USERS", "256"))
+
+# user_id -> (file signature, version, profile). Cached profiles are never
+# handed out directly; readers get a clone.
+_cache: "OrderedDict[str, Tuple[Optional[Tuple[int, int, int]], int, Dict[str, Any]]]" = OrderedDict()
+_cache_lock = threading.Lock()
 
 
 def _now_iso() -> str:
@@ -42,11 +56,75 @@ def _walk_to_parent(profile: Dict[str, Any], path: str) -> Tuple[Dict[str, Any],
     return node, leaf
 
 
-def load_profile(user_id: str) -> Dict[str, Any]:
-    profile_path = PROFILE_DIR / f"{user_id}.json"
-    if not profile_path.exists():
+def _profile_path(user_id: str) -> Path:
+    return user_path(PROFILE_DIR, user_id, ".json")
+
+
+def _clone(node: Any) -> Any:
+    """Copy a JSON-shaped tree; much cheaper than copy.deepcopy."""
+    if isinstance(node, dict):
+        return {k: _clone(v) for k, v in node.items()}
+    if isinstance(node, list):
+        return [_clone(v) for v in node]
+    return node
+
+
+def _signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    """(inode, mtime_ns, size); saves replace the file, so the inode changes on every write."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _version(sig: Optional[Tuple[int, int, int]]) -> int:
+    """Version of a profile file state, derived from its signature.
+
+    Every worker computes the same value for the same file, and reloading
+    an unchanged file keeps it. 48 bits so it stays exact as a JS number.
+    """
+    digest = hashlib.blake2b(repr(sig).encode("ascii"), digest_size=6).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _remember(user_id: str, sig: Optional[Tuple[int, int, int]], profile: Dict[str, Any]) -> int:
+    version = _version(sig)
+    with _cache_lock:
+        _cache[user_id] = (sig, version, profile)
+        _cache.move_to_end(user_id)
+        while len(_cache) > PROFILE_CACHE_USERS:
+            _cache.popitem(last=False)
+    return version
+
+
+def _cached(user_id: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """(version, shared profile) for user_id, reloading if the file changed on disk."""
+    profile_path = _profile_path(user_id)
+    sig = _signature(profile_path)
+    if sig is None:
+        return None
+    with _cache_lock:
+        entry = _cache.get(user_id)
+        if entry is not None and entry[0] == sig:
+            _cache.move_to_end(user_id)
+            return entry[1], entry[2]
+    profile = json_codec.loads(profile_path.read_text(encoding="utf-8"))
+    return _remember(user_id, sig, profile), profile
+
+
+def load_profile_versioned(user_id: str) -> Tuple[int, Dict[str, Any]]:
+    """Return (version, profile). The version changes whenever the profile file changes."""
+    hit = _cached(user_id)
+    if hit is not None:
+        return hit[0], _clone(hit[1])
+    profile_path = _profile_path(user_id)
+    with locked(profile_path):
+        # Another worker may have bootstrapped it while we waited.
+        hit = _cached(user_id)
+        if hit is not None:
+            return hit[0], _clone(hit[1])
         # Bootstrap a minimal profile to avoid missing-file failures.
-        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
         profile: Dict[str, Any] = {
             "basic": {
                 "user_id": _field_value(user_id, source="bootstrap"),
@@ -59,15 +137,25 @@ def load_profile(user_id: str) -> Dict[str, Any]:
             "interests": {},
             "assistant_prefs": {},
         }
-        save_profile(user_id, profile)
-        return profile
-    return json.loads(profile_path.read_text(encoding="utf-8"))
+        version = save_profile(user_id, profile)
+        return version, profile
+
+
+def load_profile(user_id: str) -> Dict[str, Any]:
+    return load_profile_versioned(user_id)[1]
+
 
+def profile_version(user_id: str) -> Optional[int]:
+    """Current version without cloning; None when the profile does not exist yet."""
+    hit = _cached(user_id)
+    return hit[0] if hit is not None else None
 
-def save_profile(user_id: str, profile: Dict[str, Any]) -> None:
-    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
-    profile_path = PROFILE_DIR / f"{user_id}.json"
-    profile_path.write_text(json.dumps(profile, ensure_ascii=False, indent=2), encoding="utf-8")
+
+def save_profile(user_id: str, profile: Dict[str, Any]) -> int:
+    with locked(_profile_path(user_id)):
+        profile_path = _profile_path(user_id)
+        atomic_write_json(profile_path, profile)
+        return _remember(user_id, _signature(profile_path), _clone(profile))
 
 
 def patch_profile(
@@ -78,15 +166,34 @@ def patch_profile(
     source: str = "api_patch",
     confidence: float = 1.0,
 ) -> Dict[str, Any]:
-    profile = load_profile(user_id)
-    parent, leaf = _walk_to_parent(profile, path)
-    parent[leaf] = _field_value(value=value, layer=layer, source=source, confidence=confidence, revoked=False)
-    save_profile(user_id, profile)
+    with locked(_profile_path(user_id)):
+        profile = load_profile(user_id)
+        _apply_patch(profile, path, value, layer=layer, source=source, confidence=confidence)
+        save_profile(user_id, profile)
     return profile
 
 
 def revoke_field(user_id: str, path: str, reason: str = "revoked") -> Dict[str, Any]:
-    profile = load_profile(user_id)
+    with locked(_profile_path(user_id)):
+        profile = load_profile(user_id)
+        _apply_revoke(profile, path, reason)
+        save_profile(user_id, profile)
+    return profile
+
+
+def _apply_patch(
+    profile: Dict[str, Any],
+    path: str,
+    value: Any,
+    layer: str = "confirmed",
+    source: str = "api_patch",
+    confidence: float = 1.0,
+) -> None:
+    parent, leaf = _walk_to_parent(profile, path)
+    parent[leaf] = _field_value(value=value, layer=layer, source=source, confidence=confidence, revoked=False)
+
+
+def _apply_revoke(profile: Dict[str, Any], path: str, reason: str = "revoked") -> None:
     parent, leaf = _walk_to_parent(profile, path)
     if leaf not in parent or not isinstance(parent[leaf], dict):
         raise KeyError(f"field not found at path '{path}'")
@@ -95,8 +202,62 @@ def revoke_field(user_id: str, path: str, reason: str = "revoked") -> Dict[str,
     current["source"] = reason
     current["updated_at"] = _now_iso()
     parent[leaf] = current
-    save_profile(user_id, profile)
-    return profile
+
+
+def apply_profile_ops(user_id: str, ops: Iterable[Dict[str, Any]]) -> Tuple[int, Dict[str, Any]]:
+    """Apply patch/revoke ops in one load/save; nothing is saved if any op fails.
+
+    Each op is {"op": "patch", "path", "value", "layer", "source", "confidence"}
+    or {"op": "revoke", "path", "reason"}. Returns (version, profile).
+    """
+    with locked(_profile_path(user_id)):
+        # load_profile hands out a clone, so a failed op leaves the cache intact.
+        profile = load_profile(user_id)
+        for index, op in enumerate(ops):
+            kind = op.get("op", "patch")
+            path = op.get("path") or ""
+            try:
+                if kind == "patch":
+                    _apply_patch(
+                        profile,
+                        path,
+                        op.get("value"),
+                        layer=op.get("layer") or "confirmed",
+                        source=op.get("source") or "api_patch",
+                        confidence=op["confidence"] if op.get("confidence") is not None else 1.0,
+                    )
+                elif kind == "revoke":
+                    _apply_revoke(profile, path, op.get("reason") or "revoked")
+                else:
+                    raise ValueError(f"unknown op '{kind}'")
+            except (KeyError, ValueError) as exc:
+                raise ValueError(f"ops[{index}] ({kind} {path}): {exc}") from exc
+        version = save_profile(user_id, profile)
+    return version, profile
+
+
+async def aload_profile(user_id: str) -> Dict[str, Any]:
+    return await run_io(load_profile, user_id)
+
+
+async def aload_profile_versioned(user_id: str) -> Tuple[int, Dict[str, Any]]:
+    return await run_io(load_profile_versioned, user_id)
+
+
+async def asave_profile(user_id: str, profile: Dict[str, Any]) -> int:
+    return await run_io(save_profile, user_id, profile)
+
+
+async def apatch_profile(user_id: str, path: str, value: Any, **kwargs: Any) -> Dict[str, Any]:
+    return await run_io(patch_profile, user_id, path, value, **kwargs)
+
+
+async def aapply_profile_ops(user_id: str, ops: Iterable[Dict[str, Any]]) -> Tuple[int, Dict[str, Any]]:
+    return await run_io(apply_profile_ops, user_id, list(ops))
+
+
+async def arevoke_field(user_id: str, path: str, reason: str = "revoked") -> Dict[str, Any]:
+    return await run_io(revoke_field, user_id, path, reason)
 
 
 def ensure_profile_valid(profile: Dict[str, Any]) -> bool:
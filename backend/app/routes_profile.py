@@ -1,9 +1,10 @@
-from typing import Optional
+import asyncio
+from typing import List, Optional
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
-from .profile_store import load_profile, patch_profile, revoke_field
+from .profile_store import aapply_profile_ops, aload_profile, apatch_profile, arevoke_field
 from ..state_stream import state_stream_manager
 
 router = APIRouter()
@@ -24,18 +25,33 @@ class ProfileRevoke(BaseModel):
     reason: Optional[str] = "user_revoked"
 
 
+class ProfileOp(BaseModel):
+    op: str = "patch"  # "patch" | "revoke"
+    path: str
+    value: object = None
+    layer: Optional[str] = "confirmed"
+    source: Optional[str] = "user_edit"
+    confidence: Optional[float] = 1.0
+    reason: Optional[str] = "user_revoked"
+
+
+class ProfileBatch(BaseModel):
+    user_id: str
+    ops: List[ProfileOp]
+
+
 @router.get("/profile")
-def get_profile(user_id: str):
+async def get_profile(user_id: str):
     try:
-        return load_profile(user_id)
+        return await aload_profile(user_id)
     except FileNotFoundError as exc:
         raise HTTPException(status_code=404, detail=str(exc)) from exc
 
 
 @router.patch("/profile")
-def patch_profile_route(body: ProfilePatch):
+async def patch_profile_route(body: ProfilePatch):
     try:
-        updated = patch_profile(
+        updated = await apatch_profile(
             user_id=body.user_id,
             path=body.path,
             value=body.value,
@@ -45,8 +61,6 @@ def patch_profile_route(body: ProfilePatch):
         )
         # broadcast update
         try:
-            import asyncio
-
             asyncio.create_task(state_stream_manager.broadcast_profile(body.user_id))
         except RuntimeError:
             # no running loop, ignore
@@ -59,16 +73,14 @@ def patch_profile_route(body: ProfilePatch):
 
 
 @router.post("/profile/revoke")
-def revoke_profile_route(body: ProfileRevoke):
+async def revoke_profile_route(body: ProfileRevoke):
     try:
-        updated = revoke_field(
+        updated = await arevoke_field(
             user_id=body.user_id,
             path=body.path,
             reason=body.reason or "revoked",
         )
         try:
-            import asyncio
-
             asyncio.create_task(state_stream_manager.broadcast_profile(body.user_id))
         except RuntimeError:
             pass
@@ -77,3 +89,33 @@ def revoke_profile_route(body: ProfileRevoke):
         raise HTTPException(status_code=404, detail=str(exc)) from exc
     except Exception as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.patch("/profile/batch")
+async def batch_profile_route(body: ProfileBatch):
+    """Apply several patch/revoke ops atomically, then broadcast once."""
+    if not body.ops:
+        raise HTTPException(status_code=400, detail="ops is empty")
+    ops = [
+        {
+            "op": op.op,
+            "path": op.path,
+            "value": op.value,
+            "layer": op.layer,
+            "source": op.source or "user_edit",
+            "confidence": op.confidence,
+            "reason": op.reason,
+        }
+        for op in body.ops
+    ]
+    try:
+        version, updated = await aapply_profile_ops(body.user_id, ops)
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    try:
+        asyncio.create_task(state_stream_manager.broadcast_profile(body.user_id))
+    except RuntimeError:
+        pass
+    return {"ok": True, "applied": len(ops), "version": version, "profile": updated}
@@ -1,27 +1,586 @@
-import json
+import atexit
+import gzip
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Any, Set, Tuple
+
+from . import json_codec
+from .data_paths import user_path
+from .file_lock import atomic_write_text, locked
+from .io_executor import run_io
 
 # Simple append-only chat history store.
+# Storage backend: "jsonl" (default) or "sqlite" (see chat_history_sqlite.py).
+CHAT_BACKEND = os.getenv("CHAT_HISTORY_BACKEND", "jsonl").lower()
 DATA_DIR = Path(__file__).resolve().parent / "data" / "state"
 CHAT_DIR = DATA_DIR / "chat_history"
+# Block size used when scanning a history file backwards from EOF.
+TAIL_BLOCK_SIZE = 64 * 1024
+# In-memory cache: last N records per user, for at most M users (LRU).
+CACHE_RECORDS = int(os.getenv("CHAT_CACHE_RECORDS", "500"))
+CACHE_USERS = int(os.getenv("CHAT_CACHE_USERS", "256"))
+# Filtered reads that miss the cache scan at most this many records back,
+# so a user with few matches does not decompress the whole archive.
+SCAN_MAX_RECORDS = int(os.getenv("CHAT_SCAN_MAX_RECORDS", "2000"))
+# Segment rollover: the hot {user_id}.jsonl is sealed into a gzip archive
+# segment once it reaches this size (bytes) or age (hours). 0 disables.
+SEGMENT_MAX_BYTES = int(os.getenv("CHAT_SEGMENT_MAX_BYTES", str(1024 * 1024)))
+SEGMENT_MAX_AGE_HOURS = float(os.getenv("CHAT_SEGMENT_MAX_AGE_HOURS", "0"))
+ARCHIVE_DIR = CHAT_DIR / "archive"
+# Group commit: appends are buffered per user for this many milliseconds and
+# written with one write() per user; 0 writes synchronously inside append().
+GROUP_COMMIT_MS = float(os.getenv("CHAT_GROUP_COMMIT_MS", "5"))
+# Durability policy: "none" (OS buffers), "batch" (fsync every batch) or
+# "interval" (fsync at most every CHAT_FSYNC_INTERVAL seconds per file; the
+# writer syncs a file left dirty by its last batch once the interval ends).
+DURABILITY = os.getenv("CHAT_DURABILITY", "none").lower()
+FSYNC_INTERVAL = float(os.getenv("CHAT_FSYNC_INTERVAL", "1.0"))
+# Number of recent trigger fires remembered per user, for at most M users (LRU).
+TRIGGER_LEDGER_SIZE = int(os.getenv("TRIGGER_LEDGER_SIZE", "256"))
+TRIGGER_LEDGER_USERS = int(os.getenv("TRIGGER_LEDGER_USERS", str(CACHE_USERS)))
+
+_TRIGGER_TAG_RE = re.compile(r"\[TRIGGER:([^\]\s]+)\]")
+_BRACKET_TAG_RE = re.compile(r"\[([^\]\s]+)\]")
+
+
+def _iter_lines_reversed(path: Path, block_size: int = TAIL_BLOCK_SIZE) -> Iterator[bytes]:
+    """Yield non-empty raw lines of ``path`` from last to first.
+
+    Reads fixed-size blocks backwards from EOF, so consuming N lines costs
+    O(N) regardless of file size. Splitting on b"\n" is safe for UTF-8.
+    """
+    with path.open("rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        remainder = b""
+        while pos > 0:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step) + remainder
+            lines = chunk.split(b"\n")
+            # The first piece may be a partial line; carry it into the next block.
+            remainder = lines[0]
+            for line in reversed(lines[1:]):
+                if line.strip():
+                    yield line
+        if remainder.strip():
+            yield remainder
+
+
+def _tail_lines(path: Path, limit: int) -> List[bytes]:
+    """Return the last ``limit`` non-empty lines of ``path`` in file order."""
+    if limit <= 0:
+        return []
+    lines = list(islice(_iter_lines_reversed(path), limit))
+    lines.reverse()
+    return lines
+
+
+def _parse_lines(lines: List[bytes]) -> List[Dict[str, Any]]:
+    records: List[Dict[str, Any]] = []
+    for line in lines:
+        try:
+            records.append(json_codec.loads(line))
+        except Exception:
+            continue
+    return records
+
+
+def _signature(path: Path) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, size) of ``path``, or None when it does not exist."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def parse_trigger_type(content: Any, lenient: bool = True) -> Optional[str]:
+    """Extract the event type from ``[TRIGGER:xxx]`` (or ``[xxx]`` when lenient)."""
+    if not isinstance(content, str) or not content:
+        return None
+    m = _TRIGGER_TAG_RE.search(content)
+    if not m and lenient:
+        m = _BRACKET_TAG_RE.search(content)
+    if not m:
+        return None
+    return m.group(1).strip() or None
+
+
+def _record_trigger(record: Dict[str, Any]) -> Optional[str]:
+    """Trigger type carried by a history record, if it marks a proactive fire."""
+    role = record.get("role")
+    meta = record.get("meta") or {}
+    if isinstance(meta, dict) and meta.get("trigger_type"):
+        return str(meta["trigger_type"])
+    # system_inject content is always a trigger context; other roles only
+    # count when they carry an explicit [TRIGGER:xxx] tag.
+    return parse_trigger_type(record.get("content"), lenient=role == "system_inject")
+
+
+def _epoch(ts: Any) -> float:
+    try:
+        return datetime.fromisoformat(str(ts)).timestamp()
+    except Exception:
+        return 0.0
+
+
+class TriggerLedger:
+    """Per-user deque of recent ``(timestamp, trigger_type)`` fires.
+
+    Kept up to date by ``ChatHistoryStore.append`` and persisted as
+    ``{user_id}.triggers.jsonl`` next to the chat log, so dedup questions
+    no longer rescan the history. A missing ledger file is rebuilt once
+    from the chat log, sealed segments included (``history`` yields a
+    user's records newest first). The file's mtime/size is checked on access so fires
+    recorded by other worker processes are picked up. At most
+    ``max_users`` ledgers are kept in memory (LRU). A cold ledger is read
+    from disk, so call these methods through ``run_io`` from async code.
+    """
+
+    def __init__(
+        self,
+        maxlen: int = TRIGGER_LEDGER_SIZE,
+        max_users: int = TRIGGER_LEDGER_USERS,
+        history: Optional[Callable[[str], Iterator[Dict[str, Any]]]] = None,
+    ) -> None:
+        self.maxlen = max(1, maxlen)
+        self.max_users = max(1, max_users)
+        self._history = history or self._hot_records
+        self._entries: "OrderedDict[str, Deque[Tuple[float, str]]]" = OrderedDict()
+        self._last_key: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self._sigs: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._lock = threading.RLock()
+
+    def _path(self, user_id: str) -> Path:
+        return user_path(CHAT_DIR, user_id, ".triggers.jsonl")
+
+    def _hot_records(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        history = user_path(CHAT_DIR, user_id, ".jsonl")
+        if history.exists():
+            for line in _iter_lines_reversed(history):
+                try:
+                    yield json_codec.loads(line)
+                except Exception:
+                    continue
+
+    def _get(self, user_id: str) -> Deque[Tuple[float, str]]:
+        entries = self._entries.get(user_id)
+        if entries is None or self._sigs.get(user_id) != _signature(self._path(user_id)):
+            entries = self._load(user_id)
+            self._entries[user_id] = entries
+            self._sigs[user_id] = _signature(self._path(user_id))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            evicted, _ = self._entries.popitem(last=False)
+            self._sigs.pop(evicted, None)
+            self._last_key.pop(evicted, None)
+        return entries
+
+    def _load(self, user_id: str) -> Deque[Tuple[float, str]]:
+        entries: Deque[Tuple[float, str]] = deque(maxlen=self.maxlen)
+        path = self._path(user_id)
+        if path.exists():
+            for rec in _parse_lines(_tail_lines(path, self.maxlen)):
+                if rec.get("type"):
+                    entries.append((float(rec.get("ts") or 0.0), str(rec["type"])))
+                    self._last_key[user_id] = (rec.get("id"), str(rec["type"]))
+            return entries
+        rows: List[Dict[str, Any]] = []
+        for rec in self._history(user_id):
+            trigger_type = _record_trigger(rec)
+            if not trigger_type:
+                continue
+            trigger_id = (rec.get("meta") or {}).get("trigger_id")
+            if trigger_id and rows and (rows[-1]["id"], rows[-1]["type"]) == (trigger_id, trigger_type):
+                continue
+            rows.append({"ts": _epoch(rec.get("ts")), "type": trigger_type, "id": trigger_id})
+            if len(rows) >= self.maxlen:
+                break
+        rows.reverse()
+        for row in rows:
+            entries.append((row["ts"], row["type"]))
+        if rows:
+            self._last_key[user_id] = (rows[-1]["id"], rows[-1]["type"])
+        if not rows and not user_path(CHAT_DIR, user_id, ".jsonl").exists():
+            return entries
+        with locked(path):
+            if not path.exists():
+                atomic_write_text(path, "".join(json_codec.dumps(r) + "\n" for r in rows))
+        return entries
+
+    def observe(self, user_id: str, record: Dict[str, Any]) -> Optional[str]:
+        """Record a fire if ``record`` carries a trigger; return its type."""
+        trigger_type = _record_trigger(record)
+        if not trigger_type:
+            return None
+        meta = record.get("meta") or {}
+        trigger_id = meta.get("trigger_id") if isinstance(meta, dict) else None
+        with self._lock:
+            entries = self._get(user_id)
+            # The inject and the assistant reply of one fire share a trigger_id.
+            if trigger_id and self._last_key.get(user_id) == (trigger_id, trigger_type):
+                return trigger_type
+            row = {"ts": _epoch(record.get("ts")), "type": trigger_type, "id": trigger_id}
+            entries.append((row["ts"], trigger_type))
+            self._last_key[user_id] = (trigger_id, trigger_type)
+            with locked(self._path(user_id)):
+                path = self._path(user_id)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with path.open("a", encoding="utf-8") as f:
+                    f.write(json_codec.dumps(row) + "\n")
+                self._sigs[user_id] = _signature(path)
+        return trigger_type
+
+    def recent_types(self, user_id: str, limit: int = 3, unique: bool = False) -> List[str]:
+        """Most recent trigger types, newest first."""
+        types: List[str] = []
+        if limit <= 0:
+            return types
+        with self._lock:
+            for _, trigger_type in reversed(self._get(user_id)):
+                if unique and trigger_type in types:
+                    continue
+                types.append(trigger_type)
+                if len(types) >= limit:
+                    break
+        return types
+
+    def count(self, user_id: str, trigger_type: str, last_k: int = 10) -> int:
+        """How many of the last ``last_k`` fires were ``trigger_type``."""
+        with self._lock:
+            recent = islice(reversed(self._get(user_id)), max(0, last_k))
+            return sum(1 for _, t in recent if t == trigger_type)
+
+    def fired_within(self, user_id: str, trigger_type: str, seconds: float, now: Optional[float] = None) -> bool:
+        """True if ``trigger_type`` fired in the last ``seconds`` seconds."""
+        cutoff = (now if now is not None else datetime.now(timezone.utc).timestamp()) - seconds
+        with self._lock:
+            for ts, t in reversed(self._get(user_id)):
+                if ts < cutoff:
+                    break
+                if t == trigger_type:
+                    return True
+        return False
 
 
 class ChatHistoryStore:
-    def load(self, user_id: str, limit: int = 200) -> List[Dict[str, Any]]:
-        path = CHAT_DIR / f"{user_id}.jsonl"
-        if not path.exists():
+    """Append-only JSONL history with a write-through, per-user ring cache.
+
+    The cache keeps the last ``cache_records`` records of up to
+    ``cache_users`` users. Entries are validated against the file's
+    mtime/size so writes from outside this instance are picked up.
+    Returned records are shared with the cache; treat them as read-only.
+
+    Each user has one hot segment (``{user_id}.jsonl``) that is sealed into
+    ``archive/{user_id}/NNNNNN.jsonl.gz`` when it grows too large or old;
+    ``{user_id}.manifest.json`` lists the sealed segments. ``load`` reads
+    the hot segment and only falls back to the newest sealed segment when
+    the hot one holds fewer records than requested; ``iter_history``
+    streams the full history.
+
+    Appends are group-committed: ``append`` returns the record at once and
+    a background writer flushes each user's pending lines in one write.
+    The writer swaps the pending batches out under the store lock and does
+    the disk writes outside it, so loads and appends of other users are
+    not held up. Call ``flush``/``close`` on shutdown.
+    """
+
+    def __init__(
+        self,
+        cache_records: int = CACHE_RECORDS,
+        cache_users: int = CACHE_USERS,
+        group_commit_ms: float = GROUP_COMMIT_MS,
+        durability: str = DURABILITY,
+        fsync_interval: float = FSYNC_INTERVAL,
+    ) -> None:
+        if durability not in ("none", "batch", "interval"):
+            raise ValueError(f"unknown durability policy: {durability}")
+        self.cache_records = max(0, cache_records)
+        self.cache_users = max(0, cache_users)
+        self.group_commit_s = max(0.0, group_commit_ms) / 1000.0
+        self.durability = durability
+        self.fsync_interval = fsync_interval
+        self._cache: "OrderedDict[str, Tuple[Optional[Tuple[int, int]], Deque[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._wake = threading.Condition(self._lock)
+        # Signalled when the writer finishes its out-of-lock batches.
+        self._written = threading.Condition(self._lock)
+        self._pending: Dict[str, List[str]] = {}
+        self._writing: Set[str] = set()
+        self._writer: Optional[threading.Thread] = None
+        self._closing = False
+        self._last_fsync: Dict[str, float] = {}
+        # Files written since their last fsync (interval durability).
+        self._dirty: Dict[str, float] = {}
+        self._fsync_lock = threading.Lock()
+        self.triggers = TriggerLedger(history=self._records_reversed)
+        self._hot_started: Dict[str, float] = {}
+
+    def _path(self, user_id: str) -> Path:
+        return user_path(CHAT_DIR, user_id, ".jsonl")
+
+    def _manifest_path(self, user_id: str) -> Path:
+        return user_path(CHAT_DIR, user_id, ".manifest.json")
+
+    def _load_manifest(self, user_id: str) -> Dict[str, Any]:
+        path = self._manifest_path(user_id)
+        if path.exists():
+            try:
+                manifest = json_codec.loads(path.read_text(encoding="utf-8"))
+                if isinstance(manifest.get("segments"), list):
+                    return manifest
+            except Exception:
+                pass
+        return {"user_id": user_id, "segments": []}
+
+    def _save_manifest(self, user_id: str, manifest: Dict[str, Any]) -> None:
+        atomic_write_text(self._manifest_path(user_id), json_codec.dumps(manifest, indent=2))
+
+    def _segment_lines(self, segment: Dict[str, Any]) -> List[bytes]:
+        try:
+            with gzip.open(CHAT_DIR / segment["file"], "rb") as f:
+                data = f.read()
+        except Exception:
             return []
-        lines = path.read_text(encoding="utf-8").splitlines()
-        records: List[Dict[str, Any]] = []
-        for line in lines[-limit:]:
+        return [line for line in data.split(b"\n") if line.strip()]
+
+    def _read_tail(self, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        path = self._path(user_id)
+        lines = _tail_lines(path, limit) if path.exists() else []
+        if len(lines) < limit and self._manifest_path(user_id).exists():
+            # Hot segment was rolled recently; top up from sealed segments.
+            for segment in reversed(self._load_manifest(user_id)["segments"]):
+                lines = self._segment_lines(segment)[-(limit - len(lines)):] + lines
+                if len(lines) >= limit:
+                    break
+        return _parse_lines(lines)
+
+    def iter_history(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        """Stream every record, oldest first, across sealed and hot segments."""
+        self.flush(user_id)
+        for segment in self._load_manifest(user_id)["segments"]:
+            yield from _parse_lines(self._segment_lines(segment))
+        path = self._path(user_id)
+        if path.exists():
+            with path.open("rb") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json_codec.loads(line)
+                    except Exception:
+                        continue
+
+    def _should_roll(self, user_id: str, path: Path, size: int) -> bool:
+        if size <= 0:
+            return False
+        if SEGMENT_MAX_BYTES > 0 and size >= SEGMENT_MAX_BYTES:
+            return True
+        if SEGMENT_MAX_AGE_HOURS > 0:
+            started = self._hot_started.get(user_id)
+            if started is None:
+                with path.open("rb") as f:
+                    first = f.readline()
+                try:
+                    started = _epoch(json_codec.loads(first).get("ts")) or time.time()
+                except Exception:
+                    started = time.time()
+                self._hot_started[user_id] = started
+            return time.time() - started >= SEGMENT_MAX_AGE_HOURS * 3600
+        return False
+
+    def _roll(self, user_id: str, path: Path) -> None:
+        """Seal the hot segment into a gzip archive segment and start a new one."""
+        data = path.read_bytes()
+        lines = [line for line in data.split(b"\n") if line.strip()]
+        if not lines:
+            return
+        manifest = self._load_manifest(user_id)
+        segments = manifest["segments"]
+        seq = (segments[-1].get("seq", len(segments)) + 1) if segments else 1
+        target = user_path(ARCHIVE_DIR, user_id) / f"{seq:06d}.jsonl.gz"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".tmp")
+        with gzip.open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+
+        def _ts(line: bytes) -> Optional[str]:
             try:
-                records.append(json.loads(line))
+                return json_codec.loads(line).get("ts")
             except Exception:
-                continue
+                return None
+
+        segments.append({
+            "seq": seq,
+            "file": target.relative_to(CHAT_DIR).as_posix(),
+            "first_ts": _ts(lines[0]),
+            "last_ts": _ts(lines[-1]),
+            "records": len(lines),
+            "bytes": len(data),
+            "compressed_bytes": target.stat().st_size,
+        })
+        self._save_manifest(user_id, manifest)
+        path.unlink()
+        self._hot_started.pop(user_id, None)
+
+    def _cached(self, user_id: str, path: Path) -> Deque[Dict[str, Any]]:
+        sig = _signature(path)
+        entry = self._cache.get(user_id)
+        if entry is not None and entry[0] == sig:
+            self._cache.move_to_end(user_id)
+            return entry[1]
+        if self._pending.get(user_id) or user_id in self._writing:
+            # Pending lines are not on disk yet; write them before reloading.
+            self._flush_user(user_id)
+            sig = _signature(path)
+        records: Deque[Dict[str, Any]] = deque(maxlen=self.cache_records)
+        records.extend(self._read_tail(user_id, self.cache_records))
+        self._cache[user_id] = (sig, records)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_users:
+            self._cache.popitem(last=False)
         return records
 
+    def _iter_reversed(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        """Yield records newest first, walking the hot then sealed segments."""
+        self.flush(user_id)
+        yield from self._records_reversed(user_id)
+
+    def _records_reversed(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        # Without the flush: the trigger ledger calls this under its own lock.
+        path = self._path(user_id)
+        if path.exists():
+            for line in _iter_lines_reversed(path):
+                try:
+                    yield json_codec.loads(line)
+                except Exception:
+                    continue
+        for segment in reversed(self._load_manifest(user_id)["segments"]):
+            yield from reversed(_parse_lines(self._segment_lines(segment)))
+
+    def load(self, user_id: str, limit: int = 200, visible_only: bool = False) -> List[Dict[str, Any]]:
+        """Last ``limit`` records, oldest first.
+
+        With ``visible_only`` hidden records (e.g. system_inject) are skipped
+        and do not count against ``limit``; the search looks at most
+        ``max(limit, SCAN_MAX_RECORDS)`` records back.
+        """
+        if limit <= 0:
+            return []
+        path = self._path(user_id)
+        if limit <= self.cache_records and self.cache_users > 0:
+            with self._lock:
+                records = self._cached(user_id, path)
+                if visible_only:
+                    tail = list(islice((r for r in reversed(records) if r.get("visible", True)), limit))
+                else:
+                    tail = list(islice(reversed(records), limit))
+                # A short cache window may hide older matches; fall through.
+                complete = len(tail) >= limit or len(records) < self.cache_records
+            if complete:
+                tail.reverse()
+                return tail
+        if not visible_only:
+            self.flush(user_id)
+            return self._read_tail(user_id, limit)
+        window = islice(self._iter_reversed(user_id), max(limit, SCAN_MAX_RECORDS))
+        tail = list(islice((r for r in window if r.get("visible", True)), limit))
+        tail.reverse()
+        return tail
+
+    def load_page(
+        self,
+        user_id: str,
+        limit: int = 100,
+        *,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        visible_only: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """One page of records, oldest first, relative to a ``ts`` cursor.
+
+        ``before`` returns the ``limit`` newest records older than the cursor;
+        ``after`` returns the ``limit`` oldest records newer than it.
+        """
+        if limit <= 0:
+            return []
+        if before is None and after is None:
+            return self.load(user_id, limit, visible_only=visible_only)
+
+        def wanted(rec: Dict[str, Any]) -> bool:
+            return not visible_only or rec.get("visible", True)
+
+        def ts(rec: Dict[str, Any]) -> str:
+            return str(rec.get("ts") or "")
+
+        with self._lock:
+            cached = list(self._cached(user_id, self._path(user_id))) if self.cache_users > 0 else []
+        whole = len(cached) < self.cache_records
+        if after is not None:
+            # Walk back until we reach the cursor; the cache usually suffices.
+            newer: List[Dict[str, Any]] = []
+            reached = False
+            for rec in reversed(cached):
+                if ts(rec) <= after:
+                    reached = True
+                    break
+                if wanted(rec):
+                    newer.append(rec)
+            if not (reached or whole):
+                newer = []
+                for rec in self._iter_reversed(user_id):
+                    if ts(rec) <= after:
+                        break
+                    if wanted(rec):
+                        newer.append(rec)
+            newer.reverse()
+            return newer[:limit]
+        older = [r for r in reversed(cached) if ts(r) < before and wanted(r)][:limit]
+        if len(older) < limit and not whole:
+            older = list(islice((r for r in self._iter_reversed(user_id) if ts(r) < before and wanted(r)), limit))
+        older.reverse()
+        return older
+
+    def version_tag(self, user_id: str) -> str:
+        """Opaque tag that changes whenever the user's log grows or rolls."""
+        with self._lock:
+            self._flush_user(user_id)
+            sig = _signature(self._path(user_id)) or (0, 0)
+            segments = len(self._load_manifest(user_id)["segments"]) if self._manifest_path(user_id).exists() else 0
+        return f"{segments}-{sig[1]}-{sig[0]}"
+
+    def recent_contents(self, user_id: str, role: str, lookback: int = 5) -> List[Any]:
+        """Contents of the last ``lookback`` records with ``role``, newest first.
+
+        Only the last ``lookback * 5`` records are searched.
+        """
+        window = lookback * 5
+        with self._lock:
+            records = self._cached(user_id, self._path(user_id)) if self.cache_users > 0 else None
+            if records is not None:
+                found = [r.get("content") for r in islice((r for r in reversed(records) if r.get("role") == role), lookback)]
+                if len(found) >= lookback or len(records) < self.cache_records or len(records) >= window:
+                    return found
+        recent = islice(self._iter_reversed(user_id), window)
+        return [r.get("content") for r in islice((r for r in recent if r.get("role") == role), lookback)]
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Drop cached records for one user, or for everyone."""
+        with self._lock:
+            if user_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(user_id, None)
+
     def append(
         self,
         user_id: str,
@@ -41,11 +600,181 @@ class ChatHistoryStore:
             "source": source,
             "meta": meta or {},
         }
-        path = CHAT_DIR / f"{user_id}.jsonl"
-        with path.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        line = json_codec.dumps(record) + "\n"
+        with self._lock:
+            # Update the ledger first so a lazy rebuild from the chat log
+            # cannot count this record twice.
+            self.triggers.observe(user_id, record)
+            path = self._path(user_id)
+            entry = self._cache.get(user_id)
+            if entry is not None and entry[0] != _signature(path):
+                # File changed behind our back; reload on next read.
+                self._cache.pop(user_id, None)
+                entry = None
+            if entry is not None:
+                entry[1].append(record)
+            self._pending.setdefault(user_id, []).append(line)
+            if self.group_commit_s <= 0:
+                self._flush_user(user_id)
+            else:
+                self._ensure_writer()
+                self._wake.notify()
         return record
 
+    def _ensure_writer(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            return
+        if self._writer is None:
+            atexit.register(self.close)
+        self._closing = False
+        self._writer = threading.Thread(target=self._writer_loop, name="chat-history-writer", daemon=True)
+        self._writer.start()
+
+    def _writer_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._pending and not self._closing:
+                    # Wake up for files the last batch left without an fsync.
+                    if not self._wake.wait(self._fsync_due_in()):
+                        break
+                if self._closing and not self._pending:
+                    return
+                has_pending = bool(self._pending)
+            if has_pending:
+                # Let more appends join this batch before writing.
+                time.sleep(self.group_commit_s)
+                self._drain()
+            self._sync_dirty()
+
+    def _drain(self) -> None:
+        """Write every pending batch, outside the store lock."""
+        with self._lock:
+            batches = self._pending
+            self._pending = {}
+            self._writing.update(batches)
+        try:
+            for user_id, lines in batches.items():
+                try:
+                    self._write_batch(user_id, lines)
+                except Exception as exc:
+                    print(f"[chat_history] flush failed user={user_id}: {exc}")
+        finally:
+            with self._lock:
+                self._writing.difference_update(batches)
+                self._written.notify_all()
+
+    def _flush_user(self, user_id: str) -> None:
+        # Called with the store lock held. Wait for a batch the writer is
+        # still writing, so this user's lines reach the file in order.
+        while user_id in self._writing:
+            self._written.wait()
+        lines = self._pending.pop(user_id, None)
+        if lines:
+            self._write_batch(user_id, lines)
+
+    def _write_batch(self, user_id: str, lines: List[str]) -> None:
+        data = "".join(lines).encode("utf-8")
+        # The per-user file lock keeps batches from other worker processes
+        # from interleaving and serializes segment rollover.
+        with locked(self._path(user_id)):
+            path = self._path(user_id)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            before = _signature(path)
+            if before is not None and self._should_roll(user_id, path, before[1]):
+                self._roll(user_id, path)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    written = os.write(fd, view)
+                    view = view[written:]
+                if self._should_fsync(path):
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+            after = _signature(path)
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None and entry[0] == before:
+                # Cached records already include this batch (write-through) and
+                # stay valid across a roll: they are still the newest records.
+                self._cache[user_id] = (after, entry[1])
+            else:
+                self._cache.pop(user_id, None)
+
+    def _should_fsync(self, path: Path) -> bool:
+        if self.durability == "batch":
+            return True
+        if self.durability == "interval":
+            now = time.monotonic()
+            key = str(path)
+            with self._fsync_lock:
+                if now - self._last_fsync.get(key, 0.0) >= self.fsync_interval:
+                    self._last_fsync[key] = now
+                    self._dirty.pop(key, None)
+                    return True
+                self._dirty.setdefault(key, now)
+        return False
+
+    def _fsync_due_in(self) -> Optional[float]:
+        """Seconds until the next dirty file is due for fsync, or None."""
+        with self._fsync_lock:
+            if not self._dirty:
+                return None
+            due = min(self._last_fsync.get(key, 0.0) for key in self._dirty) + self.fsync_interval
+        return max(0.0, due - time.monotonic())
+
+    def _sync_dirty(self, force: bool = False) -> None:
+        """fsync files whose interval has passed (all of them with ``force``)."""
+        now = time.monotonic()
+        with self._fsync_lock:
+            keys = [k for k in self._dirty if force or now - self._last_fsync.get(k, 0.0) >= self.fsync_interval]
+            for key in keys:
+                self._dirty.pop(key, None)
+                self._last_fsync[key] = now
+        for key in keys:
+            try:
+                fd = os.open(key, os.O_WRONLY | os.O_APPEND)
+            except FileNotFoundError:
+                continue  # rolled into an archive segment meanwhile
+            try:
+                os.fsync(fd)
+            except OSError as exc:
+                print(f"[chat_history] fsync failed {key}: {exc}")
+            finally:
+                os.close(fd)
+
+    def flush(self, user_id: Optional[str] = None) -> None:
+        """Write pending appends (for one user, or everyone) to disk now."""
+        with self._lock:
+            if user_id is not None:
+                self._flush_user(user_id)
+                return
+            for uid in set(self._pending) | set(self._writing):
+                self._flush_user(uid)
+
+    def close(self) -> None:
+        """Flush pending appends and stop the background writer."""
+        with self._lock:
+            self._closing = True
+            self._wake.notify_all()
+            writer = self._writer
+        if writer is not None and writer is not threading.current_thread():
+            writer.join(timeout=5)
+        self.flush()
+        self._sync_dirty(force=True)
+
+    async def aload(self, user_id: str, limit: int = 200, visible_only: bool = False) -> List[Dict[str, Any]]:
+        """``load`` on the I/O executor, for use inside the event loop."""
+        return await run_io(self.load, user_id, limit, visible_only)
+
+    async def aappend(self, user_id: str, role: str, content: str, **kwargs: Any) -> Dict[str, Any]:
+        """``append`` on the I/O executor, for use inside the event loop."""
+        return await run_io(self.append, user_id, role, content, **kwargs)
+
+    async def aload_page(self, user_id: str, limit: int = 100, **kwargs: Any) -> List[Dict[str, Any]]:
+        return await run_io(self.load_page, user_id, limit, **kwargs)
+
     def to_messages(
         self,
         history: List[Dict[str, Any]],
@@ -66,3 +795,18 @@ class ChatHistoryStore:
             msgs.append({"role": role, "content": str(content)})
         return msgs
 
+
+def create_chat_store(backend: Optional[str] = None) -> Any:
+    """Build the history store selected by ``backend`` / CHAT_HISTORY_BACKEND."""
+    backend = (backend or CHAT_BACKEND).lower()
+    if backend == "sqlite":
+        from .chat_history_sqlite import SQLiteChatHistoryStore
+
+        return SQLiteChatHistoryStore()
+    if backend != "jsonl":
+        raise ValueError(f"unknown chat history backend: {backend}")
+    return ChatHistoryStore()
+
+
+# Process-wide store shared by the API routes and all agents.
+chat_store = create_chat_store()
@@ -0,0 +1,339 @@
+"""SQLite (WAL) backend for chat history with indexed queries.
+
+Select it with ``CHAT_HISTORY_BACKEND=sqlite``. Existing JSONL histories can
+be imported once with::
+
+    python -m backend.chat_history_sqlite migrate [--user USER_ID] [--force]
+"""
+import argparse
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from . import json_codec
+from .chat_history import CHAT_DIR, DATA_DIR, ChatHistoryStore, _epoch, _record_trigger
+from .data_paths import iter_user_ids
+from .io_executor import run_io
+
+DB_PATH = Path(os.getenv("CHAT_HISTORY_DB", str(DATA_DIR / "chat_history.sqlite3")))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    ts_epoch REAL,
+    role TEXT NOT NULL,
+    content TEXT,
+    visible INTEGER NOT NULL DEFAULT 1,
+    source TEXT,
+    trigger_type TEXT,
+    trigger_id TEXT,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_user_id ON messages(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_user_ts ON messages(user_id, ts);
+CREATE INDEX IF NOT EXISTS idx_messages_user_role ON messages(user_id, role, id);
+CREATE INDEX IF NOT EXISTS idx_messages_user_visible ON messages(user_id, visible, id);
+CREATE INDEX IF NOT EXISTS idx_messages_triggers ON messages(user_id, id) WHERE trigger_type IS NOT NULL;
+"""
+# Needs ts_epoch, which older databases only get in _init_schema.
+_EPOCH_INDEX = """
+DROP INDEX IF EXISTS idx_messages_user_trigger;
+CREATE INDEX IF NOT EXISTS idx_messages_user_trigger_epoch ON messages(user_id, trigger_type, ts_epoch);
+"""
+
+_COLUMNS = "id, ts, role, content, visible, source, meta"
+
+
+def _row_to_record(row: sqlite3.Row) -> Dict[str, Any]:
+    try:
+        meta = json_codec.loads(row["meta"]) if row["meta"] else {}
+    except Exception:
+        meta = {}
+    return {
+        "id": row["id"],
+        "ts": row["ts"],
+        "role": row["role"],
+        "content": row["content"],
+        "visible": bool(row["visible"]),
+        "source": row["source"],
+        "meta": meta,
+    }
+
+
+class _SQLiteTriggerIndex:
+    """Trigger ledger queries answered from the ``trigger_type`` index."""
+
+    def __init__(self, store: "SQLiteChatHistoryStore") -> None:
+        self._store = store
+
+    def recent_types(self, user_id: str, limit: int = 3, unique: bool = False) -> List[str]:
+        types: List[str] = []
+        if limit <= 0:
+            return types
+        cur = self._store._conn().execute(
+            "SELECT trigger_type FROM messages WHERE user_id = ? AND trigger_type IS NOT NULL ORDER BY id DESC",
+            (user_id,),
+        )
+        for (trigger_type,) in cur:
+            if unique and trigger_type in types:
+                continue
+            types.append(trigger_type)
+            if len(types) >= limit:
+                break
+        cur.close()
+        return types
+
+    def count(self, user_id: str, trigger_type: str, last_k: int = 10) -> int:
+        row = self._store._conn().execute(
+            "SELECT COUNT(*) FROM (SELECT trigger_type FROM messages WHERE user_id = ? AND trigger_type IS NOT NULL"
+            " ORDER BY id DESC LIMIT ?) WHERE trigger_type = ?",
+            (user_id, max(0, last_k), trigger_type),
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    def fired_within(self, user_id: str, trigger_type: str, seconds: float, now: Optional[float] = None) -> bool:
+        # Compare epochs: ISO strings with different UTC offsets do not sort by time.
+        cutoff = (now if now is not None else datetime.now(timezone.utc).timestamp()) - seconds
+        row = self._store._conn().execute(
+            "SELECT 1 FROM messages WHERE user_id = ? AND trigger_type = ? AND ts_epoch >= ? LIMIT 1",
+            (user_id, trigger_type, cutoff),
+        ).fetchone()
+        return row is not None
+
+
+class SQLiteChatHistoryStore:
+    """Drop-in replacement for ``ChatHistoryStore`` backed by one SQLite file."""
+
+    to_messages = ChatHistoryStore.to_messages
+
+    def __init__(self, db_path: Path = DB_PATH) -> None:
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self.triggers = _SQLiteTriggerIndex(self)
+        self._init_schema()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.executescript(_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+            if "ts_epoch" not in columns:
+                conn.execute("ALTER TABLE messages ADD COLUMN ts_epoch REAL")
+                rows = conn.execute("SELECT id, ts FROM messages").fetchall()
+                conn.executemany("UPDATE messages SET ts_epoch = ? WHERE id = ?", [(_epoch(ts), i) for i, ts in rows])
+            conn.executescript(_EPOCH_INDEX)
+
+    def load(self, user_id: str, limit: int = 200, visible_only: bool = False) -> List[Dict[str, Any]]:
+        if limit <= 0:
+            return []
+        where = "user_id = ? AND visible = 1" if visible_only else "user_id = ?"
+        rows = self._conn().execute(
+            f"SELECT {_COLUMNS} FROM messages WHERE {where} ORDER BY id DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+        return [_row_to_record(r) for r in reversed(rows)]
+
+    def load_page(
+        self,
+        user_id: str,
+        limit: int = 100,
+        *,
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        visible_only: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """One page of records, oldest first; cursors are a record id or ts."""
+        if limit <= 0:
+            return []
+        clauses = ["user_id = ?"]
+        params: List[Any] = [user_id]
+        if visible_only:
+            clauses.append("visible = 1")
+        for cursor, op in ((before, "<"), (after, ">")):
+            if cursor is None:
+                continue
+            if str(cursor).isdigit():
+                clauses.append(f"id {op} ?")
+                params.append(int(cursor))
+            else:
+                clauses.append(f"ts {op} ?")
+                params.append(str(cursor))
+        order = "ASC" if after is not None and before is None else "DESC"
+        rows = self._conn().execute(
+            f"SELECT {_COLUMNS} FROM messages WHERE {' AND '.join(clauses)} ORDER BY id {order} LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        if order == "DESC":
+            rows.reverse()
+        return [_row_to_record(r) for r in rows]
+
+    def version_tag(self, user_id: str) -> str:
+        # Rows are append-only, so the newest id marks the tail of the log.
+        row = self._conn().execute(
+            "SELECT id FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT 1", (user_id,)
+        ).fetchone()
+        return str(row[0] if row else 0)
+
+    def recent_contents(self, user_id: str, role: str, lookback: int = 5) -> List[Any]:
+        rows = self._conn().execute(
+            "SELECT content FROM messages WHERE user_id = ? AND role = ? ORDER BY id DESC LIMIT ?",
+            (user_id, role, lookback),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def iter_history(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        cur = self._conn().execute(f"SELECT {_COLUMNS} FROM messages WHERE user_id = ? ORDER BY id", (user_id,))
+        for row in cur:
+            yield _row_to_record(row)
+
+    def _last_trigger_key(self, conn: sqlite3.Connection, user_id: str) -> Optional[tuple]:
+        row = conn.execute(
+            "SELECT trigger_id, trigger_type FROM messages WHERE user_id = ? AND trigger_type IS NOT NULL"
+            " ORDER BY id DESC LIMIT 1",
+            (user_id,),
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _insert(self, conn: sqlite3.Connection, user_id: str, records: Iterable[Dict[str, Any]]) -> int:
+        count = 0
+        last_key = self._last_trigger_key(conn, user_id)
+        for record in records:
+            meta = record.get("meta") or {}
+            trigger_type = _record_trigger(record)
+            trigger_id = meta.get("trigger_id") if isinstance(meta, dict) else None
+            # The inject and the assistant reply of one fire count once.
+            if trigger_type and trigger_id and last_key == (trigger_id, trigger_type):
+                trigger_type = None
+            elif trigger_type:
+                last_key = (trigger_id, trigger_type)
+            content = record.get("content")
+            ts = str(record.get("ts") or datetime.now(timezone.utc).isoformat())
+            conn.execute(
+                "INSERT INTO messages (user_id, ts, ts_epoch, role, content, visible, source, trigger_type, trigger_id, meta)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    user_id,
+                    ts,
+                    _epoch(ts),
+                    record.get("role") or "user",
+                    content if content is None or isinstance(content, str) else json_codec.dumps(content),
+                    1 if record.get("visible", True) else 0,
+                    record.get("source"),
+                    trigger_type,
+                    trigger_id,
+                    json_codec.dumps(meta),
+                ),
+            )
+            count += 1
+        return count
+
+    def append(
+        self,
+        user_id: str,
+        role: str,
+        content: str,
+        *,
+        visible: bool = True,
+        source: str = "user",
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        record: Dict[str, Any] = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "role": role,
+            "content": content,
+            "visible": visible,
+            "source": source,
+            "meta": meta or {},
+        }
+        conn = self._conn()
+        with self._write_lock, conn:
+            self._insert(conn, user_id, [record])
+        return record
+
+    def has_user(self, user_id: str) -> bool:
+        row = self._conn().execute("SELECT 1 FROM messages WHERE user_id = ? LIMIT 1", (user_id,)).fetchone()
+        return row is not None
+
+    def import_records(self, user_id: str, records: Iterable[Dict[str, Any]], replace: bool = False) -> int:
+        conn = self._conn()
+        with self._write_lock, conn:
+            if replace:
+                conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+            return self._insert(conn, user_id, records)
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        return None
+
+    def flush(self, user_id: Optional[str] = None) -> None:
+        return None
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    async def aload(self, user_id: str, limit: int = 200, visible_only: bool = False) -> List[Dict[str, Any]]:
+        return await run_io(self.load, user_id, limit, visible_only)
+
+    async def aappend(self, user_id: str, role: str, content: str, **kwargs: Any) -> Dict[str, Any]:
+        return await run_io(self.append, user_id, role, content, **kwargs)
+
+    async def aload_page(self, user_id: str, limit: int = 100, **kwargs: Any) -> List[Dict[str, Any]]:
+        return await run_io(self.load_page, user_id, limit, **kwargs)
+
+
+def _jsonl_users() -> List[str]:
+    return sorted(u for u in iter_user_ids(CHAT_DIR, ".jsonl") if not u.endswith(".triggers"))
+
+
+def migrate_jsonl(db_path: Path = DB_PATH, users: Optional[List[str]] = None, force: bool = False) -> Dict[str, int]:
+    """Copy JSONL histories (sealed + hot segments) into SQLite.
+
+    Users that already have rows are skipped unless ``force`` is set, in
+    which case their rows are replaced.
+    """
+    source = ChatHistoryStore(group_commit_ms=0)
+    target = SQLiteChatHistoryStore(db_path)
+    result: Dict[str, int] = {}
+    for user_id in users or _jsonl_users():
+        if not force and target.has_user(user_id):
+            print(f"[migrate] skip user={user_id} (already in {db_path})")
+            continue
+        result[user_id] = target.import_records(user_id, source.iter_history(user_id), replace=force)
+        print(f"[migrate] user={user_id} records={result[user_id]}")
+    target.close()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chat history SQLite backend tools.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    mig = sub.add_parser("migrate", help="Import existing JSONL chat histories.")
+    mig.add_argument("--db", default=str(DB_PATH), help="Target SQLite file.")
+    mig.add_argument("--user", action="append", help="Only migrate this user (repeatable).")
+    mig.add_argument("--force", action="store_true", help="Replace rows of users already migrated.")
+    args = parser.parse_args()
+    if args.cmd == "migrate":
+        migrate_jsonl(Path(args.db), users=args.user, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
 ﻿"""Coze client helper providing SSE streaming compatible with specified payload."""
-import json
+import asyncio
 import os
 from pathlib import Path
-from typing import Any, AsyncIterator, Tuple
+from typing import Any, AsyncIterator, Optional, Tuple
 
 import httpx
 from dotenv import load_dotenv
 
+from . import json_codec
+from .llm_scheduler import llm_scheduler
+
+try:
+    import h2  # noqa: F401  # enables httpx HTTP/2
+except ImportError:  # optional
+    h2 = None  # type: ignore[assignment]
+
 ENV_PATH = Path(__file__).resolve().parent / ".env"
 CONFIG_PATH = Path(__file__).resolve().parent / "config.json"
 TOKEN_PATH = Path(__file__).resolve().parent.parent / "token.txt"
@@ -23,7 +31,7 @@ def _load_config_json() -> dict:
     if not CONFIG_PATH.exists():
         return {}
     try:
-        return json.loads(CONFIG_PATH.read_text(encoding="utf-8"))
+        return json_codec.loads(CONFIG_PATH.read_text(encoding="utf-8"))
     except Exception:
         # Ignore config parse errors; fall back to other sources.
         return {}
@@ -46,6 +54,67 @@ COZE_TOKEN = os.getenv("COZE_TOKEN") or _CONFIG.get("COZE_TOKEN") or _FILE_TOKEN
 COZE_PROJECT_ID = str(os.getenv("COZE_PROJECT_ID") or _CONFIG.get("COZE_PROJECT_ID") or DEFAULT_COZE_PROJECT_ID).strip()
 COZE_DEBUG = os.getenv("COZE_DEBUG", "false").lower() == "true"
 
+# Shared connection pool: one client per process, opened at app startup.
+COZE_MAX_CONNECTIONS = int(os.getenv("COZE_MAX_CONNECTIONS", "20"))
+COZE_MAX_KEEPALIVE = int(os.getenv("COZE_MAX_KEEPALIVE", "10"))
+COZE_KEEPALIVE_EXPIRY = float(os.getenv("COZE_KEEPALIVE_EXPIRY", "60"))
+COZE_HTTP2 = os.getenv("COZE_HTTP2", "true").lower() == "true" and h2 is not None
+# Per-phase timeouts (seconds); read is the longest allowed gap between SSE chunks.
+COZE_CONNECT_TIMEOUT = float(os.getenv("COZE_CONNECT_TIMEOUT", "30"))
+COZE_READ_TIMEOUT = float(os.getenv("COZE_READ_TIMEOUT", "60"))
+COZE_WRITE_TIMEOUT = float(os.getenv("COZE_WRITE_TIMEOUT", "30"))
+COZE_POOL_TIMEOUT = float(os.getenv("COZE_POOL_TIMEOUT", "10"))
+# Before yielding Done, read the rest of the body for up to this long so the
+# connection goes back to the pool instead of being closed.
+COZE_DRAIN_TIMEOUT = float(os.getenv("COZE_DRAIN_TIMEOUT", "2"))
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=COZE_HTTP2,
+        limits=httpx.Limits(
+            max_connections=COZE_MAX_CONNECTIONS,
+            max_keepalive_connections=COZE_MAX_KEEPALIVE,
+            keepalive_expiry=COZE_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=COZE_CONNECT_TIMEOUT,
+            read=COZE_READ_TIMEOUT,
+            write=COZE_WRITE_TIMEOUT,
+            pool=COZE_POOL_TIMEOUT,
+        ),
+    )
+
+
+def get_coze_client() -> httpx.AsyncClient:
+    """Process-wide client; created lazily for scripts that skip app startup.
+
+    Pooled connections belong to one event loop, so a client opened under a
+    previous ``asyncio.run`` is replaced rather than reused.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = _build_client()
+        _client_loop = loop
+    return _client
+
+
+async def start_coze_client() -> None:
+    get_coze_client()
+    if COZE_DEBUG:
+        print(f"[coze] client ready http2={COZE_HTTP2} max_connections={COZE_MAX_CONNECTIONS}")
+
+
+async def close_coze_client() -> None:
+    global _client, _client_loop
+    client, _client, _client_loop = _client, None, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
 
 def _auth_header() -> str:
     """Return Authorization header value with Bearer prefix."""
@@ -59,6 +128,18 @@ def _auth_header() -> str:
     return f"Bearer {token}"
 
 
+async def _drain(lines: AsyncIterator[str]) -> None:
+    """Consume what is left of a finished stream so its connection can be reused."""
+    async def consume() -> None:
+        async for _ in lines:
+            pass
+
+    try:
+        await asyncio.wait_for(consume(), COZE_DRAIN_TIMEOUT)
+    except Exception:
+        pass  # the connection is closed instead of pooled
+
+
 def _env_ready() -> bool:
     return bool(COZE_ENDPOINT and _auth_header() and COZE_PROJECT_ID)
 
@@ -86,7 +167,7 @@ def _parse_data(data_str: str) -> Any:
     if not data_str:
         return ""
     try:
-        return json.loads(data_str)
+        return json_codec.loads(data_str)
     except ValueError:
         return data_str
 
@@ -131,13 +212,14 @@ async def coze_stream(user_text: str) -> AsyncIterator[Tuple[str, Any]]:
         "Content-Type": "application/json",
         "Authorization": _auth_header(),
     }
-    timeout = httpx.Timeout(60.0, connect=30.0)
     payload = _payload(user_text)
     if COZE_DEBUG:
         masked_auth = (_auth_header()[:12] + "...") if _auth_header() else "<missing>"
         print(f"[coze] POST {COZE_ENDPOINT} project={COZE_PROJECT_ID} auth={masked_auth} text={user_text}")
 
-    async with httpx.AsyncClient(timeout=timeout) as client:
+    client = get_coze_client()
+    # The slot is held for the whole stream, i.e. one upstream connection.
+    async with llm_scheduler.slot("coze"):
         async with client.stream(
             "POST", COZE_ENDPOINT, headers=headers, json=payload
         ) as response:
@@ -153,7 +235,8 @@ async def coze_stream(user_text: str) -> AsyncIterator[Tuple[str, Any]]:
             event_name = "message"
             data_lines = []
 
-            async for raw_line in response.aiter_lines():
+            lines = response.aiter_lines()
+            async for raw_line in lines:
                 line = raw_line.strip()
                 if line and COZE_DEBUG:
                     print(f"[coze][raw] {line}")
@@ -177,11 +260,14 @@ async def coze_stream(user_text: str) -> AsyncIterator[Tuple[str, Any]]:
                         text = _extract_message_text(parsed)
                         if text:
                             yield "Message", text
+                        # Drain first: callers stop iterating at Done.
+                        await _drain(lines)
                         yield "Done", parsed
                         return
                     elif canonical == "interrupt":
                         yield "Interrupt", parsed
                     elif canonical == "done":
+                        await _drain(lines)
                         yield "Done", parsed
                         return
                     else:
@@ -208,11 +294,13 @@ async def coze_stream(user_text: str) -> AsyncIterator[Tuple[str, Any]]:
                     text = _extract_message_text(parsed)
                     if text:
                         yield "Message", text
+                    await _drain(lines)
                     yield "Done", parsed
                     return
                 elif canonical == "interrupt":
                     yield "Interrupt", parsed
                 elif canonical == "done":
+                    await _drain(lines)
                     yield "Done", parsed
                 else:
                     yield event_name or "message", parsed
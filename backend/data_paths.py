@@ -0,0 +1,114 @@
+"""Per-user path resolution for the file-based stores.
+
+Every per-user entry (``users/{user_id}/``, ``profiles/{user_id}.json``,
+``state/chat_history/{user_id}.jsonl`` ...) lives under a two-level hash
+shard of its base directory::
+
+    users/3f/a2/u_demo_young_male/
+    profiles/3f/a2/u_demo_young_male.json
+
+The shard is the first four hex digits of ``sha1(user_id)``, so no
+directory holds more than a few hundred entries even at 100k+ users.
+
+Entries still in the old flat layout keep resolving to their flat path
+until ``python -m backend.migrate_layout`` moves them; new users are
+created sharded. ``DATA_LAYOUT=flat`` turns sharding off entirely.
+"""
+import hashlib
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, Set, Tuple
+
+SHARDED = os.getenv("DATA_LAYOUT", "sharded").lower() != "flat"
+_SEEN_MAX = 65536
+
+# Entries known to be in the sharded layout; migration only ever moves
+# flat -> sharded, so a positive answer never goes stale.
+_sharded_seen: Set[Tuple[str, str, str]] = set()
+_seen_lock = threading.Lock()
+
+
+@lru_cache(maxsize=65536)
+def shard(user_id: str) -> Tuple[str, str]:
+    digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+    return digest[:2], digest[2:4]
+
+
+def flat_path(base: Path, user_id: str, suffix: str = "") -> Path:
+    return base / f"{user_id}{suffix}"
+
+
+def sharded_path(base: Path, user_id: str, suffix: str = "") -> Path:
+    first, second = shard(user_id)
+    return base / first / second / f"{user_id}{suffix}"
+
+
+def user_path(base: Path, user_id: str, suffix: str = "") -> Path:
+    """Current location of ``{user_id}{suffix}`` under ``base`` (file or directory)."""
+    if not SHARDED:
+        return flat_path(base, user_id, suffix)
+    key = (str(base), user_id, suffix)
+    target = sharded_path(base, user_id, suffix)
+    if key in _sharded_seen:
+        return target
+    if target.exists():
+        with _seen_lock:
+            if len(_sharded_seen) >= _SEEN_MAX:
+                _sharded_seen.clear()
+            _sharded_seen.add(key)
+        return target
+    legacy = flat_path(base, user_id, suffix)
+    if legacy.exists():
+        return legacy
+    return target
+
+
+def iter_user_ids(base: Path, suffix: str = "") -> Iterator[str]:
+    """User ids with an entry under ``base`` in either layout (unsorted, deduped)."""
+    if not base.exists():
+        return
+    seen: Set[str] = set()
+
+    def _uid(entry: Path) -> str:
+        if suffix:
+            return entry.name[: -len(suffix)] if entry.name.endswith(suffix) else ""
+        return entry.name if entry.is_dir() else ""
+
+    for entry in base.iterdir():
+        if is_shard_name(entry.name) and entry.is_dir():
+            for sub in entry.iterdir():
+                if not (is_shard_name(sub.name) and sub.is_dir()):
+                    continue
+                for leaf in sub.iterdir():
+                    uid = _uid(leaf)
+                    if uid and shard(uid) == (entry.name, sub.name) and uid not in seen:
+                        seen.add(uid)
+                        yield uid
+            continue
+        uid = _uid(entry)
+        if uid and uid not in seen:
+            seen.add(uid)
+            yield uid
+
+
+def is_shard_name(name: str) -> bool:
+    return len(name) == 2 and all(c in "0123456789abcdef" for c in name)
+
+
+def lock_key(path: Path) -> str:
+    """Layout-independent identity of ``path`` (the flat form of a sharded path).
+
+    ``file_lock.locked`` uses this so a writer and the migration tool agree
+    on one lock per entry whichever layout either of them resolved.
+    """
+    parts = Path(path).resolve().parts
+    for i in range(len(parts) - 2):
+        if not (is_shard_name(parts[i]) and is_shard_name(parts[i + 1])):
+            continue
+        name = parts[i + 2]
+        candidates = [name] + [name[:pos] for pos, ch in enumerate(name) if ch == "."]
+        if any(c and shard(c) == (parts[i], parts[i + 1]) for c in candidates):
+            return str(Path(*parts[:i], *parts[i + 2:]))
+    return str(Path(*parts))
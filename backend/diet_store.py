@@ -0,0 +1,366 @@
+"""Date-indexed diet log behind ``diet_2w.json``.
+
+Each user's meals live in ``data/users/{user_id}/diet_log.jsonl``, an
+append-only journal of day changes::
+
+    {"meta": {"summary": ..., "display_hint": ...}}
+    {"date": "2025-12-15", "set": {"breakfast": "...", "est_kcal": 2800}}
+    {"date": "2025-12-15", "replace": {"breakfast": "..."}}
+    {"date": "2025-12-14", "delete": true}
+    {"prune_before": "2025-10-20"}
+
+Replaying it gives a ``date -> day`` dict, so an upsert touches one day
+and one weekly rollup (``est_kcal`` / ``est_sugar_g``) instead of scanning
+``weeks[].days[]``. ``diet_2w.json`` is now a rendered view of the latest
+weeks: it is rebuilt from the index, cached until the next write, and
+materialized through ``user_data`` (skipped when unchanged) so the static
+frontend and the agents keep reading it as before. Only the last
+``DIET_RETENTION_WEEKS`` weeks (counted from the newest day) are kept, and
+the journal is compacted once it grows well past the number of days it
+describes.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from . import json_codec
+from .file_lock import atomic_write_text, locked
+from .user_data import user_data
+
+LOG_NAME = "diet_log.jsonl"
+ROLLUP_FIELDS = ("est_kcal", "est_sugar_g")
+DEFAULT_SHOW_WEEKS = 2
+MAX_DAYS_PER_WEEK = 7
+RETENTION_WEEKS = max(DEFAULT_SHOW_WEEKS, int(os.getenv("DIET_RETENTION_WEEKS", "8")))
+DIET_CACHE_USERS = int(os.getenv("DIET_CACHE_USERS", "256"))
+
+
+def week_start_of(day: str) -> str:
+    d = date.fromisoformat(day)
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+
+def _num(value: Any) -> float:
+    if isinstance(value, bool):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    return 0.0
+
+
+class DietIndex:
+    """In-memory view of one user's journal: days by date plus weekly rollups."""
+
+    def __init__(self, user_id: str) -> None:
+        self.user_id = user_id
+        self.meta: Dict[str, Any] = {"schema_version": "1.0", "user_id": user_id, "summary": ""}
+        self.days: Dict[str, Dict[str, Any]] = {}
+        self.weeks: Dict[str, Dict[str, float]] = {}
+        self.lines = 0
+        self.rendered: Optional[Dict[str, Any]] = None
+
+    def copy(self) -> "DietIndex":
+        """Copy to apply a commit to; day dicts are replaced, never mutated, so they are shared."""
+        other = DietIndex(self.user_id)
+        other.meta = self.meta
+        other.days = dict(self.days)
+        other.weeks = {start: dict(rollup) for start, rollup in self.weeks.items()}
+        other.lines = self.lines
+        other.rendered = self.rendered
+        return other
+
+    def _rollup(self, day: Dict[str, Any], sign: int) -> None:
+        week = self.weeks.setdefault(week_start_of(day["date"]), {"days": 0, **{f: 0.0 for f in ROLLUP_FIELDS}})
+        week["days"] += sign
+        for field in ROLLUP_FIELDS:
+            week[field] += sign * _num(day.get(field))
+        if week["days"] <= 0:
+            self.weeks.pop(week_start_of(day["date"]), None)
+
+    def set_meta(self, meta: Dict[str, Any]) -> bool:
+        merged = dict(self.meta)
+        merged.update({k: v for k, v in meta.items() if k not in ("weeks", "days")})
+        if merged == self.meta:
+            return False
+        self.meta = merged
+        self.rendered = None
+        return True
+
+    def _put(self, day: Dict[str, Any]) -> bool:
+        old = self.days.get(day["date"])
+        if day == old:
+            return False
+        if old is not None:
+            self._rollup(old, -1)
+        self.days[day["date"]] = day
+        self._rollup(day, 1)
+        self.rendered = None
+        return True
+
+    def upsert(self, day_str: str, fields: Dict[str, Any]) -> bool:
+        """Merge fields into a day."""
+        old = self.days.get(day_str)
+        day = dict(old) if old is not None else {"date": day_str}
+        day.update({k: v for k, v in fields.items() if k != "date"})
+        return self._put(day)
+
+    def replace(self, day_str: str, fields: Dict[str, Any]) -> bool:
+        """Set a day to exactly ``fields``; fields not given are dropped."""
+        day = {"date": day_str}
+        day.update({k: v for k, v in fields.items() if k != "date"})
+        return self._put(day)
+
+    def delete(self, day_str: str) -> bool:
+        old = self.days.pop(day_str, None)
+        if old is None:
+            return False
+        self._rollup(old, -1)
+        self.rendered = None
+        return True
+
+    def prune(self, before: str) -> bool:
+        """Drop every day older than ``before``."""
+        stale = [d for d in self.days if d < before]
+        for day_str in stale:
+            self.delete(day_str)
+        return bool(stale)
+
+    def retention_cutoff(self) -> Optional[str]:
+        """First date kept: RETENTION_WEEKS whole weeks back from the newest day."""
+        if not self.days:
+            return None
+        newest = date.fromisoformat(week_start_of(max(self.days)))
+        return (newest - timedelta(weeks=RETENTION_WEEKS - 1)).isoformat()
+
+    def apply(self, row: Dict[str, Any]) -> bool:
+        """Apply one journal row; returns False when it changed nothing."""
+        changed = False
+        if isinstance(row.get("meta"), dict):
+            changed = self.set_meta(row["meta"]) or changed
+        if row.get("date"):
+            day_str = str(row["date"])
+            if isinstance(row.get("set"), dict):
+                changed = self.upsert(day_str, row["set"]) or changed
+            elif isinstance(row.get("replace"), dict):
+                changed = self.replace(day_str, row["replace"]) or changed
+            elif row.get("delete"):
+                changed = self.delete(day_str) or changed
+        if row.get("prune_before"):
+            changed = self.prune(str(row["prune_before"])) or changed
+        self.lines += 1
+        return changed
+
+    def render(self) -> Dict[str, Any]:
+        """The ``diet_2w`` document: latest ``show_weeks`` weeks, oldest first."""
+        if self.rendered is not None:
+            return self.rendered
+        hint = self.meta.get("display_hint") or {}
+        try:
+            show = int(hint.get("show_weeks") or DEFAULT_SHOW_WEEKS)
+        except (TypeError, ValueError, AttributeError):
+            show = DEFAULT_SHOW_WEEKS
+        starts = sorted(self.weeks)[-show:]
+        weeks = []
+        for start in starts:
+            # Direct date lookups: at most 7 per rendered week.
+            first = date.fromisoformat(start)
+            days = []
+            for i in range(MAX_DAYS_PER_WEEK):
+                key = (first + timedelta(days=i)).isoformat()
+                if key in self.days:
+                    days.append(self.days[key])
+            rollup = self.weeks[start]
+            week: Dict[str, Any] = {"week_start": start, "days": days}
+            for field in ROLLUP_FIELDS:
+                week[field] = round(rollup[field], 1)
+            weeks.append(week)
+        doc = dict(self.meta)
+        doc["weeks"] = weeks
+        self.rendered = doc
+        return doc
+
+    def snapshot_rows(self) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = [{"meta": self.meta}]
+        for day_str in sorted(self.days):
+            fields = {k: v for k, v in self.days[day_str].items() if k != "date"}
+            rows.append({"date": day_str, "set": fields})
+        return rows
+
+
+def _doc_days(doc: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """(days, week starts) listed in a ``diet_2w`` document."""
+    days: List[Dict[str, Any]] = []
+    starts: List[str] = []
+    for week in doc.get("weeks") or []:
+        if not isinstance(week, dict):
+            continue
+        try:
+            if week.get("week_start"):
+                starts.append(week_start_of(str(week["week_start"])))
+        except ValueError:
+            pass
+        for day in week.get("days") or []:
+            if isinstance(day, dict) and day.get("date"):
+                try:
+                    starts.append(week_start_of(str(day["date"])))
+                except ValueError:
+                    continue
+                days.append(day)
+    return days, starts
+
+
+def _rows_from_doc(doc: Dict[str, Any], mode: str = "set") -> List[Dict[str, Any]]:
+    """Journal rows for the days of a ``diet_2w`` document (``set`` merges, ``replace`` overwrites)."""
+    rows: List[Dict[str, Any]] = [{"meta": {k: v for k, v in doc.items() if k != "weeks"}}]
+    for day in _doc_days(doc)[0]:
+        rows.append({"date": str(day["date"]), mode: {k: v for k, v in day.items() if k != "date"}})
+    return rows
+
+
+class DietStore:
+    """Per-user diet indexes, validated against the journal's stat signature."""
+
+    def __init__(self, cache_users: int = DIET_CACHE_USERS) -> None:
+        self.cache_users = max(0, cache_users)
+        # Cached indexes are never modified; a commit publishes a new one.
+        self._cache: "OrderedDict[str, Tuple[Optional[Tuple[int, int]], DietIndex]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _log_path(self, user_id: str) -> Path:
+        return user_data.user_dir(user_id) / LOG_NAME
+
+    def _signature(self, path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _remember(self, user_id: str, sig: Optional[Tuple[int, int]], index: DietIndex) -> None:
+        if self.cache_users <= 0:
+            return
+        with self._lock:
+            self._cache[user_id] = (sig, index)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_users:
+                self._cache.popitem(last=False)
+
+    def _replay(self, user_id: str, path: Path) -> DietIndex:
+        index = DietIndex(user_id)
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        index.apply(json_codec.loads(line))
+                    except Exception:
+                        continue
+        except FileNotFoundError:
+            pass
+        return index
+
+    def _index(self, user_id: str) -> DietIndex:
+        """Current index; must be called with the journal lock held for writes."""
+        path = self._log_path(user_id)
+        sig = self._signature(path)
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None and entry[0] == sig:
+                self._cache.move_to_end(user_id)
+                return entry[1]
+        if sig is None:
+            # First use: seed the journal from the existing diet_2w.json.
+            with locked(path):
+                path = self._log_path(user_id)
+                if self._signature(path) is None:
+                    seed = user_data.load(user_id, "diet_2w")
+                    if seed:
+                        self._write_snapshot(path, _rows_from_doc(seed))
+            sig = self._signature(path)
+        index = self._replay(user_id, path)
+        self._remember(user_id, sig, index)
+        return index
+
+    def _write_snapshot(self, path: Path, rows: Iterable[Dict[str, Any]]) -> None:
+        atomic_write_text(path, "".join(json_codec.dumps(r) + "\n" for r in rows))
+
+    def _commit(self, user_id: str, rows: Union[List[Dict[str, Any]], Callable[[DietIndex], List[Dict[str, Any]]]]) -> bool:
+        """Append rows to the journal, update the index and re-render diet_2w.json."""
+        with locked(self._log_path(user_id)):
+            path = self._log_path(user_id)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            current = self._index(user_id)
+            if callable(rows):
+                # Rows that depend on the current index are built under the journal lock.
+                rows = rows(current)
+            # Work on a copy: if the write below fails, readers keep the persisted state.
+            index = current.copy()
+            changed = [row for row in rows if index.apply(row)]
+            cutoff = index.retention_cutoff()
+            if cutoff is not None and min(index.days) < cutoff:
+                prune = {"prune_before": cutoff}
+                index.apply(prune)
+                changed.append(prune)
+            if not changed:
+                return False
+            if index.lines > max(64, 4 * (len(index.days) + 1)):
+                snapshot = index.snapshot_rows()
+                self._write_snapshot(path, snapshot)
+                index.lines = len(snapshot)
+            else:
+                with path.open("a", encoding="utf-8") as f:
+                    f.write("".join(json_codec.dumps(r) + "\n" for r in changed))
+            self._remember(user_id, self._signature(path), index)
+            return user_data.write(user_id, "diet_2w", index.render())
+
+    def upsert_day(self, user_id: str, day: str, fields: Dict[str, Any]) -> bool:
+        """Merge fields (meals, tags, est_kcal ...) into one day. Returns True if diet_2w changed."""
+        return self._commit(user_id, [{"date": day, "set": fields}])
+
+    def replace_from_doc(self, user_id: str, doc: Dict[str, Any]) -> bool:
+        """Make the weeks covered by a full diet_2w document match it exactly.
+
+        Days in those weeks that the document leaves out are deleted and
+        listed days lose fields it drops; older weeks are kept.
+        """
+        days, starts = _doc_days(doc)
+
+        def rows(index: DietIndex) -> List[Dict[str, Any]]:
+            out = _rows_from_doc(doc, "replace")
+            if starts:
+                first = min(starts)
+                last = (date.fromisoformat(max(starts)) + timedelta(days=MAX_DAYS_PER_WEEK)).isoformat()
+                listed = {str(d["date"]) for d in days}
+                out.extend({"date": d, "delete": True} for d in sorted(index.days) if first <= d < last and d not in listed)
+            return out
+
+        return self._commit(user_id, rows)
+
+    def merge_from_doc(self, user_id: str, doc: Dict[str, Any]) -> bool:
+        """Merge the days of a partial diet_2w document (an incremental sync) into the index."""
+        return self._commit(user_id, _rows_from_doc(doc))
+
+    def get_day(self, user_id: str, day: str) -> Optional[Dict[str, Any]]:
+        index = self._index(user_id)
+        with self._lock:
+            return index.days.get(day)
+
+    def week_rollup(self, user_id: str, week_start: str) -> Optional[Dict[str, float]]:
+        index = self._index(user_id)
+        with self._lock:
+            rollup = index.weeks.get(week_start)
+            return dict(rollup) if rollup else None
+
+    def render(self, user_id: str) -> Dict[str, Any]:
+        """Rendered diet_2w document (shared; do not mutate)."""
+        index = self._index(user_id)
+        with self._lock:
+            return index.render()
+
+
+diet_store = DietStore()
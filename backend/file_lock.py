@@ -0,0 +1,250 @@
+"""Cross-process file locking and atomic writes for the file-based stores.
+
+Every store that does read-modify-write on shared files goes through these
+helpers so the API can run with several uvicorn workers:
+
+- ``locked(path)``: exclusive advisory lock tied to ``path`` (re-entrant
+  within a thread, exclusive across threads and processes).
+- ``atomic_write_text`` / ``atomic_write_json``: temp file + ``os.replace``,
+  so readers never see a half-written file.
+- ``update_json(path, mutate, default)``: locked read-modify-write.
+- ``ProcessLock``: non-blocking named lock for "only one worker runs this".
+- ``sweep_locks()``: delete idle lock files under ``data/state/locks``.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from . import json_codec
+from .data_paths import lock_key
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+try:
+    import msvcrt
+except ImportError:  # POSIX
+    msvcrt = None  # type: ignore[assignment]
+
+LOCK_DIR = Path(__file__).resolve().parent / "data" / "state" / "locks"
+# sweep_locks() only removes lock files created at least this long ago.
+LOCK_SWEEP_AGE_SECONDS = float(os.getenv("LOCK_SWEEP_AGE_SECONDS", "3600"))
+
+_registry_lock = threading.Lock()
+# key -> [RLock, threads using or waiting for it]; entries go away when unused.
+_thread_locks: Dict[str, List[Any]] = {}
+_held = threading.local()
+
+
+def _lock_file(key: str) -> Path:
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+    return LOCK_DIR / f"{digest}.lock"
+
+
+def _os_lock(fd: int, blocking: bool = True) -> bool:
+    if fcntl is not None:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+            return True
+        except BlockingIOError:
+            return False
+    if msvcrt is not None:
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.01)
+    return True
+
+
+def _os_unlock(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def _open_lock(key: str) -> int:
+    LOCK_DIR.mkdir(parents=True, exist_ok=True)
+    return os.open(_lock_file(key), os.O_RDWR | os.O_CREAT, 0o644)
+
+
+def _is_current(fd: int, path: Path) -> bool:
+    """True if ``fd`` is still the file at ``path`` (not swept meanwhile)."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    fst = os.fstat(fd)
+    return (st.st_dev, st.st_ino) == (fst.st_dev, fst.st_ino)
+
+
+def _acquire(key: str, blocking: bool = True) -> Optional[int]:
+    """Open and lock the lock file of ``key``; None if busy and not blocking."""
+    while True:
+        fd = _open_lock(key)
+        if not _os_lock(fd, blocking):
+            os.close(fd)
+            return None
+        if _is_current(fd, _lock_file(key)):
+            return fd
+        # sweep_locks() unlinked the file while we waited; lock the new one.
+        _os_unlock(fd)
+        os.close(fd)
+
+
+def sweep_locks(max_age: float = LOCK_SWEEP_AGE_SECONDS) -> int:
+    """Delete lock files older than ``max_age`` that nobody holds; returns the count.
+
+    A file is only unlinked while we hold its lock, and lockers re-check
+    after locking that their file is still the one at the path, so a sweep
+    can run alongside live workers.
+    """
+    cutoff = time.time() - max_age
+    try:
+        paths = list(LOCK_DIR.glob("*.lock"))
+    except OSError:
+        return 0
+    removed = 0
+    for path in paths:
+        try:
+            if path.stat().st_mtime > cutoff:
+                continue
+            fd = os.open(path, os.O_RDWR)
+        except OSError:
+            continue
+        try:
+            if not _os_lock(fd, blocking=False):
+                continue
+            try:
+                if fcntl is not None and _is_current(fd, path):
+                    path.unlink()
+                    removed += 1
+            finally:
+                _os_unlock(fd)
+        finally:
+            os.close(fd)
+        if fcntl is None:
+            # Windows refuses to delete a file another process has open.
+            try:
+                path.unlink()
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+@contextmanager
+def locked(path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on ``path`` for the duration of the block."""
+    key = lock_key(path)
+    with _registry_lock:
+        entry = _thread_locks.setdefault(key, [threading.RLock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            depth: Dict[str, int] = getattr(_held, "depth", None) or {}
+            _held.depth = depth
+            if depth.get(key):
+                depth[key] += 1
+                try:
+                    yield
+                finally:
+                    depth[key] -= 1
+                return
+            fd = _acquire(key)
+            try:
+                depth[key] = 1
+                try:
+                    yield
+                finally:
+                    del depth[key]
+                    _os_unlock(fd)
+            finally:
+                os.close(fd)
+    finally:
+        with _registry_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _thread_locks[key]
+
+
+def atomic_write_text(path: Path, text: str, *, fsync: bool = False) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path: Path, data: Any, *, indent: Optional[int] = 2) -> None:
+    atomic_write_text(path, json_codec.dumps(data, indent=indent))
+
+
+def update_json(path: Path, mutate: Callable[[Any], Optional[Any]], default: Callable[[], Any] = dict) -> Any:
+    """Locked read-modify-write of a JSON file.
+
+    ``mutate`` gets the current document (or ``default()``) and returns the
+    document to write, or None to leave the file untouched. Returns the
+    document now on disk.
+    """
+    path = Path(path)
+    with locked(path):
+        try:
+            data = json_codec.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            data = default()
+        updated = mutate(data)
+        if updated is None:
+            return data
+        atomic_write_json(path, updated)
+        return updated
+
+
+class ProcessLock:
+    """Named lock held until released; only one process can own it."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        self._fd = _acquire(f"process:{self.name}", blocking=False)
+        return self._fd is not None
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            _os_unlock(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
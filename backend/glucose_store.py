@@ -0,0 +1,327 @@
+"""Append-only columnar glucose series per user.
+
+Each user has two flat files under ``data/glucose/``:
+
+- ``{user_id}.ts``: int64 little-endian epoch seconds
+- ``{user_id}.val``: float32 little-endian readings in mmol/L
+
+Both grow by one fixed-size record per reading and are kept sorted by
+time, so a series can be memory-mapped (``numpy.memmap``) and sliced by
+time with a binary search. Readings older than the last stored one are
+merged into place when they are appended (a full rewrite, so bulk
+backfills should be sent in one call). NumPy is listed in
+requirements.txt; without it the stdlib ``array`` module is used, series
+are read into memory and the statistics are computed in pure Python.
+"""
+import bisect
+import math
+import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone, tzinfo
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .data_paths import user_path
+from .file_lock import locked
+from .io_executor import run_io
+
+try:
+    import numpy as np
+except ImportError:  # optional speedup
+    np = None  # type: ignore[assignment]
+
+BASE_DIR = Path(__file__).resolve().parent
+GLUCOSE_DIR = BASE_DIR / "data" / "glucose"
+
+# Standard CGM target range (mmol/L).
+RANGE_LOW = float(os.getenv("GLUCOSE_RANGE_LOW", "3.9"))
+RANGE_HIGH = float(os.getenv("GLUCOSE_RANGE_HIGH", "10.0"))
+# Users whose series stay mapped/loaded; evicted series are unmapped once unreferenced.
+GLUCOSE_CACHE_USERS = int(os.getenv("GLUCOSE_CACHE_USERS", "256"))
+PERCENTILES = (10, 25, 50, 75, 90)
+
+_TS_SIZE = 8
+_VAL_SIZE = 4
+_SWAP = sys.byteorder != "little"
+
+
+def _percentile(sorted_vals: Sequence[float], q: float) -> float:
+    """Linear interpolation, same as numpy's default method."""
+    if not sorted_vals:
+        return float("nan")
+    pos = (len(sorted_vals) - 1) * q / 100.0
+    lo = math.floor(pos)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (pos - lo)
+
+
+def _round(x: float, digits: int = 2) -> Optional[float]:
+    return None if x != x else round(float(x), digits)  # NaN -> None
+
+
+class GlucoseSeries:
+    """Read-only view of a user's series; ``ts`` is sorted ascending."""
+
+    def __init__(self, ts: Any, values: Any) -> None:
+        self.ts = ts
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def window(self, start: Optional[float], end: Optional[float]) -> "GlucoseSeries":
+        """Readings with start <= ts < end (either bound may be None)."""
+        if np is not None:
+            lo = 0 if start is None else int(np.searchsorted(self.ts, start, side="left"))
+            hi = len(self.ts) if end is None else int(np.searchsorted(self.ts, end, side="left"))
+        else:
+            lo = 0 if start is None else bisect.bisect_left(self.ts, start)
+            hi = len(self.ts) if end is None else bisect.bisect_left(self.ts, end)
+        return GlucoseSeries(self.ts[lo:hi], self.values[lo:hi])
+
+
+class GlucoseStore:
+    """Per-user glucose series backed by two append-only binary columns."""
+
+    def __init__(self, base: Path = GLUCOSE_DIR, cache_users: int = GLUCOSE_CACHE_USERS) -> None:
+        self.base = base
+        self.cache_users = max(0, cache_users)
+        self._cache: "OrderedDict[str, Tuple[Tuple[int, int, int], GlucoseSeries]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _paths(self, user_id: str) -> Tuple[Path, Path]:
+        # The .ts column decides the layout; .val always sits next to it.
+        ts_path = user_path(self.base, user_id, ".ts")
+        return ts_path, ts_path.with_name(f"{user_id}.val")
+
+    def _count(self, ts_path: Path, val_path: Path) -> int:
+        # A crash between the two writes can leave one column longer; ignore the tail.
+        try:
+            return min(ts_path.stat().st_size // _TS_SIZE, val_path.stat().st_size // _VAL_SIZE)
+        except OSError:
+            return 0
+
+    def _read(self, ts_path: Path, val_path: Path, n: int) -> GlucoseSeries:
+        if n == 0:
+            empty = GlucoseSeries(np.empty(0, dtype="<i8"), np.empty(0, dtype="<f4")) if np is not None else GlucoseSeries(array("q"), array("f"))
+            return empty
+        if np is not None:
+            ts = np.memmap(ts_path, dtype="<i8", mode="r", shape=(n,))
+            values = np.memmap(val_path, dtype="<f4", mode="r", shape=(n,))
+            return GlucoseSeries(ts, values)
+        ts = array("q")
+        values = array("f")
+        with ts_path.open("rb") as f:
+            ts.frombytes(f.read(n * _TS_SIZE))
+        with val_path.open("rb") as f:
+            values.frombytes(f.read(n * _VAL_SIZE))
+        if _SWAP:
+            ts.byteswap()
+            values.byteswap()
+        return GlucoseSeries(ts, values)
+
+    def load(self, user_id: str) -> GlucoseSeries:
+        ts_path, val_path = self._paths(user_id)
+        n = self._count(ts_path, val_path)
+        try:
+            # Both mtimes: a merge rewrites the columns in place one after the other.
+            sig = (n, ts_path.stat().st_mtime_ns, val_path.stat().st_mtime_ns)
+        except OSError:
+            sig = (0, 0, 0)
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None and entry[0] == sig:
+                self._cache.move_to_end(user_id)
+                return entry[1]
+        series = self._read(ts_path, val_path, n)
+        if self.cache_users > 0:
+            with self._lock:
+                self._cache[user_id] = (sig, series)
+                self._cache.move_to_end(user_id)
+                # Dropping the entry releases its memmaps once callers let go of their windows.
+                while len(self._cache) > self.cache_users:
+                    self._cache.popitem(last=False)
+        return series
+
+    def append_many(self, user_id: str, readings: Iterable[Tuple[float, float]]) -> int:
+        """Append (epoch_seconds, mmol/L) readings; returns how many were written.
+
+        Readings already stored with the same (ts, value) are skipped, as are
+        repeats within ``readings``, so re-running a sync or re-ingesting a
+        chat message is a no-op. The columns stay sorted by time: readings
+        at or after the last stored one are appended, anything older is
+        merged in by rewriting both columns.
+        """
+        rows = [(int(ts), float(val)) for ts, val in readings if val == val]
+        if not rows:
+            return 0
+        with locked(self._paths(user_id)[0]):
+            ts_path, val_path = self._paths(user_id)
+            ts_path.parent.mkdir(parents=True, exist_ok=True)
+            n = self._count(ts_path, val_path)
+            fresh = self._new_rows(user_id, rows)
+            if not fresh:
+                return 0
+            fresh.sort(key=lambda r: r[0])
+            stored = self.load(user_id)
+            # Trim a torn tail before writing so both columns stay aligned.
+            for path, size in ((ts_path, _TS_SIZE), (val_path, _VAL_SIZE)):
+                if path.exists() and path.stat().st_size != n * size:
+                    os.truncate(path, n * size)
+            if n and fresh[0][0] < int(stored.ts[-1]):
+                # Backfill: merge and rewrite in place (the columns only grow,
+                # so no truncation of a file other readers may have mapped).
+                merged = list(zip(map(int, stored.ts), map(float, stored.values))) + fresh
+                mode, rows = "r+b", sorted(merged, key=lambda r: r[0])
+            else:
+                mode, rows = "ab", fresh
+            del stored
+            with self._lock:
+                self._cache.pop(user_id, None)
+            ts_col = array("q", (r[0] for r in rows))
+            val_col = array("f", (r[1] for r in rows))
+            if _SWAP:
+                ts_col.byteswap()
+                val_col.byteswap()
+            with val_path.open(mode) as f:
+                f.write(val_col.tobytes())
+            with ts_path.open(mode) as f:
+                f.write(ts_col.tobytes())
+        with self._lock:
+            self._cache.pop(user_id, None)
+        return len(fresh)
+
+    def _new_rows(self, user_id: str, rows: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
+        """Drop rows whose (ts, value) is stored already or repeated in ``rows``."""
+        overlap = self.load(user_id).window(min(r[0] for r in rows), max(r[0] for r in rows) + 1)
+        # Values are stored as float32; compare at 0.001 mmol/L.
+        seen = {(int(t), round(float(v), 3)) for t, v in zip(overlap.ts, overlap.values)}
+        fresh: List[Tuple[int, float]] = []
+        for ts, val in rows:
+            key = (ts, round(val, 3))
+            if key not in seen:
+                seen.add(key)
+                fresh.append((ts, val))
+        return fresh
+
+    def append(self, user_id: str, ts: float, value: float) -> bool:
+        return self.append_many(user_id, [(ts, value)]) > 0
+
+    def stats(
+        self,
+        user_id: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        *,
+        low: float = RANGE_LOW,
+        high: float = RANGE_HIGH,
+        tz: tzinfo = timezone.utc,
+        daily: bool = True,
+    ) -> Dict[str, Any]:
+        """Summary statistics over [start, end).
+
+        Time-in-range figures are reading-weighted, which matches evenly
+        sampled CGM data. Days are bucketed with the UTC offset of ``tz``
+        at the end of the window.
+        """
+        series = self.load(user_id).window(start, end)
+        n = len(series)
+        result: Dict[str, Any] = {
+            "user_id": user_id,
+            "count": n,
+            "start": start,
+            "end": end,
+            "range": {"low": low, "high": high},
+        }
+        if n == 0:
+            result.update({"mean": None, "sd": None, "cv": None, "min": None, "max": None, "tir": None, "tbr": None, "tar": None})
+            if daily:
+                result["daily"] = []
+            return result
+        ref = datetime.fromtimestamp(end if end is not None else float(series.ts[-1]), tz)
+        offset = int((ref.utcoffset() or timedelta(0)).total_seconds())
+        if np is not None:
+            result.update(self._stats_np(series, low, high, offset, daily))
+        else:
+            result.update(self._stats_py(series, low, high, offset, daily))
+        result["first_ts"] = int(series.ts[0])
+        result["last_ts"] = int(series.ts[-1])
+        return result
+
+    def _stats_np(self, series: GlucoseSeries, low: float, high: float, offset: int, daily: bool) -> Dict[str, Any]:
+        values = np.asarray(series.values, dtype=np.float64)
+        n = values.size
+        mean = values.mean()
+        sd = values.std(ddof=1) if n > 1 else 0.0
+        out: Dict[str, Any] = {
+            "mean": _round(mean),
+            "sd": _round(sd),
+            "cv": _round(sd / mean * 100 if mean else float("nan"), 1),
+            "min": _round(values.min()),
+            "max": _round(values.max()),
+            "tir": _round(np.count_nonzero((values >= low) & (values <= high)) / n * 100, 1),
+            "tbr": _round(np.count_nonzero(values < low) / n * 100, 1),
+            "tar": _round(np.count_nonzero(values > high) / n * 100, 1),
+        }
+        if daily:
+            days = (np.asarray(series.ts, dtype=np.int64) + offset) // 86400
+            # Sort by (day, value) once, then each day's percentiles are index lookups.
+            order = np.lexsort((values, days))
+            days_sorted = days[order]
+            vals_sorted = values[order]
+            uniq, starts, counts = np.unique(days_sorted, return_index=True, return_counts=True)
+            rows = []
+            for day, s, c in zip(uniq.tolist(), starts.tolist(), counts.tolist()):
+                pcts = np.percentile(vals_sorted[s:s + c], PERCENTILES)
+                rows.append(self._day_row(day, c, pcts.tolist()))
+            out["daily"] = rows
+        return out
+
+    def _stats_py(self, series: GlucoseSeries, low: float, high: float, offset: int, daily: bool) -> Dict[str, Any]:
+        values = list(series.values)
+        n = len(values)
+        mean = math.fsum(values) / n
+        sd = math.sqrt(math.fsum((v - mean) ** 2 for v in values) / (n - 1)) if n > 1 else 0.0
+        out: Dict[str, Any] = {
+            "mean": _round(mean),
+            "sd": _round(sd),
+            "cv": _round(sd / mean * 100 if mean else float("nan"), 1),
+            "min": _round(min(values)),
+            "max": _round(max(values)),
+            "tir": _round(sum(1 for v in values if low <= v <= high) / n * 100, 1),
+            "tbr": _round(sum(1 for v in values if v < low) / n * 100, 1),
+            "tar": _round(sum(1 for v in values if v > high) / n * 100, 1),
+        }
+        if daily:
+            by_day: Dict[int, List[float]] = {}
+            for ts, v in zip(series.ts, values):
+                by_day.setdefault((ts + offset) // 86400, []).append(v)
+            rows = []
+            for day in sorted(by_day):
+                vals = sorted(by_day[day])
+                rows.append(self._day_row(day, len(vals), [_percentile(vals, q) for q in PERCENTILES]))
+            out["daily"] = rows
+        return out
+
+    def _day_row(self, day: int, count: int, pcts: List[float]) -> Dict[str, Any]:
+        row: Dict[str, Any] = {
+            "date": (datetime(1970, 1, 1) + timedelta(days=int(day))).date().isoformat(),
+            "count": int(count),
+        }
+        for q, v in zip(PERCENTILES, pcts):
+            row[f"p{q}"] = _round(v)
+        return row
+
+
+glucose_store = GlucoseStore()
+
+
+async def aappend_glucose(user_id: str, readings: Iterable[Tuple[float, float]]) -> int:
+    return await run_io(glucose_store.append_many, user_id, list(readings))
+
+
+async def aglucose_stats(user_id: str, start: Optional[float] = None, end: Optional[float] = None, **kwargs: Any) -> Dict[str, Any]:
+    return await run_io(glucose_store.stats, user_id, start, end, **kwargs)
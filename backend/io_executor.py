@@ -0,0 +1,102 @@
+"""Bounded thread pool for blocking file I/O issued from async code.
+
+Stores stay synchronous; their ``a*`` counterparts hop onto this executor
+so a slow disk never stalls the event loop (and every open SSE stream).
+"""
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+IO_WORKERS = int(os.getenv("IO_WORKERS", "4"))
+# Max I/O jobs queued or running at once; further callers wait their turn.
+IO_MAX_PENDING = int(os.getenv("IO_MAX_PENDING", "256"))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max(1, IO_WORKERS), thread_name_prefix="store-io")
+    return _executor
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(max(1, IO_MAX_PENDING))
+    return _slots
+
+
+async def run_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking store call on the I/O executor and await its result."""
+    loop = asyncio.get_running_loop()
+    async with _get_slots():
+        return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_io(wait: bool = True) -> None:
+    global _executor, _slots
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+    _executor = None
+    _slots = None
+
+
+class LoopLagMonitor:
+    """Measure event-loop lag: how late a periodic sleep wakes up."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL) -> None:
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.samples = 0
+        self.total = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+
+    async def start(self) -> None:
+        if self.task:
+            return
+        self.task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.samples += 1
+            self.total += lag
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def snapshot(self) -> Dict[str, Any]:
+        avg = self.total / self.samples if self.samples else 0.0
+        return {
+            "samples": self.samples,
+            "interval_ms": round(self.interval * 1000, 3),
+            "avg_lag_ms": round(avg * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "last_lag_ms": round(self.last_lag * 1000, 3),
+        }
+
+
+loop_lag_monitor = LoopLagMonitor()
@@ -0,0 +1,49 @@
+"""JSON encode/decode used by the stores, SSE encoders and the Coze parser.
+
+Uses orjson when it is installed and falls back to the stdlib otherwise.
+Both backends write non-ASCII text as-is, like ``ensure_ascii=False``.
+The stdlib fallback is byte-for-byte ``json.dumps(..., ensure_ascii=False)``;
+orjson writes compact separators (no space after ``,`` and ``:``), which
+parses the same. ``indent`` of 2 is supported natively, and anything
+orjson refuses (big ints, odd key types, other indents) goes through the
+stdlib. Set ``JSON_CODEC=stdlib`` to force the fallback.
+"""
+import json
+import os
+from typing import Any, Callable, Optional, Union
+
+JSON_CODEC = os.getenv("JSON_CODEC", "auto").lower()
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None  # type: ignore[assignment]
+
+if JSON_CODEC == "stdlib":
+    orjson = None  # type: ignore[assignment]
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+# datetime/dataclass go through ``default`` like they would with the stdlib.
+_BASE_OPTS = 0
+if orjson is not None:
+    _BASE_OPTS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+JSONDecodeError = json.JSONDecodeError
+
+
+def dumps(obj: Any, *, indent: Optional[int] = None, default: Optional[Callable[[Any], Any]] = None) -> str:
+    if orjson is not None and indent in (None, 2):
+        opts = _BASE_OPTS | (orjson.OPT_INDENT_2 if indent == 2 else 0)
+        try:
+            return orjson.dumps(obj, default=default, option=opts).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, default=default, indent=indent)
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    if orjson is not None:
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError / ValueError.
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,141 @@
+"""Opt-in response cache for ``chat_once``.
+
+Completions are keyed on (model, system_prompt, user_prompt, max_tokens,
+temperature) and kept in an in-memory LRU backed by a SQLite file, so a
+repeated call (the same candidate query reviewed twice, an unchanged
+history re-summarized) skips the upstream round trip, also across
+restarts and workers. Enable it with ``LLM_CACHE_ENABLED=true``; only the
+agents named in ``LLM_CACHE_AGENTS`` are cached.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from . import json_codec
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+# Comma-separated agent names passed as chat_once(cache=...); "*" caches every agent.
+LLM_CACHE_AGENTS = {a.strip() for a in os.getenv("LLM_CACHE_AGENTS", "supervisor,event_selector,profile_update").split(",") if a.strip()}
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "512"))
+LLM_CACHE_DB = Path(os.getenv("LLM_CACHE_DB", str(Path(__file__).resolve().parent / "data" / "state" / "llm_cache.sqlite3")))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    agent TEXT,
+    text TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_expires ON responses(expires_at);
+"""
+
+
+def cache_key(model: str, system_prompt: str, user_prompt: str, max_tokens: int, temperature: float) -> str:
+    raw = json_codec.dumps([model, system_prompt, user_prompt, max_tokens, round(float(temperature), 4)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(
+        self,
+        db_path: Optional[Path] = LLM_CACHE_DB,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+        memory_items: int = LLM_CACHE_MEMORY_ITEMS,
+    ) -> None:
+        self.db_path = Path(db_path) if db_path else None
+        self.ttl = ttl_seconds
+        self.memory_items = max(0, memory_items)
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # agent -> {"memory_hits", "disk_hits", "misses", "writes"}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def enabled_for(self, agent: Optional[str]) -> bool:
+        return LLM_CACHE_ENABLED and bool(agent) and ("*" in LLM_CACHE_AGENTS or agent in LLM_CACHE_AGENTS)
+
+    def _count(self, agent: str, name: str) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(agent, {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0})
+            counters[name] += 1
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if self.db_path is None:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key: str, expires_at: float, text: str) -> None:
+        if self.memory_items <= 0:
+            return
+        with self._lock:
+            self._memory[key] = (expires_at, text)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, agent: str, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                else:
+                    self._memory.pop(key, None)
+                    entry = None
+        if entry is not None:
+            self._count(agent, "memory_hits")
+            return entry[1]
+        conn = self._conn()
+        row = None
+        if conn is not None:
+            row = conn.execute("SELECT text, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        if row is None:
+            self._count(agent, "misses")
+            return None
+        self._remember(key, row[1], row[0])
+        self._count(agent, "disk_hits")
+        return row[0]
+
+    def put(self, agent: str, key: str, text: str) -> None:
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, text)
+        conn = self._conn()
+        if conn is not None:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, agent, text, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, agent, text, expires_at),
+                )
+                # Opportunistic expiry so the file does not grow without bound.
+                if int(key[:4], 16) % 64 == 0:
+                    conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        self._count(agent, "writes")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            agents = {agent: dict(c) for agent, c in self._counters.items()}
+            memory = len(self._memory)
+        return {
+            "enabled": LLM_CACHE_ENABLED,
+            "agents_enabled": sorted(LLM_CACHE_AGENTS),
+            "memory_items": memory,
+            "agents": agents,
+        }
+
+
+llm_cache = LLMResponseCache()
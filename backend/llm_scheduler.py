@@ -0,0 +1,190 @@
+"""Priority-aware admission for upstream LLM calls.
+
+Every ``coze_stream`` / ``chat_once`` / ``chat_stream`` call takes a slot
+from its provider before going upstream. Waiters are served by priority
+class, taken from a context variable so background tasks inherit it::
+
+    with llm_priority("profile_sync"):
+        await chat_once(...)
+
+- ``interactive`` (default): user-facing chat replies.
+- ``proactive``: ProactiveLoop ticks.
+- ``profile_sync``: ProfileUpdateAgent runs.
+
+Each provider has a concurrency limit, an optional token bucket
+(requests/second with a burst), and a few slots reserved for interactive
+calls. When an interactive call waits longer than ``LLM_DEFER_WAIT_MS``,
+background admission pauses for ``LLM_DEFER_SECONDS`` so queued
+background work yields to users; calls already running are not cut off.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+INTERACTIVE, PROACTIVE, PROFILE_SYNC = 0, 1, 2
+PRIORITIES = {"interactive": INTERACTIVE, "proactive": PROACTIVE, "profile_sync": PROFILE_SYNC}
+_NAMES = {v: k for k, v in PRIORITIES.items()}
+
+LLM_INTERACTIVE_RESERVE = int(os.getenv("LLM_INTERACTIVE_RESERVE", "1"))
+LLM_DEFER_WAIT_MS = float(os.getenv("LLM_DEFER_WAIT_MS", "500"))
+LLM_DEFER_SECONDS = float(os.getenv("LLM_DEFER_SECONDS", "10"))
+
+_priority: ContextVar[int] = ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(name: str) -> Iterator[None]:
+    """Run the block (and tasks it spawns) at the given priority class."""
+    token = _priority.set(PRIORITIES[name])
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _provider_env(provider: str, key: str, default: str) -> float:
+    return float(os.getenv(f"LLM_{key}_{provider.upper()}", os.getenv(f"LLM_{key}", default)))
+
+
+class _Provider:
+    def __init__(self, scheduler: "LLMScheduler", name: str) -> None:
+        self.scheduler = scheduler
+        self.name = name
+        self.limit = max(1, int(_provider_env(name, "CONCURRENCY", "8")))
+        self.rate = _provider_env(name, "RATE", "0")  # requests/second; 0 = unlimited
+        self.burst = max(1.0, _provider_env(name, "BURST", "5"))
+        self.in_flight = 0
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wake_handle: Optional[asyncio.TimerHandle] = None
+        self.granted = {p: 0 for p in PRIORITIES.values()}
+        self.wait_total = {p: 0.0 for p in PRIORITIES.values()}
+        self.deferred = 0
+
+    def _can_admit(self, priority: int) -> bool:
+        if priority == INTERACTIVE:
+            return self.in_flight < self.limit
+        if self.scheduler.deferring():
+            return False
+        reserve = min(LLM_INTERACTIVE_RESERVE, self.limit - 1)
+        return self.in_flight < self.limit - reserve
+
+    def _wake(self) -> None:
+        self._wake_handle = None
+        while self._waiters:
+            priority, _, fut = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_admit(priority):
+                if priority != INTERACTIVE and self.scheduler.deferring() and self._wake_handle is None:
+                    # Re-check once the deferral window ends.
+                    loop = asyncio.get_running_loop()
+                    self._wake_handle = loop.call_later(self.scheduler.defer_remaining(), self._wake)
+                return
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            fut.set_result(None)
+
+    async def acquire(self, priority: int) -> None:
+        if not self._waiters and self._can_admit(priority):
+            self.in_flight += 1
+            return
+        if priority != INTERACTIVE and self.scheduler.deferring():
+            self.deferred += 1
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self._wake()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Granted just as we were cancelled: hand the slot on.
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    async def take_token(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def snapshot(self) -> Dict[str, Any]:
+        queued = {name: 0 for name in PRIORITIES}
+        for priority, _, fut in self._waiters:
+            if not fut.done():
+                queued[_NAMES[priority]] += 1
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "rate_per_s": self.rate,
+            "queued": queued,
+            "granted": {_NAMES[p]: n for p, n in self.granted.items()},
+            "avg_wait_ms": {
+                _NAMES[p]: round(self.wait_total[p] / n * 1000, 1) if n else 0.0 for p, n in self.granted.items()
+            },
+            "deferred": self.deferred,
+        }
+
+
+class LLMScheduler:
+    def __init__(self) -> None:
+        self._providers: Dict[str, _Provider] = {}
+        self._defer_until = 0.0
+
+    def provider(self, name: str) -> _Provider:
+        prov = self._providers.get(name)
+        if prov is None:
+            prov = self._providers[name] = _Provider(self, name)
+        return prov
+
+    def deferring(self) -> bool:
+        return time.monotonic() < self._defer_until
+
+    def defer_remaining(self) -> float:
+        return max(0.0, self._defer_until - time.monotonic())
+
+    @asynccontextmanager
+    async def slot(self, provider: str) -> AsyncIterator[None]:
+        """Hold one upstream call slot of ``provider`` for the block."""
+        prov = self.provider(provider)
+        priority = _priority.get()
+        started = time.monotonic()
+        await prov.acquire(priority)
+        try:
+            await prov.take_token()
+            waited = time.monotonic() - started
+            prov.granted[priority] += 1
+            prov.wait_total[priority] += waited
+            if priority == INTERACTIVE and waited * 1000 >= LLM_DEFER_WAIT_MS:
+                self._defer_until = time.monotonic() + LLM_DEFER_SECONDS
+                print(f"[llm] interactive wait {waited * 1000:.0f}ms on {provider}; deferring background calls")
+            yield
+        finally:
+            prov.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "deferring_s": round(self.defer_remaining(), 1),
+            "providers": {name: prov.snapshot() for name, prov in self._providers.items()},
+        }
+
+
+llm_scheduler = LLMScheduler()
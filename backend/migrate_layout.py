@@ -0,0 +1,160 @@
+"""Move per-user data from the flat layout into hash shards (see ``data_paths``).
+
+Safe to run while the API is up: every entry is moved while holding the
+same file lock its store takes (lock keys are layout-independent), and the
+stores re-resolve their paths once they hold that lock. Entries already in
+the sharded layout are left alone, so the tool can be re-run at any time::
+
+    python -m backend.migrate_layout [--dry-run] [--user USER_ID] [--store users]
+"""
+import argparse
+import os
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import json_codec
+from .app.profile_store import PROFILE_DIR
+from .chat_history import ARCHIVE_DIR, CHAT_DIR
+from .data_paths import flat_path, is_shard_name, sharded_path
+from .diet_store import LOG_NAME
+from .file_lock import atomic_write_text, locked
+from .glucose_store import GLUCOSE_DIR
+from .schedule_store import SCHEDULE_DIR
+from .user_data import MODULES, USERS_DIR
+
+
+def _flat_users(base: Path, suffix: str = "") -> List[str]:
+    """User ids that still have a flat entry under ``base``."""
+    if not base.exists():
+        return []
+    users = []
+    for entry in base.iterdir():
+        if suffix:
+            if entry.is_file() and entry.name.endswith(suffix):
+                users.append(entry.name[: -len(suffix)])
+        elif entry.is_dir() and not is_shard_name(entry.name):
+            users.append(entry.name)
+    return sorted(users)
+
+
+def _move(src: Path, dst: Path, dry_run: bool) -> bool:
+    if not src.exists():
+        return False
+    if dst.exists():
+        print(f"[migrate] conflict: {src} and {dst} both exist, skipped")
+        return False
+    if dry_run:
+        print(f"[migrate] would move {src} -> {dst}")
+        return True
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    os.rename(src, dst)
+    return True
+
+
+def migrate_users_dir(user_id: str, dry_run: bool = False) -> bool:
+    src, dst = flat_path(USERS_DIR, user_id), sharded_path(USERS_DIR, user_id)
+    names = {f"{name}.json" for name in MODULES} | {LOG_NAME}
+    if src.is_dir():
+        names |= {p.name for p in src.iterdir() if p.is_file()}
+    with ExitStack() as stack:
+        # Lock every file a store might write, including ones not created yet.
+        for name in sorted(names):
+            stack.enter_context(locked(src / name))
+        return _move(src, dst, dry_run)
+
+
+def migrate_profile(user_id: str, dry_run: bool = False) -> bool:
+    src = flat_path(PROFILE_DIR, user_id, ".json")
+    with locked(src):
+        return _move(src, sharded_path(PROFILE_DIR, user_id, ".json"), dry_run)
+
+
+def migrate_schedule(user_id: str, dry_run: bool = False) -> bool:
+    src = flat_path(SCHEDULE_DIR, user_id, ".json")
+    with locked(src):
+        return _move(src, sharded_path(SCHEDULE_DIR, user_id, ".json"), dry_run)
+
+
+def migrate_glucose(user_id: str, dry_run: bool = False) -> bool:
+    ts_src = flat_path(GLUCOSE_DIR, user_id, ".ts")
+    with locked(ts_src):
+        moved = _move(flat_path(GLUCOSE_DIR, user_id, ".val"), sharded_path(GLUCOSE_DIR, user_id, ".val"), dry_run)
+        return _move(ts_src, sharded_path(GLUCOSE_DIR, user_id, ".ts"), dry_run) or moved
+
+
+def migrate_chat(user_id: str, dry_run: bool = False) -> bool:
+    """Hot log, ledger, manifest and archive segments; manifest paths are rewritten."""
+    hot = flat_path(CHAT_DIR, user_id, ".jsonl")
+    with locked(hot), locked(flat_path(CHAT_DIR, user_id, ".triggers.jsonl")):
+        moved = False
+        archive_src = flat_path(ARCHIVE_DIR, user_id)
+        archive_dst = sharded_path(ARCHIVE_DIR, user_id)
+        manifest = flat_path(CHAT_DIR, user_id, ".manifest.json")
+        if archive_src.is_dir() and not archive_dst.exists():
+            old_prefix = archive_src.relative_to(CHAT_DIR).as_posix() + "/"
+            new_prefix = archive_dst.relative_to(CHAT_DIR).as_posix() + "/"
+            moved = _move(archive_src, archive_dst, dry_run)
+            # The manifest may already be sharded (it follows the hot log's first roll).
+            for path in (manifest, sharded_path(CHAT_DIR, user_id, ".manifest.json")):
+                if moved and not dry_run and path.exists():
+                    doc = json_codec.loads(path.read_text(encoding="utf-8"))
+                    for segment in doc.get("segments") or []:
+                        if str(segment.get("file", "")).startswith(old_prefix):
+                            segment["file"] = new_prefix + segment["file"][len(old_prefix):]
+                    atomic_write_text(path, json_codec.dumps(doc, indent=2))
+        for suffix in (".manifest.json", ".triggers.jsonl", ".jsonl"):
+            moved = _move(flat_path(CHAT_DIR, user_id, suffix), sharded_path(CHAT_DIR, user_id, suffix), dry_run) or moved
+        return moved
+
+
+def _chat_users() -> List[str]:
+    users = set(u for u in _flat_users(CHAT_DIR, ".jsonl") if not u.endswith(".triggers"))
+    users |= set(_flat_users(CHAT_DIR, ".manifest.json"))
+    users |= set(_flat_users(CHAT_DIR, ".triggers.jsonl"))
+    users |= set(_flat_users(ARCHIVE_DIR))
+    return sorted(users)
+
+
+STORES: Dict[str, Tuple[Callable[[], Iterable[str]], Callable[[str, bool], bool]]] = {
+    "users": (lambda: _flat_users(USERS_DIR), migrate_users_dir),
+    "profiles": (lambda: _flat_users(PROFILE_DIR, ".json"), migrate_profile),
+    "schedules": (lambda: _flat_users(SCHEDULE_DIR, ".json"), migrate_schedule),
+    "glucose": (lambda: _flat_users(GLUCOSE_DIR, ".ts"), migrate_glucose),
+    "chat_history": (_chat_users, migrate_chat),
+}
+
+
+def migrate_layout(
+    stores: Optional[List[str]] = None,
+    users: Optional[List[str]] = None,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """Migrate the given stores (default: all); returns users moved per store."""
+    result: Dict[str, int] = {}
+    for store in stores or list(STORES):
+        list_users, migrate = STORES[store]
+        count = 0
+        for user_id in users or list_users():
+            try:
+                if migrate(user_id, dry_run):
+                    count += 1
+                    print(f"[migrate] {store} user={user_id}")
+            except Exception as exc:
+                print(f"[migrate] {store} user={user_id} failed: {exc}")
+        result[store] = count
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move per-user data into the hash-sharded layout.")
+    parser.add_argument("--store", action="append", choices=sorted(STORES), help="Only migrate this store (repeatable).")
+    parser.add_argument("--user", action="append", help="Only migrate this user (repeatable).")
+    parser.add_argument("--dry-run", action="store_true", help="Print the moves without doing them.")
+    args = parser.parse_args()
+    result = migrate_layout(args.store, users=args.user, dry_run=args.dry_run)
+    print(f"[migrate] done {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
+import asyncio
 import os
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Dict, List, Optional
 
+import httpx
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from .io_executor import run_io
+from .llm_cache import cache_key, llm_cache
+from .llm_scheduler import llm_scheduler
 
 ENV_PATH = Path(__file__).resolve().parent / ".env"
 load_dotenv(dotenv_path=ENV_PATH)  # prefer backend/.env
@@ -11,30 +17,108 @@ load_dotenv()  # fallback to defaults/parent
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+# One client (and connection pool) per process and event loop.
+_instance: Optional[AsyncOpenAI] = None
+_instance_loop: Optional[asyncio.AbstractEventLoop] = None
 
 
 def _client() -> AsyncOpenAI:
+    global _instance, _instance_loop
     if not OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY not set")
-    return AsyncOpenAI(api_key=OPENAI_API_KEY)
+    loop = asyncio.get_running_loop()
+    if _instance is None or _instance_loop is not loop:
+        _instance = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            timeout=OPENAI_TIMEOUT,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                ),
+            ),
+        )
+        _instance_loop = loop
+    return _instance
+
+
+async def close_openai_client() -> None:
+    global _instance, _instance_loop
+    client, _instance, _instance_loop = _instance, None, None
+    if client is not None:
+        await client.close()
+
+
+def _messages(system_prompt: str, user_prompt: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
 
+async def chat_once(
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: int = 200,
+    temperature: float = 0.6,
+    *,
+    cache: Optional[str] = None,
+) -> str:
+    """Generic helper to get a single completion text.
 
-async def chat_once(system_prompt: str, user_prompt: str, max_tokens: int = 200, temperature: float = 0.6) -> str:
-    """Generic helper to get a single completion text."""
+    ``cache`` names the calling agent; when the response cache is enabled
+    for it, identical calls are answered from ``llm_cache``.
+    """
+    key = None
+    if llm_cache.enabled_for(cache):
+        key = cache_key(OPENAI_MODEL, system_prompt, user_prompt, max_tokens, temperature)
+        hit = await run_io(llm_cache.get, cache, key)
+        if hit is not None:
+            return hit
+    text = await _complete(system_prompt, user_prompt, max_tokens, temperature)
+    if key is not None and text:
+        await run_io(llm_cache.put, cache, key, text)
+    return text
+
+
+async def _complete(system_prompt: str, user_prompt: str, max_tokens: int, temperature: float) -> str:
     client = _client()
-    resp = await client.chat.completions.create(
-        model=OPENAI_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        max_tokens=max_tokens,
-        temperature=temperature,
-    )
+    async with llm_scheduler.slot("openai"):
+        resp = await client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=_messages(system_prompt, user_prompt),
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
     text = (resp.choices[0].message.content or "").strip()
     return text
 
 
+async def chat_stream(
+    system_prompt: str, user_prompt: str, max_tokens: int = 400, temperature: float = 0.6
+) -> AsyncIterator[str]:
+    """Like ``chat_once`` but yields text deltas as they arrive."""
+    client = _client()
+    async with llm_scheduler.slot("openai"):
+        stream = await client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=_messages(system_prompt, user_prompt),
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
 async def generate_user_query(raw_prompt: str) -> str:
     """Generate a short user-like query (<=60 chars) for proactive trigger."""
     system = (
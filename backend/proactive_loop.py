@@ -1,19 +1,24 @@
 import asyncio
-import json
 import os
 import random
-import re
+import time
 import uuid
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Any, Dict, Optional, List
 
-from .agents import ProfileUpdateAgent, ResponseGeneratorAgent, chat_store
+from . import json_codec
+from .agents import ResponseGeneratorAgent, chat_store
+from .chat_history import parse_trigger_type
 from .trigger_agent import ScheduleTriggerAgent
 from .agents import EventSelectorAgent
-from .app.profile_store import load_profile
-from .schedule_store import load_schedule
+from .app.profile_store import aload_profile, aload_profile_versioned
+from .schedule_engine import DueEvent, schedule_engine
 from .state_stream import state_stream_manager
+from .file_lock import ProcessLock, atomic_write_json
+from .io_executor import run_io
+from .llm_scheduler import llm_priority
+from .profile_sync import profile_sync
 
 STATE_PATH = Path(__file__).resolve().parent / "data" / "state" / "proactive_state.json"
 TEST_MODE = os.getenv("PROACTIVE_TEST_MODE", "false").lower() == "true"
@@ -22,20 +27,23 @@ IGNORE_HISTORY = os.getenv("PROACTIVE_IGNORE_HISTORY", "false").lower() == "true
 FALLBACK_ENABLED = os.getenv("PROACTIVE_FALLBACK_ENABLED", "true").lower() == "true"
 INJECT_RATE = float(os.getenv("PROACTIVE_INJECT_RATE", "0.7"))
 ASSISTANT_RANDOM_RATE = float(os.getenv("PROACTIVE_ASSISTANT_RANDOM_RATE", "0.5"))
+# Also wake for the next schedule event between the regular interval ticks.
+SCHEDULE_DRIVEN = os.getenv("PROACTIVE_SCHEDULE_DRIVEN", "true").lower() == "true"
+# Upper bound on a single sleep so edits to the schedule file are picked up.
+MAX_SLEEP_SECONDS = int(os.getenv("PROACTIVE_MAX_SLEEP_SECONDS", "300"))
 
 
 def _load_state() -> Dict[str, Any]:
     if not STATE_PATH.exists():
         return {"enabled": True, "cooldown_until": None, "last_proactive_at": None}
     try:
-        return json.loads(STATE_PATH.read_text(encoding="utf-8"))
+        return json_codec.loads(STATE_PATH.read_text(encoding="utf-8"))
     except Exception:
         return {"enabled": True, "cooldown_until": None, "last_proactive_at": None}
 
 
 def _save_state(state: Dict[str, Any]) -> None:
-    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    atomic_write_json(STATE_PATH, state)
 
 
 class ProactiveLoop:
@@ -53,10 +61,14 @@ class ProactiveLoop:
         self.cooldown_seconds = cooldown_seconds
         self.jitter_seconds = jitter_seconds
         self.task: Optional[asyncio.Task] = None
+        # Schedule events held back by the chat cooldown, retried at _retry_at.
+        self._deferred: List[DueEvent] = []
+        self._retry_at = 0.0
+        # With several API workers only the lock holder runs ticks for this user.
+        self.leader = ProcessLock(f"proactive-{user_id}")
         self.trigger_agent = ScheduleTriggerAgent()
         self.selector_agent = EventSelectorAgent()
         self.response_agent = ResponseGeneratorAgent()
-        self.profile_agent = ProfileUpdateAgent()
         self.inject_rate = max(0.0, min(1.0, INJECT_RATE))
         self.assistant_random_rate = max(0.0, min(1.0, ASSISTANT_RANDOM_RATE))
         # Minimum per-event intervals (seconds) to avoid spam even if model keeps triggering.
@@ -110,13 +122,54 @@ class ProactiveLoop:
             except asyncio.CancelledError:
                 pass
             self.task = None
+        self.leader.release()
+
+    def _next_llm_tick(self) -> float:
+        return time.time() + self.interval + (random.randint(0, self.jitter_seconds) if self.jitter_seconds > 0 else 0)
+
+    async def _sleep_until_due(self, llm_at: float) -> bool:
+        """Sleep until the next schedule event or ``llm_at``; returns whether the user has a schedule."""
+        nxt = await run_io(schedule_engine.next_due, self.user_id) if SCHEDULE_DRIVEN else None
+        wake = llm_at if nxt is None else min(nxt.at, llm_at)
+        await asyncio.sleep(max(0.0, min(wake - time.time(), MAX_SLEEP_SECONDS)))
+        return nxt is not None
+
+    def _defer(self, due: DueEvent, retry_at: float) -> None:
+        if due.until <= retry_at:
+            print(f"[proactive] drop scheduled {due.name}: cooldown outlasts {due.detail} user={self.user_id}")
+            return
+        print(f"[proactive] defer scheduled {due.name} until cooldown ends user={self.user_id}")
+        self._deferred.append(due)
+        self._retry_at = retry_at
+
+    def _take_deferred(self) -> List[DueEvent]:
+        now = time.time()
+        due = [event for event in self._deferred if event.until > now]
+        self._deferred = []
+        return due
 
     async def _run(self) -> None:
+        llm_at = self._next_llm_tick()
         while True:
-            sleep_for = self.interval + (random.randint(0, self.jitter_seconds) if self.jitter_seconds > 0 else 0)
-            await asyncio.sleep(sleep_for)
+            scheduled = await self._sleep_until_due(min(llm_at, self._retry_at) if self._deferred else llm_at)
+            # Every worker pops so its heap stays current; only the leader fires.
+            due: List[DueEvent] = await run_io(schedule_engine.pop_due, self.user_id) if scheduled else []
+            if not due and self._deferred and time.time() >= self._retry_at:
+                due = self._take_deferred()
+            if not due:
+                # Nothing scheduled right now: keep the regular LLM-driven tick going.
+                if time.time() < llm_at:
+                    continue
+                llm_at = self._next_llm_tick()
+            if not self.leader.held:
+                if not self.leader.try_acquire():
+                    continue
+                print(f"[proactive] worker {os.getpid()} is leader for {self.user_id}")
+            if len(due) > 1:
+                print(f"[proactive] {len(due)} events due together, firing {due[0].name} user={self.user_id}")
             try:
-                await self._tick()
+                with llm_priority("proactive"):
+                    await self._tick(due[0] if due else None)
             except asyncio.CancelledError:
                 raise
             except Exception as exc:
@@ -124,44 +177,56 @@ class ProactiveLoop:
                 print("[proactive] error", exc)
                 traceback.print_exc()
 
-    async def _tick(self) -> None:
-        state = _load_state()
+    async def _pick_event(self, local_dt: datetime, profile: Dict[str, Any], avoid: Optional[List[str]] = None) -> Dict[str, Any]:
+        # _pick_event reads the user's data files; keep it off the event loop.
+        return await run_io(self.trigger_agent._pick_event, local_dt, profile, avoid=avoid)
+
+    async def _tick(self, due: Optional[DueEvent] = None) -> None:
+        state = await run_io(_load_state)
         if not state.get("enabled", True):
             return
 
         now = datetime.now(timezone.utc)
         cooldown_until = state.get("cooldown_until")
-        if cooldown_until:
+        # Medication reminders are never held back by the chat cooldown.
+        if cooldown_until and not (due is not None and due.kind == "med"):
             try:
-                if now < datetime.fromisoformat(cooldown_until):
-                    return
+                until = datetime.fromisoformat(cooldown_until)
             except Exception:
-                pass
+                until = None
+            if until is not None and now < until:
+                if due is not None:
+                    # Fire it once the cooldown is over instead of losing it.
+                    self._defer(due, until.timestamp())
+                return
+        if due is not None:
+            min_interval = self.event_min_intervals.get(due.name, self.event_min_intervals.get("fallback_chat", 10))
+            if await self._recent_triggered(self.user_id, due.name, min_interval):
+                print(f"[proactive] skip scheduled {due.name}: fired within {min_interval}s user={self.user_id}")
+                return
 
         # Prepare local time for variety/forcing decisions.
-        try:
-            schedule = load_schedule(self.user_id)
-            tz_name = schedule.get("timezone") if isinstance(schedule, dict) else None
-            try:
-                tz = ZoneInfo(tz_name) if tz_name else ZoneInfo("Asia/Shanghai")  # type: ignore[name-defined]
-            except Exception:
-                tz = timezone(timedelta(hours=8))
-        except Exception:
-            schedule = {}
-            tz = timezone(timedelta(hours=8))
+        tz = await run_io(schedule_engine.tz, self.user_id)
         local_dt = now.astimezone(tz)
-        profile = load_profile(self.user_id)
-
-        decision, decision_raw = await self.trigger_agent.evaluate(self.user_id, now_iso=now.isoformat())
-        if not decision or not isinstance(decision, dict) or not decision.get("trigger") or not decision.get("trigger_context"):
-            # 强制兜底，避免后续缺少 trigger 导致报错
-            decision = self.trigger_agent._pick_event(local_dt, profile, avoid=self._recent_trigger_types(max_count=3))
-
-        # Optional second-stage selection to filter/adjust event choice.
-        history = chat_store.load(self.user_id)
-        decision = await self.selector_agent.select(self.user_id, decision, history=history)
-        if not decision or not isinstance(decision, dict) or not decision.get("trigger") or not decision.get("trigger_context"):
-            decision = self.trigger_agent._pick_event(local_dt, profile, avoid=self._recent_trigger_types(max_count=3))
+        profile = await aload_profile(self.user_id)
+
+        decision_raw: Optional[str] = ""
+        if due is not None:
+            # The schedule already says what is due; no need to ask the LLM.
+            decision = self.trigger_agent._force_event(due.name, local_dt, profile, f"日程 {due.detail}")
+            decision["reason"] = "schedule_due"
+            decision["trigger_id"] = f"schedule-{due.kind}-{int(due.at)}"
+        else:
+            decision, decision_raw = await self.trigger_agent.evaluate(self.user_id, now_iso=now.isoformat())
+            if not decision or not isinstance(decision, dict) or not decision.get("trigger") or not decision.get("trigger_context"):
+                # 强制兜底，避免后续缺少 trigger 导致报错
+                decision = await self._pick_event(local_dt, profile, avoid=await self._recent_trigger_types(max_count=3))
+
+            # Optional second-stage selection to filter/adjust event choice.
+            history = await chat_store.aload(self.user_id)
+            decision = await self.selector_agent.select(self.user_id, decision, history=history)
+            if not decision or not isinstance(decision, dict) or not decision.get("trigger") or not decision.get("trigger_context"):
+                decision = await self._pick_event(local_dt, profile, avoid=await self._recent_trigger_types(max_count=3))
         if not decision or not decision.get("trigger") or not decision.get("trigger_context"):
             print(f"[proactive] invalid decision after selector user={self.user_id} raw='{(decision_raw or '')[:200]}'")
             return
@@ -173,44 +238,49 @@ class ProactiveLoop:
         }
         trigger_ctx = decision.get("trigger_context") or ""
         trigger_type = self._parse_trigger_type(trigger_ctx)
+        recent_types = await self._recent_trigger_types(max_count=3)
 
-        # 如果上下文与最近的系统注入重复，尝试换一个话题再试一次
-        if self._recent_same_context(trigger_ctx):
-            alt = self.trigger_agent._pick_event(local_dt, profile, avoid=recent_types + ([trigger_type] if trigger_type else []))
-            trigger_ctx = alt.get("trigger_context") or trigger_ctx
-            decision = alt
-            trigger_type = self._parse_trigger_type(trigger_ctx)
-            trigger_meta["trigger_reason"] = alt.get("reason") or trigger_meta.get("trigger_reason")
-            trigger_meta["trigger_id"] = alt.get("trigger_id") or trigger_meta["trigger_id"]
-
-        recent_types = self._recent_trigger_types(max_count=3)
-        if trigger_type and trigger_type in recent_types:
-            alt = self.trigger_agent._pick_event(local_dt, profile, avoid=recent_types)
-            trigger_ctx = alt.get("trigger_context") or trigger_ctx
-            decision = alt
-            trigger_type = self._parse_trigger_type(trigger_ctx)
-            trigger_meta["reason"] = alt.get("reason") or trigger_meta["reason"]
-        if trigger_type and self._recent_trigger_count(trigger_type, max_count=8) >= 2:
-            alt = self.trigger_agent._pick_event(local_dt, profile, avoid=recent_types + [trigger_type])
-            trigger_ctx = alt.get("trigger_context") or trigger_ctx
-            decision = alt
-            trigger_type = self._parse_trigger_type(trigger_ctx)
-            trigger_meta["reason"] = alt.get("reason") or trigger_meta.get("trigger_reason")
-        if trigger_type:
-            min_interval = self.event_min_intervals.get(trigger_type, self.event_min_intervals.get("fallback_chat", 10))
-            if self._recent_triggered(self.user_id, trigger_type, min_interval):
-                # Instead of skipping, force a different event to increase diversity.
-                alt = self.trigger_agent._pick_event(local_dt, profile, avoid=[trigger_type] + recent_types)
+        if due is not None:
+            trigger_meta["schedule_due"] = {"name": due.name, "kind": due.kind, "detail": due.detail}
+        else:
+            # 如果上下文与最近的系统注入重复，尝试换一个话题再试一次
+            if await self._recent_same_context(trigger_ctx):
+                alt = await self._pick_event(local_dt, profile, avoid=recent_types + ([trigger_type] if trigger_type else []))
+                trigger_ctx = alt.get("trigger_context") or trigger_ctx
+                decision = alt
+                trigger_type = self._parse_trigger_type(trigger_ctx)
+                trigger_meta["trigger_reason"] = alt.get("reason") or trigger_meta.get("trigger_reason")
+                trigger_meta["trigger_id"] = alt.get("trigger_id") or trigger_meta["trigger_id"]
+
+            if trigger_type and trigger_type in recent_types:
+                alt = await self._pick_event(local_dt, profile, avoid=recent_types)
                 trigger_ctx = alt.get("trigger_context") or trigger_ctx
                 decision = alt
                 trigger_type = self._parse_trigger_type(trigger_ctx)
                 trigger_meta["reason"] = alt.get("reason") or trigger_meta["reason"]
+            if trigger_type and await self._recent_trigger_count(trigger_type, max_count=8) >= 2:
+                alt = await self._pick_event(local_dt, profile, avoid=recent_types + [trigger_type])
+                trigger_ctx = alt.get("trigger_context") or trigger_ctx
+                decision = alt
+                trigger_type = self._parse_trigger_type(trigger_ctx)
+                trigger_meta["reason"] = alt.get("reason") or trigger_meta.get("trigger_reason")
+            if trigger_type:
+                min_interval = self.event_min_intervals.get(trigger_type, self.event_min_intervals.get("fallback_chat", 10))
+                if await self._recent_triggered(self.user_id, trigger_type, min_interval):
+                    # Instead of skipping, force a different event to increase diversity.
+                    alt = await self._pick_event(local_dt, profile, avoid=[trigger_type] + recent_types)
+                    trigger_ctx = alt.get("trigger_context") or trigger_ctx
+                    decision = alt
+                    trigger_type = self._parse_trigger_type(trigger_ctx)
+                    trigger_meta["reason"] = alt.get("reason") or trigger_meta["reason"]
+        if trigger_type:
+            trigger_meta["trigger_type"] = trigger_type
         print(f"[proactive] firing type={trigger_type or '<unknown>'} reason={trigger_meta['trigger_reason']} id={trigger_meta['trigger_id']} user={self.user_id}")
 
         # 按概率决定是否写入 system_inject；避免过多重复注入
-        do_inject = random.random() < self.inject_rate
+        do_inject = due is not None or random.random() < self.inject_rate
         if do_inject:
-            chat_store.append(
+            await chat_store.aappend(
                 self.user_id,
                 role="system_inject",
                 content=trigger_ctx,
@@ -221,11 +291,11 @@ class ProactiveLoop:
         else:
             trigger_meta["inject_skipped"] = True
 
-        profile = load_profile(self.user_id)
+        profile_version, profile = await aload_profile_versioned(self.user_id)
         text_parts = []
         # 决定 assistant 是否使用触发上下文（提高随机性）
         extra_for_assistant = trigger_ctx if do_inject else None
-        if random.random() < self.assistant_random_rate:
+        if due is None and random.random() < self.assistant_random_rate:
             extra_for_assistant = None
         async for event, data in self.response_agent.generate(
             self.user_id,
@@ -233,6 +303,7 @@ class ProactiveLoop:
             mode="proactive",
             stream=True,
             profile=profile,
+            profile_version=profile_version,
         ):
             name = (event or "").lower()
             if name in ("message", "answer"):
@@ -241,7 +312,7 @@ class ProactiveLoop:
 
         if reply_text:
             # 如果与最近助手回复重复，则替换为轻量陪聊句，避免重复血糖长文
-            if self._recent_same_reply(reply_text, lookback=6):
+            if await self._recent_same_reply(reply_text, lookback=6):
                 alt_replies = [
                     "刚刚的血糖提醒已经收到，这会儿想聊点轻松的吗？比如最近在看什么剧？",
                     "记录一下刚才的血糖情况，顺便放松下：最近有去散步或做拉伸吗？",
@@ -250,7 +321,7 @@ class ProactiveLoop:
                 ]
                 reply_text = random.choice(alt_replies)
 
-            chat_store.append(
+            await chat_store.aappend(
                 self.user_id,
                 role="assistant",
                 content=reply_text,
@@ -265,14 +336,11 @@ class ProactiveLoop:
                 print(f"[proactive] broadcast_chat len={len(reply_text)} meta={trigger_meta}")
             except Exception:
                 pass
-            try:
-                asyncio.create_task(self.profile_agent.run(self.user_id))
-            except RuntimeError:
-                pass
+            profile_sync.request(self.user_id)
         else:
             # 调试兜底：模型无响应也输出一条可见消息，便于前端观察链路。
             debug_text = "[调试] 主动触发后模型未返回内容，请检查上游日志。"
-            chat_store.append(
+            await chat_store.aappend(
                 self.user_id,
                 role="assistant",
                 content=debug_text,
@@ -290,111 +358,43 @@ class ProactiveLoop:
 
         state["last_proactive_at"] = now.isoformat()
         state["cooldown_until"] = (now + timedelta(seconds=self.cooldown_seconds)).isoformat()
-        _save_state(state)
+        await run_io(_save_state, state)
 
     def _parse_trigger_type(self, ctx: str) -> Optional[str]:
-        if not ctx:
-            return None
         # 兼容 [TRIGGER:xxx] 和 [xxx] 形式
-        m = re.search(r"\[TRIGGER:([^\]\s]+)\]", ctx)
-        if m:
-            return m.group(1).strip()
-        m2 = re.search(r"\[([^\]\s]+)\]", ctx)
-        if m2:
-            return m2.group(1).strip()
-        return None
-
-    def _recent_triggered(self, user_id: str, trigger: str, within_seconds: int) -> bool:
+        return parse_trigger_type(ctx)
+
+    # The trigger ledger may read its file on first access; keep that off the loop.
+    async def _recent_triggered(self, user_id: str, trigger: str, within_seconds: int) -> bool:
         if IGNORE_HISTORY:
             return False
-        history = chat_store.load(user_id)
-        cutoff = datetime.now(timezone.utc) - timedelta(seconds=within_seconds)
-        for rec in reversed(history):
-            ts = rec.get("ts")
-            if not ts:
-                continue
-            try:
-                t = datetime.fromisoformat(ts)
-            except Exception:
-                continue
-            if t < cutoff:
-                break
-            content = rec.get("content") or ""
-            if isinstance(content, str) and f"[TRIGGER:{trigger}]" in content:
-                return True
-        return False
-
-    def _recent_trigger_types(self, max_count: int = 5) -> List[str]:
-        history = chat_store.load(self.user_id)
-        types: List[str] = []
-        for rec in reversed(history):
-            content = rec.get("content") or ""
-            if not isinstance(content, str):
-                continue
-            m = re.search(r"\[TRIGGER:([^\]\s]+)\]", content)
-            if not m:
-                continue
-            t = m.group(1).strip()
-            if t:
-                types.append(t)
-            if len(types) >= max_count:
-                break
-        return types
-
-    def _recent_trigger_count(self, trigger: str, max_count: int = 10) -> int:
-        """Count how many times the same trigger type appeared recently."""
+        return await run_io(chat_store.triggers.fired_within, user_id, trigger, within_seconds)
+
+    async def _recent_trigger_types(self, max_count: int = 5) -> List[str]:
+        return await run_io(chat_store.triggers.recent_types, self.user_id, limit=max_count)
+
+    async def _recent_trigger_count(self, trigger: str, max_count: int = 10) -> int:
+        """Count how many of the last ``max_count`` fires used the same trigger type."""
         if not trigger:
             return 0
-        history = chat_store.load(self.user_id)
-        count = 0
-        seen = 0
-        for rec in reversed(history):
-            content = rec.get("content") or ""
-            if not isinstance(content, str):
-                continue
-            if f"[{trigger}]" in content or f"[TRIGGER:{trigger}]" in content:
-                count += 1
-            seen += 1
-            if seen >= max_count:
-                break
-        return count
-
-    def _recent_same_context(self, ctx: str, lookback: int = 5) -> bool:
+        return await run_io(chat_store.triggers.count, self.user_id, trigger, last_k=max_count)
+
+    async def _recent_same_context(self, ctx: str, lookback: int = 5) -> bool:
         """Return True if the same system_inject content appeared recently."""
         if not ctx:
             return False
-        history = chat_store.load(self.user_id, limit=lookback * 5)
-        count = 0
-        for rec in reversed(history):
-            if rec.get("role") != "system_inject":
-                continue
-            if rec.get("content") == ctx:
-                return True
-            count += 1
-            if count >= lookback:
-                break
-        return False
-
-    def _recent_same_reply(self, reply: str, lookback: int = 5) -> bool:
+        return ctx in await run_io(chat_store.recent_contents, self.user_id, "system_inject", lookback)
+
+    async def _recent_same_reply(self, reply: str, lookback: int = 5) -> bool:
         """Return True if identical assistant reply appeared recently."""
         if not reply:
             return False
-        history = chat_store.load(self.user_id, limit=lookback * 5)
-        count = 0
-        for rec in reversed(history):
-            if rec.get("role") != "assistant":
-                continue
-            if rec.get("content") == reply:
-                return True
-            count += 1
-            if count >= lookback:
-                break
-        return False
+        return reply in await run_io(chat_store.recent_contents, self.user_id, "assistant", lookback)
 
     async def _send_fallback_chat(self, now: datetime) -> None:
         """Send a friendly proactive nudge without TRIGGER tag as last-resort fallback."""
         # Avoid spamming fallback_chat if fired very recently.
-        if self._recent_triggered(self.user_id, "fallback_chat", self.event_min_intervals.get("fallback_chat", 10)):
+        if await self._recent_triggered(self.user_id, "fallback_chat", self.event_min_intervals.get("fallback_chat", 10)):
             return
         messages = [
             "最近还好吗？有新的血糖记录、饮食或运动情况想聊聊吗？我随时在～",
@@ -403,14 +403,11 @@ class ProactiveLoop:
         ]
         text = random.choice(messages)
         meta = {"mode": "proactive", "trigger_reason": "fallback_chat", "trigger_id": f"fallback-{now.isoformat()}"}
-        chat_store.append(self.user_id, role="assistant", content=text, visible=True, source="FallbackAgent", meta=meta)
+        await chat_store.aappend(self.user_id, role="assistant", content=text, visible=True, source="FallbackAgent", meta=meta)
         try:
             await state_stream_manager.broadcast_chat(
                 user_id=self.user_id, role="assistant", text=text, meta=meta
             )
         except Exception:
             pass
-        try:
-            asyncio.create_task(self.profile_agent.run(self.user_id))
-        except RuntimeError:
-            pass
+        profile_sync.request(self.user_id)
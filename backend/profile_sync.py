@@ -0,0 +1,120 @@
+"""Debounced, coalesced ProfileUpdateAgent runs.
+
+Chat replies and proactive messages call ``profile_sync.request(user_id)``
+instead of spawning ``ProfileUpdateAgent.run`` themselves. Per user there
+is at most one run in flight; requests that arrive meanwhile collapse into
+a single follow-up run. A run starts once the user has been quiet for
+``PROFILE_SYNC_DEBOUNCE_SECONDS``, but never later than
+``PROFILE_SYNC_MAX_STALENESS_SECONDS`` after the first pending request, so
+a steady stream of messages still gets synced. ``close()`` runs whatever
+is pending without waiting out the debounce and awaits the runs.
+"""
+import asyncio
+import os
+from typing import Dict, Optional, Set
+
+from .agents import ProfileUpdateAgent
+
+PROFILE_SYNC_DEBOUNCE_SECONDS = float(os.getenv("PROFILE_SYNC_DEBOUNCE_SECONDS", "3"))
+PROFILE_SYNC_MAX_STALENESS_SECONDS = float(os.getenv("PROFILE_SYNC_MAX_STALENESS_SECONDS", "30"))
+PROFILE_SYNC_SHUTDOWN_TIMEOUT = float(os.getenv("PROFILE_SYNC_SHUTDOWN_TIMEOUT", "30"))
+
+
+class _UserSync:
+    def __init__(self) -> None:
+        self.task: Optional[asyncio.Task] = None
+        self.dirty = False
+        self.first_pending: Optional[float] = None
+        self.last_request = 0.0
+        self.runs = 0
+        self.coalesced = 0
+
+
+class ProfileSyncCoordinator:
+    def __init__(
+        self,
+        agent: Optional[ProfileUpdateAgent] = None,
+        debounce_seconds: float = PROFILE_SYNC_DEBOUNCE_SECONDS,
+        max_staleness_seconds: float = PROFILE_SYNC_MAX_STALENESS_SECONDS,
+    ) -> None:
+        self.agent = agent or ProfileUpdateAgent()
+        self.debounce = max(0.0, debounce_seconds)
+        self.max_staleness = max(self.debounce, max_staleness_seconds)
+        self._users: Dict[str, _UserSync] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._flush: Optional[asyncio.Event] = None
+
+    def request(self, user_id: str) -> None:
+        """Ask for a sync of ``user_id``; cheap to call after every message."""
+        loop = asyncio.get_running_loop()
+        if self._flush is None:
+            self._flush = asyncio.Event()
+        state = self._users.setdefault(user_id, _UserSync())
+        now = loop.time()
+        if state.dirty:
+            state.coalesced += 1
+        else:
+            state.first_pending = now
+        state.dirty = True
+        state.last_request = now
+        if state.task is None or state.task.done():
+            task = loop.create_task(self._drive(user_id, state), name=f"profile-sync-{user_id}")
+            state.task = task
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _drive(self, user_id: str, state: _UserSync) -> None:
+        loop = asyncio.get_running_loop()
+        flush = self._flush or asyncio.Event()
+        try:
+            while state.dirty:
+                while not flush.is_set():
+                    deadline = min(state.last_request + self.debounce, (state.first_pending or 0.0) + self.max_staleness)
+                    wait = deadline - loop.time()
+                    if wait <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(flush.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                # Requests from here on mark the state dirty again and get one follow-up run.
+                state.dirty = False
+                state.first_pending = None
+                state.runs += 1
+                try:
+                    await self.agent.run(user_id)
+                except Exception as exc:
+                    print(f"[profile_sync] run failed user={user_id}: {exc}")
+        finally:
+            # Idle users are forgotten; the next request() starts a fresh state.
+            if not state.dirty and self._users.get(user_id) is state:
+                del self._users[user_id]
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Users with a sync pending or running; idle users are not tracked."""
+        return {
+            user_id: {
+                "running": state.task is not None and not state.task.done(),
+                "pending": state.dirty,
+                "runs": state.runs,
+                "coalesced": state.coalesced,
+            }
+            for user_id, state in self._users.items()
+        }
+
+    async def close(self, timeout: float = PROFILE_SYNC_SHUTDOWN_TIMEOUT) -> None:
+        """Run pending syncs now and wait for them (cancelled after ``timeout``)."""
+        if self._flush is not None:
+            self._flush.set()
+        tasks = list(self._tasks)
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            print(f"[profile_sync] cancelled {len(pending)} sync(s) still running at shutdown")
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+profile_sync = ProfileSyncCoordinator()
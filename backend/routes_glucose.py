@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+
+from .glucose_store import RANGE_HIGH, RANGE_LOW, aappend_glucose, aglucose_stats
+
+router = APIRouter()
+
+
+class GlucoseReading(BaseModel):
+    ts: str  # ISO8601; naive values are treated as UTC
+    value: float  # mmol/L
+
+
+class GlucoseIngest(BaseModel):
+    readings: List[GlucoseReading]
+
+
+def _parse_ts(value: str) -> float:
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+@router.get("/glucose/{user_id}/stats")
+async def glucose_stats(
+    user_id: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    days: int = 14,
+    low: float = RANGE_LOW,
+    high: float = RANGE_HIGH,
+    tz: str = "Asia/Shanghai",
+    daily: bool = True,
+):
+    """Mean / SD / CV / time-in-range and daily percentiles over [start, end).
+
+    Without ``start`` the window is the last ``days`` days before ``end``
+    (``days=0`` means all readings).
+    """
+    try:
+        tzinfo = ZoneInfo(tz)
+        end_ts = _parse_ts(end) if end else None
+        if start:
+            start_ts: Optional[float] = _parse_ts(start)
+        elif days > 0:
+            ref = datetime.fromtimestamp(end_ts, timezone.utc) if end_ts is not None else datetime.now(timezone.utc)
+            start_ts = (ref - timedelta(days=days)).timestamp()
+        else:
+            start_ts = None
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    try:
+        return await aglucose_stats(user_id, start_ts, end_ts, low=low, high=high, tz=tzinfo, daily=daily)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc)) from exc
+
+
+@router.post("/glucose/{user_id}")
+async def ingest_glucose(user_id: str, body: GlucoseIngest):
+    """Append readings (e.g. a CGM export) to the user's series."""
+    try:
+        rows = [(_parse_ts(r.ts), r.value) for r in body.readings]
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    written = await aappend_glucose(user_id, rows)
+    return {"ok": True, "written": written}
@@ -0,0 +1,157 @@
+"""Due-time engine for schedule-driven proactive triggers.
+
+Parses ``data/schedules/{user_id}.json`` once per file change, caches the
+resulting ``tzinfo``, and keeps each user's upcoming fire times in a
+min-heap. Every ``today_windows`` entry (the schema the timeline panel
+already edits and shows) fires daily at its ``start``; medication reminders
+are ordinary windows whose name starts with "用药"::
+
+    {"timezone": "Asia/Shanghai",
+     "today_windows": [{"start": "07:30", "end": "08:30", "name": "三餐-早餐建议"},
+                       {"start": "20:00", "end": "20:15", "name": "用药-提醒"}]}
+
+The proactive loop sleeps until the next due time or its regular LLM tick,
+whichever comes first.
+"""
+import heapq
+import itertools
+import os
+import threading
+from datetime import datetime, time, timedelta, timezone, tzinfo
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from .schedule_store import load_schedule, schedule_path
+
+DEFAULT_TZ = "Asia/Shanghai"
+# Events found more than this late (e.g. after the host slept) are dropped, not fired.
+DUE_GRACE_SECONDS = int(os.getenv("SCHEDULE_DUE_GRACE_SECONDS", "600"))
+MED_PREFIX = "用药"
+
+
+class DueEvent(NamedTuple):
+    at: float  # epoch seconds
+    name: str
+    kind: str  # "window" | "med"
+    detail: str  # e.g. "07:30-08:30"
+    until: float  # still worth firing before this (window end, at least the due grace)
+
+
+@lru_cache(maxsize=64)
+def get_tz(name: Optional[str]) -> tzinfo:
+    """Cached tz lookup; falls back to UTC+8 when the name is unknown."""
+    try:
+        return ZoneInfo(name or DEFAULT_TZ)
+    except Exception:
+        return timezone(timedelta(hours=8))
+
+
+def _parse_hhmm(value: Any) -> Optional[time]:
+    try:
+        hour, minute = str(value).strip().split(":")[:2]
+        return time(int(hour), int(minute))
+    except Exception:
+        return None
+
+
+class _UserSchedule:
+    def __init__(self, sig: Optional[Tuple[int, int]], tz: tzinfo, specs: List[Tuple[time, str, str, str, int]]) -> None:
+        self.sig = sig
+        self.tz = tz
+        self.specs = specs
+        self.heap: List[Tuple[float, int, int]] = []  # (epoch, seq, spec index)
+
+
+class ScheduleEngine:
+    def __init__(self) -> None:
+        self._users: Dict[str, _UserSchedule] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def _signature(self, user_id: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(schedule_path(user_id))
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _occurrence(self, spec_time: time, tz: tzinfo, after: float) -> float:
+        """First local occurrence of ``spec_time`` at or after epoch ``after``."""
+        local = datetime.fromtimestamp(after, tz)
+        candidate = datetime.combine(local.date(), spec_time, tzinfo=tz)
+        if candidate.timestamp() < after:
+            candidate = datetime.combine(local.date() + timedelta(days=1), spec_time, tzinfo=tz)
+        return candidate.timestamp()
+
+    def _parse(self, user_id: str, sig: Optional[Tuple[int, int]], now: float) -> _UserSchedule:
+        schedule: Dict[str, Any] = {}
+        if sig is not None:
+            try:
+                schedule = load_schedule(user_id)
+            except Exception as exc:
+                print(f"[schedule] failed to load schedule for {user_id}: {exc}")
+        tz = get_tz(schedule.get("timezone") if isinstance(schedule, dict) else None)
+        specs: List[Tuple[time, str, str, str, int]] = []
+        for window in (schedule.get("today_windows") or []) if isinstance(schedule, dict) else []:
+            if not isinstance(window, dict):
+                continue
+            start = _parse_hhmm(window.get("start"))
+            if start is None:
+                continue
+            name = str(window.get("name") or "规划-日程")
+            detail = f"{window.get('start')}-{window.get('end') or ''}".rstrip("-")
+            end = _parse_hhmm(window.get("end"))
+            length = 0
+            if end is not None:
+                length = ((end.hour * 60 + end.minute) - (start.hour * 60 + start.minute)) % (24 * 60) * 60
+            specs.append((start, name, "med" if name.startswith(MED_PREFIX) else "window", detail, length))
+        entry = _UserSchedule(sig, tz, specs)
+        for idx, spec in enumerate(specs):
+            heapq.heappush(entry.heap, (self._occurrence(spec[0], tz, now), next(self._seq), idx))
+        return entry
+
+    def _entry(self, user_id: str, now: float) -> _UserSchedule:
+        sig = self._signature(user_id)
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or entry.sig != sig:
+                entry = self._parse(user_id, sig, now)
+                self._users[user_id] = entry
+            return entry
+
+    def tz(self, user_id: str) -> tzinfo:
+        return self._entry(user_id, datetime.now(timezone.utc).timestamp()).tz
+
+    def has_events(self, user_id: str) -> bool:
+        return bool(self._entry(user_id, datetime.now(timezone.utc).timestamp()).specs)
+
+    def _event(self, at: float, spec: Tuple[time, str, str, str, int]) -> DueEvent:
+        return DueEvent(at, spec[1], spec[2], spec[3], at + max(spec[4], DUE_GRACE_SECONDS))
+
+    def next_due(self, user_id: str, now: Optional[float] = None) -> Optional[DueEvent]:
+        now = datetime.now(timezone.utc).timestamp() if now is None else now
+        entry = self._entry(user_id, now)
+        with self._lock:
+            if not entry.heap:
+                return None
+            at, _, idx = entry.heap[0]
+            return self._event(at, entry.specs[idx])
+
+    def pop_due(self, user_id: str, now: Optional[float] = None) -> List[DueEvent]:
+        """Pop every event due at ``now`` and reschedule each for its next day."""
+        now = datetime.now(timezone.utc).timestamp() if now is None else now
+        entry = self._entry(user_id, now)
+        due: List[DueEvent] = []
+        with self._lock:
+            while entry.heap and entry.heap[0][0] <= now:
+                at, _, idx = heapq.heappop(entry.heap)
+                spec = entry.specs[idx]
+                if now - at <= DUE_GRACE_SECONDS:
+                    due.append(self._event(at, spec))
+                nxt = self._occurrence(spec[0], entry.tz, max(at, now) + 1)
+                heapq.heappush(entry.heap, (nxt, next(self._seq), idx))
+        return due
+
+
+schedule_engine = ScheduleEngine()
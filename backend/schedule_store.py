@@ -1,14 +1,25 @@
-import json
 from pathlib import Path
 from typing import Dict
 
+from . import json_codec
+from .data_paths import user_path
+from .io_executor import run_io
+
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
 SCHEDULE_DIR = DATA_DIR / "schedules"
 
 
+def schedule_path(user_id: str) -> Path:
+    return user_path(SCHEDULE_DIR, user_id, ".json")
+
+
 def load_schedule(user_id: str) -> Dict:
-    path = SCHEDULE_DIR / f"{user_id}.json"
+    path = schedule_path(user_id)
     if not path.exists():
         raise FileNotFoundError(f"schedule not found for user_id={user_id}")
-    return json.loads(path.read_text(encoding="utf-8"))
+    return json_codec.loads(path.read_text(encoding="utf-8"))
+
+
+async def aload_schedule(user_id: str) -> Dict:
+    return await run_io(load_schedule, user_id)
@@ -1,13 +1,15 @@
 import asyncio
-import json
 import os
 from typing import Any, AsyncGenerator, Dict, List, Optional
 
 from fastapi import APIRouter
 from fastapi.responses import StreamingResponse
 
-from .app.profile_store import load_profile
-from .schedule_store import load_schedule
+from . import json_codec
+from .app.profile_store import aload_profile_versioned
+from .schedule_store import aload_schedule
+from .io_executor import run_io
+from .user_data import user_data
 
 DEFAULT_USER_ID = os.getenv("PROACTIVE_USER_ID", "u_demo_young_male")
 
@@ -19,6 +21,8 @@ class StateStreamManager:
         self._connections: Dict[str, List[asyncio.Queue]] = {}
         self._lock = asyncio.Lock()
         self._running = False
+        # Last profile version pushed per user; unchanged profiles are not re-sent.
+        self._profile_versions: Dict[str, int] = {}
 
     async def start(self) -> None:
         self._running = True
@@ -46,7 +50,7 @@ class StateStreamManager:
                 event, payload = await queue.get()
                 if event is None:
                     break
-                data = json.dumps(payload, ensure_ascii=False)
+                data = json_codec.dumps(payload)
                 yield f"event: {event}\ndata: {data}\n\n"
         finally:
             async with self._lock:
@@ -58,12 +62,12 @@ class StateStreamManager:
 
     async def _enqueue_snapshot(self, queue: asyncio.Queue, user_id: str) -> None:
         try:
-            profile = load_profile(user_id)
-            await queue.put(("profile_update", {"user_id": user_id, "profile": profile}))
+            version, profile = await aload_profile_versioned(user_id)
+            await queue.put(("profile_update", {"user_id": user_id, "version": version, "profile": profile}))
         except Exception as exc:
             await queue.put(("state_error", {"message": f"profile load failed: {exc}"}))
         try:
-            schedule = load_schedule(user_id)
+            schedule = await aload_schedule(user_id)
             await queue.put(("schedule_update", {"user_id": user_id, "schedule": schedule}))
         except FileNotFoundError:
             await queue.put(("schedule_update", {"user_id": user_id, "schedule": None}))
@@ -90,16 +94,19 @@ class StateStreamManager:
     async def broadcast_profile(self, user_id: str) -> None:
         """Push profile update to all listeners for this user."""
         try:
-            profile = load_profile(user_id)
+            version, profile = await aload_profile_versioned(user_id)
         except Exception as exc:
             await self._broadcast("state_error", {"message": f"profile load failed: {exc}"}, user_id=user_id)
             return
-        await self._broadcast("profile_update", {"user_id": user_id, "profile": profile}, user_id=user_id)
+        if self._profile_versions.get(user_id) == version:
+            return
+        self._profile_versions[user_id] = version
+        await self._broadcast("profile_update", {"user_id": user_id, "version": version, "profile": profile}, user_id=user_id)
 
     async def broadcast_schedule(self, user_id: str) -> None:
         """Push schedule update to all listeners for this user."""
         try:
-            schedule = load_schedule(user_id)
+            schedule = await aload_schedule(user_id)
         except FileNotFoundError:
             await self._broadcast("schedule_update", {"user_id": user_id, "schedule": None}, user_id=user_id)
             return
@@ -108,6 +115,17 @@ class StateStreamManager:
             return
         await self._broadcast("schedule_update", {"user_id": user_id, "schedule": schedule}, user_id=user_id)
 
+    async def broadcast_user_data(self, user_id: str, modules: List[str]) -> None:
+        """Push the given data/users modules (only those that changed) to listeners."""
+        if not modules:
+            return
+        try:
+            payload = await run_io(lambda: {name: user_data.load(user_id, name) for name in modules})
+        except Exception as exc:
+            await self._broadcast("state_error", {"message": f"user data load failed: {exc}"}, user_id=user_id)
+            return
+        await self._broadcast("user_data_update", {"user_id": user_id, "modules": payload}, user_id=user_id)
+
     async def broadcast_chat(self, *, user_id: str, role: str, text: str, meta: Optional[Dict[str, Any]] = None) -> None:
         """Push chat message (typically proactive assistant) to UI listeners."""
         await self._broadcast(
@@ -154,7 +172,7 @@ async def proactive_stream(user_id: str = DEFAULT_USER_ID):
                 text = payload.get("text") or ""
                 if not text:
                     continue
-                data = json.dumps({"delta": text}, ensure_ascii=False)
+                data = json_codec.dumps({"delta": text})
                 yield f"event: proactive_delta\ndata: {data}\n\n"
                 yield "event: proactive_done\n\n"
         finally:
@@ -1,4 +1,4 @@
-import { getUserIdFromUrl, loadUserData } from './store.js';
+import { getUserIdFromUrl, loadUserData, subscribeUserData } from './store.js';
 import { createRouter } from './router.js';
 
 import { mountSidebar, updateSidebar } from '../bundles/sidebar.bundle.js';
@@ -28,18 +28,22 @@ async function bootstrap() {
 
   const router = createRouter();
   let refreshing = false;
+  function renderAll() {
+    initOverviewView();
+    initHealthView();
+    initDietView();
+    initEventsView();
+    initChatView();
+    updateSidebar();
+  }
+
   async function refreshAll() {
     if (refreshing) return;
     refreshing = true;
     const userId = getUserIdFromUrl();
     try {
       await loadUserData(userId);
-      initOverviewView();
-      initHealthView();
-      initDietView();
-      initEventsView();
-      initChatView();
-      updateSidebar();
+      renderAll();
     } finally {
       refreshing = false;
     }
@@ -52,6 +56,9 @@ async function bootstrap() {
 
   await refreshAll();
   router.switchView('overview');
+
+  // 画像同步写完模块后服务端只推送变化的模块，收到即重绘
+  subscribeUserData(getUserIdFromUrl(), () => { if (!refreshing) renderAll(); });
 }
 
 bootstrap().catch(err => {
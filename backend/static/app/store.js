@@ -87,6 +87,35 @@ export async function loadUserData(userId) {
   return state;
 }
 
+// 服务端推送（/api/state/stream 的 user_data_update）：只带变化的模块，直接写回 state
+const MODULE_KEYS = {
+  profile_static: 'profileStatic',
+  smalltalk: 'smalltalk',
+  health_record: 'healthRecord',
+  diet_2w: 'diet2w',
+  recent_events: 'recentEvents',
+  habits: 'habits'
+};
+
+export function subscribeUserData(userId, onUpdate) {
+  if (typeof EventSource === 'undefined') return null;
+  const es = new EventSource(`/api/state/stream?user_id=${encodeURIComponent(userId)}`);
+  es.addEventListener('user_data_update', (e) => {
+    let data = {};
+    try { data = JSON.parse(e.data || '{}'); } catch { return; }
+    if (data.user_id && data.user_id !== state.userId) return;
+    const changed = [];
+    Object.entries(data.modules || {}).forEach(([name, doc]) => {
+      const key = MODULE_KEYS[name];
+      if (!key) return;
+      state[key] = doc;
+      changed.push(name);
+    });
+    if (changed.length) onUpdate(changed);
+  });
+  return es;
+}
+
 // getters（对字段名不强绑定，尽量宽容）
 export function getBasic() { return state.profileStatic?.basic || {}; }
 export function getGoals() { return state.profileStatic?.health_goal || {}; }
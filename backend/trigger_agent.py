@@ -1,39 +1,13 @@
-import json
 import random
 from datetime import datetime, timezone, timedelta
-from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
+from . import json_codec
 from .openai_client import chat_once
-from .chat_history import ChatHistoryStore
-from .app.profile_store import load_profile
-from .schedule_store import load_schedule
-
-chat_store = ChatHistoryStore()
-
-
-def _safe_load(path: Path) -> Dict[str, Any]:
-    """
-    Load JSON if present; fall back to .md/.txt or raw text as {"summary": text}.
-    The doctor Agent sometimes writes markdown notes instead of JSON, so we
-    normalize to a dict with a summary field when JSON parsing fails.
-    """
-    candidates = [path]
-    if path.suffix == ".json":
-        candidates += [path.with_suffix(".md"), path.with_suffix(".txt")]
-    for p in candidates:
-        if not p.exists():
-            continue
-        try:
-            return json.loads(p.read_text(encoding="utf-8"))
-        except Exception:
-            try:
-                text = p.read_text(encoding="utf-8").strip()
-                if text:
-                    return {"summary": text[:2000]}
-            except Exception:
-                pass
-    return {}
+from .chat_history import chat_store
+from .app.profile_store import aload_profile
+from .io_executor import run_io
+from .user_data import user_data
 
 
 class ScheduleTriggerAgent:
@@ -72,31 +46,11 @@ class ScheduleTriggerAgent:
     )
 
     def _load_user_data(self, user_id: str) -> Dict[str, Any]:
-        base = Path(__file__).resolve().parent / "data" / "users" / user_id
-        return {
-            "profile_static": _safe_load(base / "profile_static.json"),
-            "health_record": _safe_load(base / "health_record.json"),
-            "diet_2w": _safe_load(base / "diet_2w.json"),
-            "recent_events": _safe_load(base / "recent_events.json"),
-            "habits": _safe_load(base / "habits.json"),
-            "smalltalk": _safe_load(base / "smalltalk.json"),
-        }
+        # Markdown/plain-text notes are normalized to {"summary": text} by the repository.
+        return user_data.load_all(user_id)
 
     def _recent_triggers(self, user_id: str, limit: int = 3) -> List[str]:
-        history = chat_store.load(user_id)
-        triggers: List[str] = []
-        for msg in reversed(history):
-            content = msg.get("content", "")
-            if "[TRIGGER:" in content:
-                start = content.find("[TRIGGER:") + 9
-                end = content.find("]", start)
-                if start > 8 and end > start:
-                    t = content[start:end].strip()
-                    if t and t not in triggers:
-                        triggers.append(t)
-            if len(triggers) >= limit:
-                break
-        return triggers
+        return chat_store.triggers.recent_types(user_id, limit=limit, unique=True)
 
     def _data_options(self, data: Dict[str, Any]) -> Tuple[List[str], Dict[str, str]]:
         """Return dynamic candidates and hint map."""
@@ -201,15 +155,15 @@ class ScheduleTriggerAgent:
         return self._force_event(topic, local_dt, profile, hint)
 
     async def evaluate(self, user_id: str, now_iso: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], str]:
-        profile = load_profile(user_id)
-        user_data = self._load_user_data(user_id)
+        profile = await aload_profile(user_id)
+        user_data = await run_io(self._load_user_data, user_id)
 
         now_dt = datetime.fromisoformat(now_iso) if now_iso else datetime.now(timezone.utc)
         # 简单固定 +8 时区
         local_dt = now_dt.astimezone(timezone(timedelta(hours=8)))
         current_time_str = local_dt.strftime("%H:%M")
 
-        recent_triggers = self._recent_triggers(user_id, limit=3)
+        recent_triggers = await run_io(self._recent_triggers, user_id, limit=3)
         data_options, hint_map = self._data_options(user_data)
 
         options = list(set(self.BASE_CANDIDATES + data_options))
@@ -218,7 +172,7 @@ class ScheduleTriggerAgent:
 
         payload = {
             "current_time": current_time_str,
-            "valid_options_json": json.dumps(options, ensure_ascii=False),
+            "valid_options_json": json_codec.dumps(options),
             "recent_triggers": recent_triggers,
             "data_brief": self._build_brief(user_data),
         }
@@ -240,7 +194,7 @@ class ScheduleTriggerAgent:
                 decision = None
             else:
                 try:
-                    decision = json.loads(decision_raw)
+                    decision = json_codec.loads(decision_raw)
                 except Exception:
                     try:
                         import ast
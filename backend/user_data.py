@@ -0,0 +1,167 @@
+"""Shared, stat-validated cache for the per-user module files.
+
+``data/users/{user_id}/`` (hash-sharded, see ``data_paths``) holds six modules (profile_static, health_record,
+diet_2w, recent_events, habits, smalltalk). Each is JSON, but the doctor
+Agent may leave a ``.md``/``.txt`` note instead; those are normalized to
+``{"summary": text}``. Entries are re-read only when the file's
+mtime/size changes, and writers going through this module update the
+cache directly. Writes are skipped when the content hash matches the file
+already on disk, so callers can tell which modules actually changed.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from . import json_codec
+from .data_paths import user_path
+from .file_lock import atomic_write_text, locked
+
+USERS_DIR = Path(__file__).resolve().parent / "data" / "users"
+USER_DATA_CACHE_USERS = int(os.getenv("USER_DATA_CACHE_USERS", "256"))
+
+MODULES = ("profile_static", "health_record", "diet_2w", "recent_events", "habits", "smalltalk")
+SUFFIXES = (".json", ".md", ".txt")
+
+# (suffix, mtime_ns, size) of the file that was read; None when none exists.
+Signature = Optional[Tuple[str, int, int]]
+# (signature, parsed data, content digest or None if not hashed yet)
+Entry = Tuple[Signature, Dict[str, Any], Optional[str]]
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _parse(path: Path) -> Dict[str, Any]:
+    try:
+        text = path.read_text(encoding="utf-8")
+    except Exception:
+        return {}
+    try:
+        data = json_codec.loads(text)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        text = text.strip()
+        return {"summary": text[:2000]} if text else {}
+
+
+class UserDataRepository:
+    """Per-user module files, cached until their stat signature changes.
+
+    Returned dicts are shared with the cache; callers must not mutate them.
+    """
+
+    def __init__(self, base: Path = USERS_DIR, cache_users: int = USER_DATA_CACHE_USERS) -> None:
+        self.base = base
+        self.cache_users = max(1, cache_users)
+        self._cache: "OrderedDict[str, Dict[str, Entry]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def user_dir(self, user_id: str) -> Path:
+        return user_path(self.base, user_id)
+
+    def path(self, user_id: str, name: str, suffix: str = ".json") -> Path:
+        return self.user_dir(user_id) / f"{name}{suffix}"
+
+    def _probe(self, user_id: str, name: str) -> Tuple[Signature, Optional[Path]]:
+        for suffix in SUFFIXES:
+            path = self.path(user_id, name, suffix)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            return (suffix, st.st_mtime_ns, st.st_size), path
+        return None, None
+
+    def _store(self, user_id: str, name: str, sig: Signature, data: Dict[str, Any], digest: Optional[str] = None) -> None:
+        with self._lock:
+            modules = self._cache.get(user_id)
+            if modules is None:
+                modules = self._cache[user_id] = {}
+            modules[name] = (sig, data, digest)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_users:
+                self._cache.popitem(last=False)
+
+    def load(self, user_id: str, name: str) -> Dict[str, Any]:
+        sig, path = self._probe(user_id, name)
+        with self._lock:
+            entry = self._cache.get(user_id, {}).get(name)
+        if entry is not None and entry[0] == sig:
+            return entry[1]
+        data = _parse(path) if path is not None else {}
+        self._store(user_id, name, sig, data)
+        return data
+
+    def versions(self, user_id: str, names: Tuple[str, ...] = MODULES) -> Tuple[Signature, ...]:
+        """Stat signatures of the given modules; changes whenever any of them is rewritten."""
+        return tuple(self._probe(user_id, name)[0] for name in names)
+
+    def load_all(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        return {name: self.load(user_id, name) for name in MODULES}
+
+    def _current_digest(self, user_id: str, name: str, path: Path) -> Optional[str]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._cache.get(user_id, {}).get(name)
+        if entry is not None and entry[0] == (".json", st.st_mtime_ns, st.st_size) and entry[2]:
+            return entry[2]
+        try:
+            return _digest(path.read_text(encoding="utf-8"))
+        except Exception:
+            return None
+
+    def write(self, user_id: str, name: str, data: Dict[str, Any]) -> bool:
+        """Atomically write ``{name}.json``; returns False when the content is unchanged."""
+        path = self.path(user_id, name)
+        text = json_codec.dumps(data, indent=2)
+        digest = _digest(text)
+        with locked(path):
+            # Re-resolve under the lock in case the migration tool just moved the user.
+            path = self.path(user_id, name)
+            if self._current_digest(user_id, name, path) == digest:
+                return False
+            atomic_write_text(path, text)
+            self._store(user_id, name, self._probe(user_id, name)[0], data, digest)
+        return True
+
+    def update(
+        self,
+        user_id: str,
+        name: str,
+        mutate: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+        default: Callable[[], Dict[str, Any]] = dict,
+    ) -> bool:
+        """Locked read-modify-write of ``{name}.json``.
+
+        ``mutate`` gets a private copy of the current JSON document (or
+        ``default()``) and returns the document to write, or None to skip.
+        Returns True when the file changed.
+        """
+        path = self.path(user_id, name)
+        with locked(path):
+            path = self.path(user_id, name)
+            try:
+                current = json_codec.loads(path.read_text(encoding="utf-8"))
+            except Exception:
+                current = None
+            updated = mutate(current if isinstance(current, dict) else default())
+            if updated is None:
+                return False
+            return self.write(user_id, name, updated)
+
+    def invalidate(self, user_id: str, name: Optional[str] = None) -> None:
+        with self._lock:
+            if name is None:
+                self._cache.pop(user_id, None)
+            else:
+                self._cache.get(user_id, {}).pop(name, None)
+
+
+user_data = UserDataRepository()
@@ -0,0 +1,98 @@
+"""
+Chat history tail read: whole-file splitlines vs. reverse block reader.
+
+Builds synthetic JSONL histories of increasing size and times loading the
+last LIMIT records the old way (read_text().splitlines()[-limit:]) and
+through ``chat_history._tail_lines`` (seek from EOF, scan backwards). The
+reverse reader should stay flat as the file grows.
+
+Usage (from the repo root):
+    python -m bench.chat_tail
+    BENCH_SIZES_MB=1,10,100,1024 LIMIT=200 python -m bench.chat_tail
+"""
+
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, List
+
+from backend.chat_history import _parse_lines, _tail_lines
+
+SIZES_MB = [float(s) for s in os.getenv("BENCH_SIZES_MB", "1,10,100").split(",") if s.strip()]
+LIMIT = int(os.getenv("LIMIT", "200"))
+REPEAT = int(os.getenv("REPEAT", "5"))
+
+_TEXTS = [
+    "我今天早餐吃了两片全麦面包+牛奶，2小时8.9，我现在就很焦虑。",
+    "空腹血糖6.4，比昨天低一点，晚饭少吃了米饭。",
+    "好的，建议餐后散步20分钟，再测一次餐后两小时血糖。",
+    "最近晚上总起夜，眼睛也有点模糊，该先做什么检查？",
+]
+
+
+def build_history(path: Path, size_mb: float) -> int:
+    target = int(size_mb * 1024 * 1024)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    written = 0
+    count = 0
+    with path.open("w", encoding="utf-8") as f:
+        while written < target:
+            rec = {
+                "ts": (start + timedelta(seconds=count * 30)).isoformat(),
+                "role": "user" if count % 2 == 0 else "assistant",
+                "content": _TEXTS[count % len(_TEXTS)],
+                "visible": True,
+                "source": "user",
+                "meta": {},
+            }
+            line = json.dumps(rec, ensure_ascii=False) + "\n"
+            f.write(line)
+            written += len(line.encode("utf-8"))
+            count += 1
+    return count
+
+
+def old_load(path: Path, limit: int) -> List[dict]:
+    lines = path.read_text(encoding="utf-8").splitlines()
+    out = []
+    for line in lines[-limit:]:
+        try:
+            out.append(json.loads(line))
+        except Exception:
+            continue
+    return out
+
+
+def new_load(path: Path, limit: int) -> List[dict]:
+    return _parse_lines(_tail_lines(path, limit))
+
+
+def timed(func: Callable[[], List[dict]]) -> float:
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    print(f"limit={LIMIT} repeat={REPEAT} (median ms)")
+    print(f"{'size_mb':>8} {'records':>10} {'splitlines':>12} {'tail':>10} {'speedup':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in SIZES_MB:
+            path = Path(tmp) / "u_bench.jsonl"
+            count = build_history(path, size_mb)
+            assert old_load(path, LIMIT) == new_load(path, LIMIT)
+            old_ms = timed(lambda: old_load(path, LIMIT))
+            new_ms = timed(lambda: new_load(path, LIMIT))
+            print(f"{size_mb:>8g} {count:>10} {old_ms:>12.2f} {new_ms:>10.2f} {old_ms / new_ms:>8.1f}x")
+            path.unlink()
+
+
+if __name__ == "__main__":
+    main()
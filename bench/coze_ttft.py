@@ -0,0 +1,122 @@
+"""
+Coze time-to-first-token: a fresh HTTP client per call vs. the shared pool.
+
+Starts a local mock SSE server that streams a few ``message`` frames and a
+``done`` frame, points ``coze_client`` at it and makes CALLS sequential
+``coze_stream`` calls with a new ``httpx.AsyncClient`` per call (what the
+client did before) and through ``get_coze_client()``, once reading each
+stream to the end (like ProactiveLoop) and once breaking on ``Done`` (like
+the /api/chat endpoints). The mock is plain HTTP on localhost, so
+CONNECT_DELAY_MS is added once per new connection to stand in for the
+TCP + TLS handshake to the real endpoint. Reported times are until the
+first ``Message`` event.
+
+Usage (from the repo root):
+    python -m bench.coze_ttft
+    CALLS=50 CONNECT_DELAY_MS=120 python -m bench.coze_ttft
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backend import coze_client
+
+CALLS = int(os.getenv("CALLS", "20"))
+CONNECT_DELAY_MS = float(os.getenv("CONNECT_DELAY_MS", "60"))
+FRAMES = int(os.getenv("FRAMES", "5"))
+
+
+def _sse_body() -> bytes:
+    frames = [
+        f"event: message\ndata: {json.dumps({'answer': f'第{i}段回复'}, ensure_ascii=False)}\n\n"
+        for i in range(FRAMES)
+    ]
+    frames.append("event: done\ndata: {}\n\n")
+    return "".join(frames).encode("utf-8")
+
+
+class MockSSEHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the shared pool can reuse connections
+    body = _sse_body()
+    connections = 0
+
+    def setup(self) -> None:
+        super().setup()
+        type(self).connections += 1
+        if CONNECT_DELAY_MS > 0:
+            time.sleep(CONNECT_DELAY_MS / 1000)
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+async def first_token(fresh: bool, stop_at_done: bool) -> float:
+    start = time.perf_counter()
+    ttft = 0.0
+    if fresh:
+        client = coze_client._build_client()
+        coze_client.get_coze_client = lambda: client
+    try:
+        async for event, _ in coze_client.coze_stream("今天午饭后血糖7.8"):
+            if event == "Message" and not ttft:
+                ttft = time.perf_counter() - start
+            elif event == "Done" and stop_at_done:
+                break
+    finally:
+        if fresh:
+            await client.aclose()
+    return ttft * 1000
+
+
+async def run(fresh: bool, stop_at_done: bool) -> list:
+    samples = []
+    # coze_stream logs every upstream 200; keep the table readable.
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(CALLS):
+            samples.append(await first_token(fresh, stop_at_done))
+        await coze_client.close_coze_client()
+    return samples
+
+
+def main() -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockSSEHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    coze_client.COZE_ENDPOINT = f"http://127.0.0.1:{server.server_port}/stream_run"
+    coze_client.COZE_TOKEN = "bench"
+    coze_client.COZE_PROJECT_ID = "bench"
+    shared = coze_client.get_coze_client
+    print(f"calls={CALLS} connect_delay_ms={CONNECT_DELAY_MS} frames={FRAMES} (ms to first token)")
+    print(f"{'client':>12} {'first':>8} {'median':>8} {'p95':>8} {'connections':>12}")
+    try:
+        for mode in ("fresh", "shared", "shared-break"):
+            coze_client.get_coze_client = shared
+            MockSSEHandler.connections = 0
+            samples = asyncio.run(run(mode == "fresh", mode.endswith("-break")))
+            rest = sorted(samples[1:]) or samples
+            p95 = rest[min(len(rest) - 1, int(len(rest) * 0.95))]
+            print(
+                f"{mode:>12} {samples[0]:>8.1f} {statistics.median(rest):>8.1f} {p95:>8.1f} "
+                f"{MockSSEHandler.connections:>12}"
+            )
+    finally:
+        coze_client.get_coze_client = shared
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Multi-process stress test for file_lock.locked + atomic_write_json.
+
+WRITERS processes each do ITERATIONS locked read-increment-write cycles on
+one JSON file, READERS processes keep parsing it without the lock, and a
+sweeper process runs sweep_locks(max_age=0) in a loop to check that lock
+cleanup never lets two writers in at once. At the end the counter must
+equal WRITERS * ITERATIONS (no lost updates), every write's entry must be
+present, and no reader may have seen a torn file.
+
+Usage (from the repo root):
+    python -m bench.file_lock_stress
+    WRITERS=8 ITERATIONS=500 python -m bench.file_lock_stress
+"""
+
+import json
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+WRITERS = int(os.getenv("WRITERS", "6"))
+READERS = int(os.getenv("READERS", "2"))
+ITERATIONS = int(os.getenv("ITERATIONS", "300"))
+
+
+def _setup(lock_dir: str) -> None:
+    from backend import file_lock
+
+    file_lock.LOCK_DIR = Path(lock_dir)
+
+
+def writer(n: int, path: str, lock_dir: str) -> None:
+    _setup(lock_dir)
+    from backend.file_lock import atomic_write_json, locked
+
+    target = Path(path)
+    for i in range(ITERATIONS):
+        with locked(target):
+            doc = json.loads(target.read_text(encoding="utf-8"))
+            doc["counter"] += 1
+            doc["seen"].append(f"{n}-{i}")
+            atomic_write_json(target, doc)
+
+
+def reader(path: str, stop, torn) -> None:
+    target = Path(path)
+    while not stop.is_set():
+        try:
+            json.loads(target.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            with torn.get_lock():
+                torn.value += 1
+
+
+def sweeper(lock_dir: str, stop, swept) -> None:
+    _setup(lock_dir)
+    from backend.file_lock import sweep_locks
+
+    while not stop.is_set():
+        n = sweep_locks(max_age=0)
+        with swept.get_lock():
+            swept.value += n
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "doc.json"
+        lock_dir = str(Path(tmp) / "locks")
+        path.write_text(json.dumps({"counter": 0, "seen": []}), encoding="utf-8")
+        stop = mp.Event()
+        torn = mp.Value("i", 0)
+        swept = mp.Value("i", 0)
+        background = [mp.Process(target=reader, args=(str(path), stop, torn)) for _ in range(READERS)]
+        background.append(mp.Process(target=sweeper, args=(lock_dir, stop, swept)))
+        for p in background:
+            p.start()
+        start = time.perf_counter()
+        writers = [mp.Process(target=writer, args=(n, str(path), lock_dir)) for n in range(WRITERS)]
+        for p in writers:
+            p.start()
+        for p in writers:
+            p.join()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        for p in background:
+            p.join()
+
+        doc = json.loads(path.read_text(encoding="utf-8"))
+        expected = WRITERS * ITERATIONS
+        missing = expected - len(set(doc["seen"]))
+        print(
+            f"writers={WRITERS} iterations={ITERATIONS} readers={READERS} "
+            f"elapsed={elapsed:.2f}s ({expected / elapsed:.0f} updates/s)"
+        )
+        print(f"counter={doc['counter']} expected={expected} missing_entries={missing} "
+              f"torn_reads={torn.value} lock_files_swept={swept.value}")
+        ok = doc["counter"] == expected and missing == 0 and torn.value == 0
+        print("OK" if ok else "FAILED")
+        return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+json_codec vs. stdlib json on the payloads the hot paths actually encode.
+
+Uses the demo user's chat history lines, module files and an SSE chat
+frame (mostly Chinese text) and times encode + decode with
+``json.dumps(..., ensure_ascii=False)``/``json.loads`` against
+``json_codec.dumps``/``loads``. Run it once as is (orjson when installed)
+and once with JSON_CODEC=stdlib to see the fallback overhead.
+
+Usage (from the repo root):
+    python -m bench.json_codec
+    JSON_CODEC=stdlib python -m bench.json_codec
+"""
+
+import json
+import os
+import timeit
+from pathlib import Path
+from typing import Any, Dict
+
+from backend import json_codec
+
+NUMBER = int(os.getenv("NUMBER", "2000"))
+DATA_DIR = Path(__file__).resolve().parent.parent / "backend" / "data"
+DEMO_USER = os.getenv("USER_ID", "u_demo_young_male")
+
+
+def payloads() -> Dict[str, Any]:
+    history = DATA_DIR / "state" / "chat_history" / f"{DEMO_USER}.jsonl"
+    records = [json.loads(line) for line in history.read_text(encoding="utf-8").splitlines() if line.strip()]
+    modules = {p.stem: json.loads(p.read_text(encoding="utf-8")) for p in (DATA_DIR / "users" / DEMO_USER).glob("*.json")}
+    return {
+        "history_line": records[-1],
+        "history_200": records[-200:],
+        "modules": modules,
+        "sse_frame": {"role": "assistant", "text": records[-1].get("content", ""), "meta": records[-1].get("meta", {})},
+    }
+
+
+def bench(obj: Any) -> Dict[str, float]:
+    std_text = json.dumps(obj, ensure_ascii=False)
+    codec_text = json_codec.dumps(obj)
+    assert json.loads(codec_text) == obj
+    scale = 1e6 / NUMBER
+    return {
+        "bytes": len(std_text.encode("utf-8")),
+        "std_dumps": timeit.timeit(lambda: json.dumps(obj, ensure_ascii=False), number=NUMBER) * scale,
+        "codec_dumps": timeit.timeit(lambda: json_codec.dumps(obj), number=NUMBER) * scale,
+        "std_loads": timeit.timeit(lambda: json.loads(std_text), number=NUMBER) * scale,
+        "codec_loads": timeit.timeit(lambda: json_codec.loads(codec_text), number=NUMBER) * scale,
+    }
+
+
+def main() -> None:
+    print(f"backend={json_codec.BACKEND} number={NUMBER} (us per call)")
+    print(f"{'payload':>13} {'bytes':>8} {'dumps std':>10} {'codec':>8} {'loads std':>10} {'codec':>8}")
+    for name, obj in payloads().items():
+        r = bench(obj)
+        print(
+            f"{name:>13} {r['bytes']:>8} {r['std_dumps']:>10.1f} {r['codec_dumps']:>8.1f} "
+            f"{r['std_loads']:>10.1f} {r['codec_loads']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Event-loop lag with store I/O inline vs. on the I/O executor.
+
+Runs CLIENTS concurrent fake request handlers, each doing a chat history
+append + load per iteration, while ``LoopLagMonitor`` samples how late
+the loop wakes up. "inline" calls the synchronous store like the handlers
+did before; "run_io" goes through ``aappend``/``aload``. DISK_DELAY_MS
+adds a blocking sleep to every store call to model a slow disk.
+
+Usage (from the repo root):
+    python -m bench.loop_lag
+    CLIENTS=50 ITERATIONS=40 DISK_DELAY_MS=5 python -m bench.loop_lag
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from backend import chat_history, file_lock
+from backend.io_executor import LoopLagMonitor, run_io, shutdown_io
+
+CLIENTS = int(os.getenv("CLIENTS", "20"))
+ITERATIONS = int(os.getenv("ITERATIONS", "30"))
+DISK_DELAY_MS = float(os.getenv("DISK_DELAY_MS", "2"))
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "200"))
+
+
+def _slow(func):
+    def wrapper(*args, **kwargs):
+        if DISK_DELAY_MS > 0:
+            time.sleep(DISK_DELAY_MS / 1000)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+async def client(store: chat_history.ChatHistoryStore, user_id: str, inline: bool) -> None:
+    append = _slow(store.append)
+    load = _slow(store.load)
+    for i in range(ITERATIONS):
+        if inline:
+            append(user_id, "user", f"第{i}条消息：今天午饭后血糖7.8，有点担心。")
+            load(user_id, HISTORY_LIMIT)
+        else:
+            await run_io(append, user_id, "user", f"第{i}条消息：今天午饭后血糖7.8，有点担心。")
+            await run_io(load, user_id, HISTORY_LIMIT)
+        await asyncio.sleep(0)
+
+
+async def run(mode: str) -> dict:
+    # Cache off and synchronous commits so every call really touches the disk.
+    store = chat_history.ChatHistoryStore(cache_users=0, group_commit_ms=0)
+    monitor = LoopLagMonitor(interval=0.01)
+    await monitor.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(client(store, f"u_bench_{mode}_{n}", mode == "inline") for n in range(CLIENTS)))
+    elapsed = time.perf_counter() - start
+    await monitor.stop()
+    result = monitor.snapshot()
+    result["wall_s"] = round(elapsed, 2)
+    return result
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        chat_history.CHAT_DIR = Path(tmp)
+        chat_history.ARCHIVE_DIR = Path(tmp) / "archive"
+        file_lock.LOCK_DIR = Path(tmp) / "locks"
+        print(f"clients={CLIENTS} iterations={ITERATIONS} disk_delay_ms={DISK_DELAY_MS}")
+        for mode in ("inline", "run_io"):
+            r = asyncio.run(run(mode))
+            shutdown_io()
+            print(
+                f"{mode:>7}: avg_lag={r['avg_lag_ms']:.2f}ms max_lag={r['max_lag_ms']:.2f}ms "
+                f"samples={r['samples']} wall={r['wall_s']}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
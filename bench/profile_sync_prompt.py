@@ -0,0 +1,126 @@
+"""
+Profile sync prompt size: full history vs. incremental (watermark) runs.
+
+Replays a long synthetic conversation for the demo user into a temporary
+chat history and, every SYNC_EVERY messages, builds the ProfileUpdateAgent
+prompt both ways through ``_load_history``/``_build_prompt``: the full
+payload (last PROFILE_SYNC_MAX_RECORDS records + profile) and the
+incremental one (records after the watermark + module summaries). Prints
+``len(user_prompt)``, UTF-8 bytes and the time to build each. With
+CALL_LLM=true the last LLM_CALLS prompts of each kind are also sent
+through ``chat_once`` to time the round trip (needs an OpenAI-compatible
+endpoint configured in backend/.env).
+
+The demo user's module files are only read, never written.
+
+Usage (from the repo root):
+    python -m bench.profile_sync_prompt
+    MESSAGES=4000 SYNC_EVERY=6 CALL_LLM=true python -m bench.profile_sync_prompt
+"""
+
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import backend.app  # noqa: F401  # imports agents in the app's order (import cycle)
+from backend import chat_history, file_lock
+from backend.agents import ProfileUpdateAgent
+from backend.chat_history import chat_store
+from backend.openai_client import chat_once
+
+USER_ID = os.getenv("USER_ID", "u_demo_young_male")
+MESSAGES = int(os.getenv("MESSAGES", "2000"))
+SYNC_EVERY = int(os.getenv("SYNC_EVERY", "10"))
+CALL_LLM = os.getenv("CALL_LLM", "false").lower() == "true"
+LLM_CALLS = int(os.getenv("LLM_CALLS", "3"))
+
+_USER_TEXTS = [
+    "我今天早餐吃了两片全麦面包+牛奶，2小时8.9，我现在就很焦虑。",
+    "空腹血糖6.4，比昨天低一点，晚饭少吃了米饭。",
+    "最近晚上总起夜，眼睛也有点模糊，该先做什么检查？",
+    "医生说二甲双胍先停一周，看看肠胃会不会好一点。",
+    "周末和朋友去吃火锅了，没忍住喝了半瓶可乐。",
+]
+_ASSISTANT_TEXTS = [
+    "别太担心，餐后两小时8.9略高但不算危险。下次可以把面包换成一片，再加个鸡蛋，饭后散步15分钟再测一次。",
+    "空腹6.4比昨天好，说明晚饭减主食有效果。继续保持，也注意别饿太久，睡前如果饿可以少量坚果。",
+    "起夜和视物模糊都值得重视，建议近期查一下糖化血红蛋白、尿常规和眼底，带上最近一周的血糖记录。",
+]
+
+
+def replay(count: int, start: int) -> None:
+    for i in range(start, start + count):
+        if i % 2 == 0:
+            chat_store.append(USER_ID, "user", _USER_TEXTS[(i // 2) % len(_USER_TEXTS)])
+        else:
+            chat_store.append(USER_ID, "assistant", _ASSISTANT_TEXTS[(i // 2) % len(_ASSISTANT_TEXTS)], source="ResponseGeneratorAgent")
+
+
+async def build(agent: ProfileUpdateAgent, watermark) -> Dict[str, object]:
+    started = time.perf_counter()
+    history = await agent._load_history(USER_ID, watermark)
+    system_prompt, user_prompt = await agent._build_prompt(USER_ID, history, incremental=bool(watermark))
+    return {
+        "ms": (time.perf_counter() - started) * 1000,
+        "chars": len(user_prompt),
+        "bytes": len(user_prompt.encode("utf-8")),
+        "records": len(history),
+        "system_prompt": system_prompt,
+        "user_prompt": user_prompt,
+        "last_ts": history[-1]["ts"] if history else watermark,
+    }
+
+
+async def llm_ms(sample: Dict[str, object]) -> float:
+    started = time.perf_counter()
+    await chat_once(
+        system_prompt=sample["system_prompt"],
+        user_prompt=sample["user_prompt"],
+        max_tokens=800,
+        temperature=0.2,
+    )
+    return (time.perf_counter() - started) * 1000
+
+
+async def run() -> None:
+    agent = ProfileUpdateAgent()
+    samples: Dict[str, List[Dict[str, object]]] = {"full": [], "incremental": []}
+    replay(SYNC_EVERY, 0)
+    watermark = (await build(agent, None))["last_ts"]
+    for start in range(SYNC_EVERY, MESSAGES, SYNC_EVERY):
+        replay(SYNC_EVERY, start)
+        samples["full"].append(await build(agent, None))
+        inc = await build(agent, watermark)
+        samples["incremental"].append(inc)
+        watermark = inc["last_ts"]
+
+    print(f"user={USER_ID} messages={MESSAGES} sync_every={SYNC_EVERY} syncs={len(samples['full'])}")
+    print(f"{'path':>12} {'records':>8} {'len(user_prompt)':>17} {'bytes':>8} {'build ms':>9} {'llm ms':>9}")
+    for name, rows in samples.items():
+        llm = "-"
+        if CALL_LLM:
+            llm = f"{statistics.median([await llm_ms(s) for s in rows[-LLM_CALLS:]]):.0f}"
+        print(
+            f"{name:>12} {statistics.mean(r['records'] for r in rows):>8.0f} "
+            f"{statistics.mean(r['chars'] for r in rows):>17.0f} {statistics.mean(r['bytes'] for r in rows):>8.0f} "
+            f"{statistics.median(r['ms'] for r in rows):>9.2f} {llm:>9}"
+        )
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        chat_history.CHAT_DIR = Path(tmp)
+        chat_history.ARCHIVE_DIR = Path(tmp) / "archive"
+        file_lock.LOCK_DIR = Path(tmp) / "locks"
+        try:
+            asyncio.run(run())
+        finally:
+            chat_store.close()
+
+
+if __name__ == "__main__":
+    main()